@@ -1,3 +1,3 @@
 #!/usr/bin/env bash
 
-gunicorn painting_estimation.api.main:APP --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
\ No newline at end of file
+gunicorn painting_estimation.api.main:APP -c python:painting_estimation.api.gunicorn_conf
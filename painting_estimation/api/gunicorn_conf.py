@@ -0,0 +1,37 @@
+# gunicorn config: `gunicorn painting_estimation.api.main:APP -c python:painting_estimation.api.gunicorn_conf`
+import gc
+import logging
+import os
+
+from painting_estimation.settings import settings
+
+
+# LightGBM uses OpenMP which isn't fork-safe once its thread pool is started in the master, and single row
+# predictions don't benefit from it anyway. Has to be set before LightGBM is imported.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+bind = [os.environ.get("API_BIND", "0.0.0.0:8000")]
+# a bot running on the same host may skip TCP and post to the socket (`BOT_PREDICTION_BACKEND=uds`)
+if settings.api_uds:
+    bind.append(f"unix:{settings.api_uds}")
+workers = settings.api_workers
+worker_class = "uvicorn.workers.UvicornWorker"
+# import the app (NumPy, OpenCV, ONNX Runtime) in the master, so forked workers share it copy-on-write
+preload_app = settings.preload_models
+
+
+def when_ready(_) -> None:
+    if not settings.preload_models:
+        return
+
+    # pylint: disable=import-outside-toplevel
+    from painting_estimation.inference.serving import get_serving
+
+    # LightGBM heads and preprocessors are loaded once here. ONNX sessions aren't fork-safe, every worker creates its
+    # own on startup warm-up (`APP` startup hook), with the weights of split models mapped from the page cache
+    get_serving()
+    # objects loaded so far live forever, keep GC from touching (and so copying) their pages in the workers
+    gc.freeze()
+    LOGGER.info("Preloaded models in gunicorn master")
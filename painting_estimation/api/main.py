@@ -1,33 +1,96 @@
+import asyncio
 import logging
+import typing
 
 import fastapi
+from fastapi.responses import StreamingResponse
 from prometheus_fastapi_instrumentator import Instrumentator
 from prometheus_fastapi_instrumentator import metrics as fastapi_metrics
 
 from painting_estimation import models
-from painting_estimation.api import metrics
-from painting_estimation.inference.serving import predict_painting_price
+from painting_estimation.api import metrics, uploads
+from painting_estimation.inference import serving
+from painting_estimation.inference.executor import ExecutorOverloadedError
+from painting_estimation.model.registry import REGISTRY
 from painting_estimation.settings import settings
 
 
 LOGGER: logging.Logger = logging.getLogger(__name__)
 APP: fastapi.FastAPI = fastapi.FastAPI(debug=settings.debug)
-INSTRUMENTATOR: Instrumentator = Instrumentator(body_handlers=["/predict"])
-INSTRUMENTATOR.add(metrics.ml_metrics(), fastapi_metrics.default())
+# prediction metrics are recorded by the serving, responses aren't buffered and parsed again
+INSTRUMENTATOR: Instrumentator = Instrumentator()
+INSTRUMENTATOR.add(fastapi_metrics.default())
 INSTRUMENTATOR.instrument(APP)
+if serving.CACHE is not None:
+    serving.CACHE.listeners.append(metrics.observe_cache_lookup)
+
+
+async def _warm_up() -> None:
+    try:
+        await serving.warm_up_async()
+    except Exception:  # pylint: disable=broad-except
+        LOGGER.error("Failed to warm up models, they will be loaded on first request", exc_info=True)
 
 
 @APP.on_event("startup")
 async def _():
     INSTRUMENTATOR.expose(APP)
+    if settings.warm_up_models:
+        # doesn't block startup, `/ready` tells when the models are loaded
+        APP.state.warm_up = asyncio.create_task(_warm_up())
+
+
+@APP.on_event("shutdown")
+async def _shutdown():
+    serving.EXECUTOR.shutdown()
+
+
+@APP.get("/ready")
+async def ready(response: fastapi.Response) -> dict:
+    is_ready: bool = serving.MODELS_READY.is_set() or not settings.warm_up_models
+    if not is_ready:
+        response.status_code = 503
+    return {
+        "ready": is_ready,
+        "model": settings.serving_model,
+        "version": REGISTRY.active_version(settings.serving_model),
+    }
 
 
 @APP.post("/predict", response_model=models.Predict)
 async def predict(file: fastapi.UploadFile):
     LOGGER.info(f"Got image `{file.filename}` with type `{file.content_type}`")
     try:
-        price: float = predict_painting_price(byte_io=file.file)  # type: ignore
+        prediction: models.Predict = await serving.predict_painting_async(await file.read())
+    except ExecutorOverloadedError as exc:
+        raise fastapi.HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"}) from exc
     except Exception:
         LOGGER.error("Some error happened during prediction with model!", exc_info=True)
         return models.Predict()
-    return models.Predict(price=price, **metrics.image_features(file.file))  # type: ignore
+    return prediction
+
+
+@APP.post("/predict/batch", response_class=StreamingResponse)
+async def predict_batch(request: fastapi.Request):
+    """Predict many images uploaded as multipart files, a zip or a tar archive.
+
+    Results are streamed back as NDJSON `BatchPredictItem` lines in upload order, as soon as each batch of images is
+    predicted. Images which failed get an `error` instead of failing the whole batch. The upload is received in full
+    (spooled to disk when it's large) before the first prediction, a zip archive has its index at the end.
+    """
+    items: typing.Iterator[tuple[str, bytes]]
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        max_files: int = settings.predict_batch_max_files
+        items = uploads.form_images(await request.form(max_files=max_files, max_fields=max_files))
+    else:
+        try:
+            items = uploads.archive_images(await uploads.spool_body(request.stream()))
+        except uploads.InvalidArchiveError as exc:
+            raise fastapi.HTTPException(status_code=400, detail=str(exc)) from exc
+
+    async def ndjson() -> typing.AsyncIterator[str]:
+        async for prediction in serving.predict_many_async(items):
+            yield prediction.json() + "\n"
+
+    LOGGER.info("Streaming batch predictions")
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
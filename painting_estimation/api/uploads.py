@@ -0,0 +1,67 @@
+import tarfile
+import tempfile
+import typing
+import zipfile
+
+import starlette.datastructures
+
+from painting_estimation.images.utils import IMAGE_SUFFIXES
+
+
+# bodies above this size are spooled to disk
+SPOOL_MAX_SIZE: int = 8 * 2**20
+
+
+class InvalidArchiveError(ValueError):
+    pass
+
+
+async def spool_body(chunks: typing.AsyncIterator[bytes]) -> typing.BinaryIO:
+    """Copy a streamed request body into a temporary file, which is in memory only while it's small."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)  # pylint: disable=consider-using-with
+    async for chunk in chunks:
+        spooled.write(chunk)
+    spooled.seek(0)
+    return typing.cast(typing.BinaryIO, spooled)
+
+
+def _is_image(name: str) -> bool:
+    return name.lower().endswith(IMAGE_SUFFIXES) and not name.rsplit("/", 1)[-1].startswith(".")
+
+
+def _zip_images(archive: zipfile.ZipFile, file: typing.BinaryIO) -> typing.Iterator[tuple[str, bytes]]:
+    with file, archive:
+        for info in archive.infolist():
+            if not info.is_dir() and _is_image(info.filename):
+                yield info.filename, archive.read(info)
+
+
+def _tar_images(archive: tarfile.TarFile, file: typing.BinaryIO) -> typing.Iterator[tuple[str, bytes]]:
+    with file, archive:
+        for member in archive:
+            if member.isfile() and _is_image(member.name) and (member_file := archive.extractfile(member)) is not None:
+                yield member.name, member_file.read()
+
+
+def archive_images(file: typing.BinaryIO) -> typing.Iterator[tuple[str, bytes]]:
+    """Lazily read `(name, bytes)` of the images in a zip or a (compressed) tar archive, other members are skipped.
+
+    Raises `InvalidArchiveError` when the file is neither.
+    """
+    if zipfile.is_zipfile(file):
+        file.seek(0)
+        return _zip_images(zipfile.ZipFile(file), file)
+
+    file.seek(0)
+    try:
+        return _tar_images(tarfile.open(fileobj=file, mode="r:*"), file)  # pylint: disable=consider-using-with
+    except tarfile.TarError as exc:
+        file.close()
+        raise InvalidArchiveError("Expected multipart form with images, a zip or a tar archive") from exc
+
+
+def form_images(form: starlette.datastructures.FormData) -> typing.Iterator[tuple[str, bytes]]:
+    """`(name, bytes)` of every file uploaded with a multipart form, in order."""
+    for field, value in form.multi_items():
+        if isinstance(value, starlette.datastructures.UploadFile):
+            yield value.filename or field, value.file.read()
@@ -0,0 +1,125 @@
+"""Benchmarks of the serving stages on synthetic images, results are saved as JSON to compare commits.
+
+    python -m painting_estimation.benchmarks run --output benchmarks/$(git rev-parse --short HEAD).json
+    python -m painting_estimation.benchmarks run --stages decode,preprocess --image-sizes 512,1024 --batch-sizes 1,16
+    python -m painting_estimation.benchmarks compare benchmarks/base.json benchmarks/new.json --threshold 0.1
+    BATCH_MAX_SIZE=16 python -m painting_estimation.benchmarks load --model effnet --concurrency 1,4,16 --slo-p95-ms 300
+
+`compare` exits with status 1 when any case got slower than the threshold (relative change of the metric).
+Install `memory-profiler` (test dependencies) to also record the peak RSS of every case.
+
+`load` runs a closed-loop load test of the API app in this process (see `painting_estimation.benchmarks.load`), on
+synthetic images or the images of `--images`, and exits with status 1 when any concurrency step misses an SLO.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import pathlib
+import sys
+
+from painting_estimation.benchmarks import load, suite
+
+
+def _ints(value: str) -> list[int]:
+    return [int(item) for item in value.split(",")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", type=pathlib.Path, help="JSON results file, printed only by default")
+    run_parser.add_argument("--stages", default=",".join(suite.STAGES))
+    run_parser.add_argument("--image-sizes", type=_ints, default=[256, 512, 1024, 2048], help="longer image sides")
+    run_parser.add_argument("--batch-sizes", type=_ints, default=[1, 8, 32])
+    run_parser.add_argument("--repeat", type=int, default=30)
+    run_parser.add_argument("--warmup", type=int, default=3)
+
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline", type=pathlib.Path)
+    compare_parser.add_argument("current", type=pathlib.Path)
+    compare_parser.add_argument("--metric", default="p50_ms", help="p50_ms, p95_ms, p99_ms, mean_ms or peak_traced_mb")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    load_parser = commands.add_parser("load", help="load test the API app in this process")
+    load_parser.add_argument("--model", help="serving model from the registry, e.g. dummy, effnet or ensemble")
+    load_parser.add_argument("--images", type=pathlib.Path, help="image directory, synthetic images by default")
+    load_parser.add_argument("--concurrency", type=_ints, default=[1, 2, 4, 8, 16], help="ramp of concurrent clients")
+    load_parser.add_argument("--duration", type=float, default=10.0, help="seconds of every concurrency step")
+    load_parser.add_argument("--cache", action="store_true", help="keep the prediction cache enabled")
+    load_parser.add_argument("--slo-p95-ms", type=float)
+    load_parser.add_argument("--slo-p99-ms", type=float)
+    load_parser.add_argument("--slo-error-rate", type=float, default=0.01)
+    load_parser.add_argument("--slo-min-rps", type=float)
+    load_parser.add_argument("--output", type=pathlib.Path, help="JSON results file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(name)s :: %(levelname)s :: %(message)s")
+
+    if args.command == "load":
+        run_load_test(args)
+        return
+
+    if args.command == "run":
+        cases = suite.build_cases(args.stages.split(","), image_sizes=args.image_sizes, batch_sizes=args.batch_sizes)
+        report = suite.run(cases, repeat=args.repeat, warmup=args.warmup)
+        print("case\tp50_ms\tp95_ms\tp99_ms\titems_per_s\tpeak_traced_mb")
+        for result in report["results"]:
+            print(
+                f"{result['key']}\t{result['p50_ms']:.3f}\t{result['p95_ms']:.3f}\t{result['p99_ms']:.3f}\t"
+                f"{result['items_per_s']:.1f}\t{result['peak_traced_mb']:.1f}"
+            )
+        if args.output:
+            args.output.parent.mkdir(parents=True, exist_ok=True)
+            args.output.write_text(json.dumps(report, indent=2))
+        return
+
+    rows = suite.compare(
+        json.loads(args.baseline.read_text()),
+        json.loads(args.current.read_text()),
+        metric=args.metric,
+        threshold=args.threshold,
+    )
+    print("case\tbaseline\tcurrent\tchange")
+    for row in rows:
+        flag: str = "\tREGRESSION" if row["regression"] else ""
+        print(f"{row['key']}\t{row['baseline']:.3f}\t{row['current']:.3f}\t{row['change']:+.1%}{flag}")
+    if any(row["regression"] for row in rows):
+        sys.exit(1)
+
+
+def run_load_test(args: argparse.Namespace) -> None:
+    slo = load.SLO(
+        p95_ms=args.slo_p95_ms, p99_ms=args.slo_p99_ms, max_error_rate=args.slo_error_rate, min_rps=args.slo_min_rps
+    )
+    results = asyncio.run(
+        load.run_load(
+            load.load_corpus(args.images),
+            args.concurrency,
+            duration=args.duration,
+            model=args.model,
+            use_cache=args.cache,
+        )
+    )
+
+    print("concurrency\trequests\trps\tp50_ms\tp95_ms\tp99_ms\terror_rate\tslo")
+    missed: bool = False
+    for result in results:
+        result["slo_violations"] = load.check_slo(result, slo)
+        missed = missed or bool(result["slo_violations"])
+        print(
+            f"{result['concurrency']}\t{result['requests']}\t{result['rps']:.1f}\t{result['p50_ms']:.1f}\t"
+            f"{result['p95_ms']:.1f}\t{result['p99_ms']:.1f}\t{result['error_rate']:.2%}\t"
+            f"{'; '.join(result['slo_violations']) or 'ok'}"
+        )
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(
+            json.dumps({"environment": suite.environment(), "slo": slo._asdict(), "results": results}, indent=2)
+        )
+    if missed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Closed-loop load test of the API app running in this process, with SLOs to pass.
+
+Each of `concurrency` clients posts an image to `/predict` and sends the next one as soon as it gets the response.
+Concurrency is ramped up step by step, every step reports throughput, latency percentiles and error rate. Requests go
+through `httpx.ASGITransport`, so the numbers are those of a single API worker without network overhead.
+"""
+import asyncio
+import itertools
+import logging
+import pathlib
+import time
+import typing
+
+import httpx
+import numpy as np
+
+from painting_estimation.benchmarks.suite import synthetic_jpeg
+from painting_estimation.images.utils import IMAGE_SUFFIXES
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+class SLO(typing.NamedTuple):
+    p95_ms: float | None = None
+    p99_ms: float | None = None
+    max_error_rate: float = 0.01
+    min_rps: float | None = None
+
+
+def load_corpus(images_dir: pathlib.Path | None = None, size: int = 16) -> list[bytes]:
+    """Images of the directory, or `size` synthetic JPEGs of different sizes."""
+    if images_dir is not None:
+        paths = sorted(path for path in images_dir.rglob("*") if path.suffix.lower() in IMAGE_SUFFIXES)
+        if not paths:
+            raise ValueError(f"No images in {images_dir}")
+        return [path.read_bytes() for path in paths]
+    return [
+        synthetic_jpeg(longer_side, seed) for seed, longer_side in zip(range(size), itertools.cycle((640, 1024, 2048)))
+    ]
+
+
+class _Step:
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+        self.errors: int = 0
+
+
+async def _client_loop(
+    client: httpx.AsyncClient, corpus: list[bytes], images: typing.Iterator[int], deadline: float, step: _Step
+) -> None:
+    while time.monotonic() < deadline:
+        data: bytes = corpus[next(images) % len(corpus)]
+        started_at: float = time.perf_counter()
+        try:
+            response = await client.post("/predict", files={"file": ("image.jpg", data)})
+            # the API answers failed predictions with the default prediction, which has no image features
+            failed: bool = response.status_code != 200 or response.json().get("aspect") is None
+        except httpx.HTTPError:
+            failed = True
+        step.latencies.append(time.perf_counter() - started_at)
+        step.errors += failed
+
+
+async def run_step(client: httpx.AsyncClient, corpus: list[bytes], concurrency: int, duration: float) -> dict:
+    step = _Step()
+    images: typing.Iterator[int] = itertools.count()
+    started_at: float = time.monotonic()
+    await asyncio.gather(
+        *(_client_loop(client, corpus, images, started_at + duration, step) for _ in range(concurrency))
+    )
+    elapsed: float = time.monotonic() - started_at
+    latencies_ms = np.array(step.latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]) if len(latencies_ms) else (np.nan,) * 3
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies_ms),
+        "rps": len(latencies_ms) / elapsed,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "error_rate": step.errors / max(1, len(latencies_ms)),
+    }
+
+
+def check_slo(result: dict, slo: SLO) -> list[str]:
+    """Descriptions of the SLOs the step missed."""
+    violations: list[str] = []
+    if slo.p95_ms is not None and not result["p95_ms"] <= slo.p95_ms:
+        violations.append(f"p95 {result['p95_ms']:.1f}ms > {slo.p95_ms}ms")
+    if slo.p99_ms is not None and not result["p99_ms"] <= slo.p99_ms:
+        violations.append(f"p99 {result['p99_ms']:.1f}ms > {slo.p99_ms}ms")
+    if result["error_rate"] > slo.max_error_rate:
+        violations.append(f"error rate {result['error_rate']:.2%} > {slo.max_error_rate:.2%}")
+    if slo.min_rps is not None and result["rps"] < slo.min_rps:
+        violations.append(f"throughput {result['rps']:.1f} rps < {slo.min_rps} rps")
+    return violations
+
+
+async def run_load(
+    corpus: list[bytes],
+    concurrencies: typing.Sequence[int],
+    duration: float = 10.0,
+    model: str | None = None,
+    use_cache: bool = False,
+    ready_timeout: float = 300.0,
+) -> list[dict]:
+    """Start the API app with the `model` serving, wait until it's ready and run a step per concurrency.
+
+    The prediction cache is disabled unless `use_cache`, a small corpus would be served from it. Other API settings
+    (batching, executor, ONNX threads) come from the environment as usual.
+    """
+    # the app (and the models) are imported only by the load test, not by the benchmarks
+    # pylint: disable=import-outside-toplevel
+    from painting_estimation.api.main import APP
+    from painting_estimation.inference import serving
+    from painting_estimation.settings import settings
+
+    if model is not None:
+        settings.serving_model = model
+    if not use_cache:
+        serving.CACHE = None
+
+    results: list[dict] = []
+    await APP.router.startup()
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=APP), base_url="http://api", timeout=60.0
+        ) as client:
+            deadline: float = time.monotonic() + ready_timeout
+            while (await client.get("/ready")).status_code != 200:
+                warm_up: asyncio.Task | None = getattr(APP.state, "warm_up", None)
+                if warm_up is not None and warm_up.done() and not serving.MODELS_READY.is_set():
+                    raise RuntimeError(f"Failed to load `{settings.serving_model}` models, see the log")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"API isn't ready in {ready_timeout}s")
+                await asyncio.sleep(0.1)
+
+            for concurrency in concurrencies:
+                result = await run_step(client, corpus, concurrency, duration)
+                LOGGER.info(
+                    f"Concurrency {concurrency}: {result['rps']:.1f} rps, p95 {result['p95_ms']:.1f}ms, "
+                    f"errors {result['error_rate']:.2%}"
+                )
+                results.append(result)
+    finally:
+        await APP.router.shutdown()
+    return results
@@ -0,0 +1,265 @@
+"""Offline benchmarks of the serving stages on synthetic images, no API, bot or dataset needed."""
+import datetime
+import functools
+import gc
+import io
+import logging
+import os
+import pathlib
+import platform
+import subprocess
+import time
+import tracemalloc
+import typing
+
+import cv2
+import numpy as np
+
+from painting_estimation.images.utils import ImgSize
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+MODELS_DIR = pathlib.Path(__file__).parents[2] / "models"
+# `encode` is the PNG encoding of `cv2_image_to_bytes`, `encode_jpeg` the JPEG the bot replies with
+STAGES: tuple[str, ...] = ("decode", "preprocess", "onnx", "lightgbm", "insert", "encode", "encode_jpeg")
+# stages run once per image, the others once per batch of images (or of feature rows)
+IMAGE_STAGES: tuple[str, ...] = ("decode", "insert", "encode", "encode_jpeg")
+LGBM_BACKENDS: tuple[str, ...] = ("lightgbm", "numpy")
+
+Call = typing.Callable[[], typing.Any]
+
+
+class BenchmarkCase(typing.NamedTuple):
+    stage: str
+    image_size: int | None
+    batch_size: int
+    # builds the inputs (not measured) and returns the measured call
+    setup: typing.Callable[[], Call]
+
+    @property
+    def key(self) -> str:
+        return f"{self.stage}/size={self.image_size}/batch={self.batch_size}"
+
+
+def synthetic_image(longer_side: int, seed: int = 0) -> np.ndarray:
+    """RGB 4:3 image with smooth color areas and some noise, which compresses roughly like a photo of a painting."""
+    rng = np.random.default_rng(seed)
+    size = ImgSize(width=longer_side, height=longer_side * 3 // 4)
+    coarse: np.ndarray = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    image: np.ndarray = cv2.resize(coarse, dsize=(size.width, size.height), interpolation=cv2.INTER_CUBIC)
+    return np.clip(image + rng.normal(0, 8, image.shape), 0, 255).astype(np.uint8)
+
+
+def synthetic_jpeg(longer_side: int, seed: int = 0) -> bytes:
+    image = synthetic_image(longer_side, seed)
+    return cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+# stage modules are imported by the setups, so only the benchmarked stages are loaded
+
+
+def _decode(image_size: int, batch_size: int) -> Call:
+    from painting_estimation.images.utils import cv2_image_from_byte_io  # pylint: disable=import-outside-toplevel
+
+    data: bytes = synthetic_jpeg(image_size)
+    return lambda: cv2_image_from_byte_io(io.BytesIO(data))
+
+
+def _preprocess(image_size: int, batch_size: int) -> Call:
+    from painting_estimation.model.effnet_model import PREPROCESSOR  # pylint: disable=import-outside-toplevel
+
+    images: list[np.ndarray] = [synthetic_image(image_size, seed) for seed in range(batch_size)]
+    return functools.partial(PREPROCESSOR.batch, images)
+
+
+def _onnx(models_dir: pathlib.Path, batch_size: int) -> Call:
+    # pylint: disable=import-outside-toplevel
+    from painting_estimation.inference.inference import ONNXModel
+    from painting_estimation.model.effnet_model import PREPROCESSOR
+
+    model = ONNXModel(models_dir / "2" / "efn.onnx")
+    model.load()
+    nn_input: np.ndarray = PREPROCESSOR.batch([synthetic_image(512, seed) for seed in range(batch_size)])
+    return functools.partial(model, nn_input)
+
+
+def _lightgbm(models_dir: pathlib.Path, backend: str, batch_size: int) -> Call:
+    from painting_estimation.inference.inference import LGBMPriceRegressor  # pylint: disable=import-outside-toplevel
+
+    regressor = LGBMPriceRegressor(models_dir / "2" / "lgb_new.pkl", backend=backend)
+    features: np.ndarray = np.random.default_rng(0).random((batch_size, 1280), dtype=np.float32)
+    return functools.partial(regressor.predict_batch, features)
+
+
+def _insert(image_size: int, batch_size: int) -> Call:
+    from painting_estimation.images.insertion import insert_image  # pylint: disable=import-outside-toplevel
+
+    label, background = synthetic_image(256, seed=1), synthetic_image(image_size)
+    return functools.partial(insert_image, label, background, insertion_shape="circle")
+
+
+def _encode(image_size: int, batch_size: int) -> Call:
+    from painting_estimation.images.utils import cv2_image_to_bytes  # pylint: disable=import-outside-toplevel
+
+    return functools.partial(cv2_image_to_bytes, synthetic_image(image_size))
+
+
+def _encode_reply(image_size: int, batch_size: int) -> Call:
+    from painting_estimation.images.encoding import ImageEncoder  # pylint: disable=import-outside-toplevel
+
+    return functools.partial(ImageEncoder("jpeg").encode, synthetic_image(image_size))
+
+
+def build_cases(
+    stages: typing.Sequence[str] = STAGES,
+    image_sizes: typing.Sequence[int] = (256, 512, 1024, 2048),
+    batch_sizes: typing.Sequence[int] = (1, 8, 32),
+    models_dir: pathlib.Path = MODELS_DIR,
+) -> list[BenchmarkCase]:
+    """Image stages run per image size, `preprocess` per image and batch size, model stages per batch size."""
+    image_setups: dict[str, typing.Callable[[int, int], Call]] = {
+        "decode": _decode,
+        "insert": _insert,
+        "encode": _encode,
+        "encode_jpeg": _encode_reply,
+        "preprocess": _preprocess,
+    }
+    cases: list[BenchmarkCase] = []
+    for stage in stages:
+        if stage in image_setups:
+            for image_size in image_sizes:
+                for batch_size in (1,) if stage in IMAGE_STAGES else batch_sizes:
+                    setup = functools.partial(image_setups[stage], image_size, batch_size)
+                    cases.append(BenchmarkCase(stage, image_size, batch_size, setup))
+        elif stage == "onnx":
+            if not (models_dir / "2" / "efn.onnx").exists():
+                LOGGER.warning(f"Skipping `onnx` stage, there's no model in {models_dir / '2'}")
+                continue
+            cases.extend(
+                BenchmarkCase(stage, None, batch_size, functools.partial(_onnx, models_dir, batch_size))
+                for batch_size in batch_sizes
+            )
+        elif stage == "lightgbm":
+            cases.extend(
+                BenchmarkCase(
+                    f"lightgbm/{backend}",
+                    None,
+                    batch_size,
+                    functools.partial(_lightgbm, models_dir, backend, batch_size),
+                )
+                for backend in LGBM_BACKENDS
+                for batch_size in batch_sizes
+            )
+        else:
+            raise ValueError(f"Unknown stage `{stage}`, stages: {STAGES}")
+    return cases
+
+
+def peak_rss_mb(call: Call) -> float | None:
+    """Peak resident memory of the process while running the call, None without `memory-profiler`."""
+    try:
+        from memory_profiler import memory_usage  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return float(memory_usage((call, (), {}), interval=0.001, max_usage=True))
+
+
+def measure(case: BenchmarkCase, repeat: int = 30, warmup: int = 3) -> dict:
+    """Latency percentiles of the case call and its peak memory, measured in separate runs so tracing doesn't skew
+    the timings. Traced memory covers Python and NumPy allocations, native ones (e.g. ONNX Runtime arenas) show up in
+    the RSS only."""
+    call: Call = case.setup()
+    for _ in range(warmup):
+        call()
+
+    gc.collect()
+    gc.disable()
+    timings: list[float] = []
+    try:
+        for _ in range(repeat):
+            started_at: float = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started_at)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    try:
+        call()
+        _, peak_traced = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings_ms = np.array(timings) * 1000
+    p50, p95, p99 = np.percentile(timings_ms, [50, 95, 99])
+    return {
+        "key": case.key,
+        "stage": case.stage,
+        "image_size": case.image_size,
+        "batch_size": case.batch_size,
+        "repeat": repeat,
+        "mean_ms": float(timings_ms.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "items_per_s": float(case.batch_size * 1000 / timings_ms.mean()),
+        "peak_traced_mb": peak_traced / 2**20,
+        "peak_rss_mb": peak_rss_mb(call),
+    }
+
+
+def environment() -> dict:
+    """What the results depend on besides the code: commit, library versions, CPUs and thread settings."""
+    # pylint: disable=import-outside-toplevel
+    import onnxruntime
+
+    from painting_estimation.settings import settings
+
+    try:
+        commit: str | None = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "onnxruntime": onnxruntime.__version__,
+        "onnx_intra_op_threads": settings.onnx_intra_op_threads,
+        "api_workers": settings.api_workers,
+    }
+
+
+def run(cases: typing.Sequence[BenchmarkCase], repeat: int = 30, warmup: int = 3) -> dict:
+    results: list[dict] = []
+    for case in cases:
+        result = measure(case, repeat=repeat, warmup=warmup)
+        LOGGER.info(f"{case.key}: p50 {result['p50_ms']:.3f}ms, p99 {result['p99_ms']:.3f}ms")
+        results.append(result)
+    return {"environment": environment(), "results": results}
+
+
+def compare(baseline: dict, current: dict, metric: str = "p50_ms", threshold: float = 0.1) -> list[dict]:
+    """Relative change of the metric of every case present in both runs, `regression` when it grew over threshold."""
+    baseline_results: dict[str, dict] = {result["key"]: result for result in baseline["results"]}
+    rows: list[dict] = []
+    for result in current["results"]:
+        if (base := baseline_results.get(result["key"])) is None or not base[metric]:
+            continue
+        change: float = result[metric] / base[metric] - 1
+        rows.append(
+            {
+                "key": result["key"],
+                "baseline": base[metric],
+                "current": result[metric],
+                "change": change,
+                "regression": change > threshold,
+            }
+        )
+    return rows
@@ -0,0 +1,105 @@
+import io
+import logging
+import pathlib
+import random
+import threading
+import time
+import typing
+
+from painting_estimation.bot.style_transfer import base64_encode
+
+
+if typing.TYPE_CHECKING:
+    import numpy as np
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+# widths of the styled images and Telegram photos, circle masks of the labels are precomputed for them
+COMMON_IMAGE_WIDTHS: tuple[int, ...] = (320, 512, 640, 800, 1024, 1280)
+
+
+class ArtistAssets(typing.NamedTuple):
+    name: str
+    # RGB label put into a circle in the corner of the styled image
+    label: "np.ndarray"
+    style: bytes
+    # `style` as a base64 data URL, ready for the style transfer API
+    style_payload: str
+
+
+class AssetStore:
+    """Artist labels and style paintings loaded once, with the labels decoded, their circle masks for common image
+    widths computed and the payloads encoded up front.
+
+    Artist `<key>` has the label `<artist_dir>/<key>.jpg` and the style painting `<painting_dir>/<key>_pic.jpg`.
+    Files are checked for changes at most every `refresh_interval` seconds and all the assets are reloaded when any
+    of them changes, so pictures can be replaced without restarting the bot.
+    """
+
+    def __init__(
+        self,
+        artists: typing.Mapping[str, str],
+        artist_dir: pathlib.Path,
+        painting_dir: pathlib.Path,
+        refresh_interval: float = 60.0,
+    ):
+        self.artists = dict(artists)
+        self.artist_dir = artist_dir
+        self.painting_dir = painting_dir
+        self.refresh_interval = refresh_interval
+        self._assets: dict[str, ArtistAssets] = {}
+        self._mtimes: dict[pathlib.Path, float] = {}
+        self._refreshed_at: float = 0.0
+        self._lock = threading.Lock()
+
+    def _paths(self, key: str) -> tuple[pathlib.Path, pathlib.Path]:
+        return self.artist_dir / f"{key}.jpg", self.painting_dir / f"{key}_pic.jpg"
+
+    def _current_mtimes(self) -> dict[pathlib.Path, float]:
+        return {path: path.stat().st_mtime for key in self.artists for path in self._paths(key)}
+
+    def load(self) -> None:
+        # NumPy and OpenCV are imported by the first load, not by the bot import
+        # pylint: disable=import-outside-toplevel
+        from painting_estimation.images.insertion import insertion_size, shape_mask
+        from painting_estimation.images.utils import ImgSize, cv2_image_from_byte_io, image_size
+
+        with self._lock:
+            mtimes = self._current_mtimes()
+            assets: dict[str, ArtistAssets] = {}
+            for key, name in self.artists.items():
+                label_path, style_path = self._paths(key)
+                label = cv2_image_from_byte_io(io.BytesIO(label_path.read_bytes()))
+                style: bytes = style_path.read_bytes()
+                assets[key] = ArtistAssets(
+                    name=name,
+                    label=label,
+                    style=style,
+                    style_payload=base64_encode(style),
+                )
+                for width in COMMON_IMAGE_WIDTHS:
+                    shape_mask("circle", insertion_size(image_size(label), ImgSize(width=width, height=width)))
+            # swapped at once, readers never see a half loaded store
+            self._assets, self._mtimes = assets, mtimes
+            self._refreshed_at = time.monotonic()
+        LOGGER.info(f"Loaded assets of {len(assets)} artists")
+
+    def _maybe_reload(self) -> None:
+        if self._assets and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        self._refreshed_at = time.monotonic()
+        try:
+            changed: bool = not self._assets or self._current_mtimes() != self._mtimes
+        except FileNotFoundError:
+            LOGGER.error("Artist assets are missing, keeping the loaded ones", exc_info=True)
+            return
+        if changed:
+            self.load()
+
+    def get(self, key: str) -> ArtistAssets:
+        self._maybe_reload()
+        return self._assets[key]
+
+    def random(self) -> ArtistAssets:
+        return self.get(random.choice(list(self.artists)))
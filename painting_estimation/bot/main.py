@@ -1,27 +1,41 @@
 import asyncio
-import base64
+import functools
 import io
 import logging
 import pathlib
 import random
 import textwrap
+import typing
 
 import httpx
-import numpy as np
+import prometheus_client
 import telegram
 from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, filters
 
 from painting_estimation import models
-from painting_estimation.images.insertion import insert_image
-from painting_estimation.images.utils import cv2_image_from_byte_io, cv2_image_to_bytes
+from painting_estimation.bot.assets import ArtistAssets, AssetStore
+from painting_estimation.bot.metrics import BOT_STAGE_LATENCY
+from painting_estimation.bot.prediction import PredictionBackend, build_backend, http_client
+from painting_estimation.bot.style_transfer import StyleTransferClient
 from painting_estimation.settings import settings
 
 
+if typing.TYPE_CHECKING:
+    import numpy as np
+
+    from painting_estimation.images.encoding import ImageEncoder
+
+
 LOGGER: logging.Logger = logging.getLogger(__name__)
-HTTP_CLIENT: httpx.AsyncClient = httpx.AsyncClient()
-# check API here: "https://huggingface.co/spaces/Hexii/Neural-Style-Transfer"
-STYLE_TRANSFER_API: str = "https://hexii-neural-style-transfer.hf.space/api/predict"
-STYLE_TRANSFER_TIMEOUT: int = 180  # 3 minutes
+HTTP_CLIENT: httpx.AsyncClient = http_client()
+PREDICTION: PredictionBackend = build_backend(client=HTTP_CLIENT)
+STYLE_TRANSFER: StyleTransferClient = StyleTransferClient(
+    HTTP_CLIENT,
+    settings.style_transfer_api,
+    timeout=settings.style_transfer_timeout,
+    max_concurrency=settings.style_transfer_max_concurrency,
+    retries=settings.style_transfer_retries,
+)
 
 
 DATA_DIR = pathlib.Path(__file__).parents[2] / "data" / "pics"
@@ -39,13 +53,7 @@ ARTISTS: dict[str, str] = {
 }
 
 
-def random_artist_painting() -> tuple[str, bytes, bytes]:
-    artists = list(ARTISTS.keys())
-    random_idx = random.randint(0, len(artists) - 1)
-    artist = artists[random_idx]
-    artist_pic = (ARTIST_DIR / f"{artist}.jpg").read_bytes()
-    painting_pic = (PAINTING_DIR / f"{artist}_pic.jpg").read_bytes()
-    return ARTISTS[artist], artist_pic, painting_pic
+ASSETS: AssetStore = AssetStore(ARTISTS, artist_dir=ARTIST_DIR, painting_dir=PAINTING_DIR)
 
 
 async def download_to_memory(file: telegram.File) -> bytes:
@@ -55,98 +63,61 @@ async def download_to_memory(file: telegram.File) -> bytes:
         return io_target.read()
 
 
-async def fetch_price(image: bytes) -> models.Predict:
-    LOGGER.info(f"Making prediction request to {settings.ml_api}")
-    try:
-        response: httpx.Response = await HTTP_CLIENT.post(settings.ml_api, files={"file": image})
-    except httpx.ReadTimeout:
-        LOGGER.error("Failed to fetch predictions from ML API, timeout")
-        return models.Predict()
-    if response.status_code != 200:
-        LOGGER.error(f"Failed to fetch predictions from ML API, status_code: {response.status_code}")
-    try:
-        parsed_predict = models.Predict.parse_raw(response.content)
-    except ValueError:
-        LOGGER.error("Failed to parse API response, returning default value")
-        return models.Predict()
-    return parsed_predict
+@functools.cache
+def reply_encoder() -> "ImageEncoder":
+    """Encoder of the images the bot replies with, created on first use as it imports OpenCV."""
+    from painting_estimation.images.encoding import ImageEncoder  # pylint: disable=import-outside-toplevel
 
+    return ImageEncoder(
+        settings.bot_image_format,
+        quality=settings.bot_image_quality,
+        max_dimension=settings.bot_image_max_dimension,
+        backend=settings.image_encoder_backend,
+    )
 
-def base64_encode(data: bytes) -> str:
-    return f"data:image/png;base64,{base64.b64encode(data).decode()}"
 
+async def fetch_price(image: "bytes | np.ndarray") -> models.Predict:
+    """Price of an uploaded image or of a decoded RGB array with the configured prediction backend."""
+    return await PREDICTION(image)
 
-def base64_decode(data: str) -> bytes:
-    return base64.b64decode(data)
 
+def insert_label(label: "bytes | np.ndarray", raw_image: bytes) -> "np.ndarray | None":
+    """Put the label (raw or decoded) into a circle in the corner of the image, returns the RGB array."""
+    # NumPy and OpenCV aren't needed to answer /start, so they are imported on first use
+    # pylint: disable=import-outside-toplevel
+    from painting_estimation.images.insertion import insert_image
+    from painting_estimation.images.utils import cv2_image_from_byte_io
 
-async def style_transfer(content_file: telegram.File, style_file: telegram.File) -> bytes | None:
-    raw_content: bytes
-    raw_style: bytes
-    raw_content, raw_style = await asyncio.gather(download_to_memory(content_file), download_to_memory(style_file))
     try:
-        response: dict = httpx.post(
-            STYLE_TRANSFER_API,
-            json={
-                "data": [
-                    base64_encode(raw_content),
-                    base64_encode(raw_style),
-                    np.random.uniform(low=0.75, high=1.25),
-                    np.random.uniform(low=1.0, high=2.0),
-                ]
-            },
-            timeout=STYLE_TRANSFER_TIMEOUT,
-        ).json()
-    except httpx.ReadTimeout:
-        LOGGER.error("Failed to fetch style transfer result")
+        np_label = cv2_image_from_byte_io(io.BytesIO(label)) if isinstance(label, bytes) else label
+        np_image = cv2_image_from_byte_io(io.BytesIO(raw_image))
+        return insert_image(np_label, np_image, insertion_shape="circle")
+    except Exception as exc:
+        LOGGER.error(f"Unexpected Exception caught during image copyrighting: {exc}")
         return None
-    return base64_decode(response["data"][0][22:])
 
 
-async def artist_style_transfer(content_file: telegram.File, raw_style: bytes, raw_artist: bytes) -> bytes | None:
-    raw_content: bytes
-    raw_content = await download_to_memory(content_file)
-    try:
-        response: dict = httpx.post(
-            STYLE_TRANSFER_API,
-            json={
-                "data": [
-                    base64_encode(raw_content),
-                    base64_encode(raw_style),
-                    np.random.uniform(low=0.5, high=1.5),
-                    np.random.uniform(low=1.0, high=3.0),
-                ]
-            },
-            timeout=STYLE_TRANSFER_TIMEOUT,
-        ).json()
-    except httpx.ReadTimeout:
-        LOGGER.error("Failed to fetch style transfer result")
-        return None
-    styled_img: bytes = base64_decode(response["data"][0][22:])
-    try:
-        np_image = cv2_image_from_byte_io(io.BytesIO(styled_img))
-        np_label: np.ndarray = cv2_image_from_byte_io(io.BytesIO(raw_artist))
-        np_image = insert_image(np_label, np_image, insertion_shape="circle")
-        byte_image: bytes = cv2_image_to_bytes(np_image)
-    except Exception as exc:
-        LOGGER.error(f"Unexpected Exception caught during image copyrighting: {exc}")
+async def style_transfer(raw_content: bytes, raw_style: bytes) -> bytes | None:
+    return await STYLE_TRANSFER(raw_content, raw_style, random.uniform(0.75, 1.25), random.uniform(1.0, 2.0))
+
+
+async def artist_style_transfer(raw_content: bytes, artist: ArtistAssets) -> "np.ndarray | None":
+    styled_img: bytes | None = await STYLE_TRANSFER(
+        raw_content, artist.style_payload, random.uniform(0.5, 1.5), random.uniform(1.0, 3.0)
+    )
+    if styled_img is None:
         return None
-    return byte_image
+    # decoding and PNG encoding shouldn't block the other handlers
+    return await asyncio.to_thread(insert_label, artist.label, styled_img)
 
 
 async def label_adding(label_file: telegram.File, image_file: telegram.File) -> bytes | None:
     raw_label: bytes
     raw_image: bytes
     raw_label, raw_image = await asyncio.gather(download_to_memory(label_file), download_to_memory(image_file))
-    try:
-        np_label: np.ndarray = cv2_image_from_byte_io(io.BytesIO(raw_label))
-        np_image: np.ndarray = cv2_image_from_byte_io(io.BytesIO(raw_image))
-        np_image = insert_image(np_label, np_image, insertion_shape="circle")
-        byte_image: bytes = cv2_image_to_bytes(np_image)
-    except Exception as exc:
-        LOGGER.error(f"Unexpected Exception caught during image copyrighting: {exc}")
+    if (labelled_image := await asyncio.to_thread(insert_label, raw_label, raw_image)) is None:
         return None
-    return byte_image
+    return await asyncio.to_thread(reply_encoder(), labelled_image)
 
 
 async def start(update: telegram.Update, _: ContextTypes.DEFAULT_TYPE) -> None:
@@ -162,57 +133,110 @@ async def start(update: telegram.Update, _: ContextTypes.DEFAULT_TYPE) -> None:
         )
 
 
+async def price_stage(message: telegram.Message, raw_image: bytes) -> models.Predict:
+    with BOT_STAGE_LATENCY.labels("price").time():
+        prediction: models.Predict = await fetch_price(raw_image)
+        caption = textwrap.dedent(
+            """
+            Отличный piece of art! На черном рынке за него дадут {price:0.0f}$ ;)
+        """
+        ).format(price=prediction.price)
+        await message.reply_text(caption)
+    return prediction
+
+
+async def artist_stage(message: telegram.Message, raw_image: bytes) -> models.Predict:
+    with BOT_STAGE_LATENCY.labels("artist_style_transfer").time():
+        # assets are reloaded in place when their files change
+        artist: ArtistAssets = await asyncio.to_thread(ASSETS.random)
+        if (artist_styled_image := await artist_style_transfer(raw_image, artist)) is None:
+            return models.Predict()
+
+        # the array is priced as is, not decoded back from the reply
+        encoded_image, artist_styled_prediction = await asyncio.gather(
+            asyncio.to_thread(reply_encoder(), artist_styled_image), fetch_price(artist_styled_image)
+        )
+        await message.reply_photo(
+            encoded_image,
+            caption="Мало кто знает, но {artist} тоже вдохновлялся этим шедевром, ценник просто смешной - {price:0.0f}$".format(
+                price=artist_styled_prediction.price,
+                artist=artist.name,
+            ),
+        )
+    return artist_styled_prediction
+
+
+async def _price_or_default(stage: asyncio.Task) -> float:
+    try:
+        return (await stage).price
+    except Exception:  # pylint: disable=broad-except
+        return models.Predict().price
+
+
+async def profile_stage(
+    message: telegram.Message, user: telegram.User, raw_image: bytes, price_stages: list[asyncio.Task]
+) -> None:
+    with BOT_STAGE_LATENCY.labels("profile_style_transfer").time():
+        if not (user_photo := await user.get_profile_photos()):
+            return
+        latest_user_photo: telegram.PhotoSize = user_photo.photos[0][-1]
+        raw_user_photo: bytes = await download_to_memory(await latest_user_photo.get_file())
+        if not (styled_photo := await style_transfer(raw_user_photo, raw_image)):
+            await message.reply_text(
+                "Хотели сделать кое-что интересное с твоей фотографией, но магия сломалась :( Приходи попозже!"
+            )
+            return
+
+        # the only stage depending on the others, its caption tops their prices
+        prices: list[float] = [await _price_or_default(stage) for stage in price_stages]
+        styled_photo_price = max(prices) + random.randint(2000, 5000)
+        await message.reply_photo(
+            styled_photo,
+            caption="Ты униикальна(-ен) и неповторим(-а)! Но даже эта картина имеет цену {price:0.0f}$!".format(
+                price=styled_photo_price
+            ),
+        )
+
+
 async def estimate_price(update: telegram.Update, _: ContextTypes.DEFAULT_TYPE) -> None:
+    """Price, artist style transfer and profile photo style transfer run concurrently on the photo downloaded once,
+    each of them replies as soon as it's done."""
     user: telegram.User | None = update.effective_user
     message: telegram.Message | None = update.message
     if message is None:
         LOGGER.error("Something strange happened, received empty message")
         return None
 
-    latest_photo: telegram.PhotoSize = message.photo[-1]
-    image: telegram.File = await latest_photo.get_file()
-    prediction: models.Predict = await fetch_price(image=await download_to_memory(image))
+    LOGGER.info(f"Received photo to score from {user.full_name if user else 'somebody'}")
+    with BOT_STAGE_LATENCY.labels("total").time():
+        with BOT_STAGE_LATENCY.labels("download").time():
+            latest_photo: telegram.PhotoSize = message.photo[-1]
+            raw_image: bytes = await download_to_memory(await latest_photo.get_file())
 
-    caption = textwrap.dedent(
-        """
-        Отличный piece of art! На черном рынке за него дадут {price:0.0f}$ ;)
-    """
-    ).format(price=prediction.price)
+        stages: list[asyncio.Task] = [
+            asyncio.create_task(price_stage(message, raw_image)),
+            asyncio.create_task(artist_stage(message, raw_image)),
+        ]
+        if user:
+            stages.append(asyncio.create_task(profile_stage(message, user, raw_image, price_stages=stages[:2])))
 
-    LOGGER.info(f"Received photo to score from {user.full_name if user else 'somebody'}")
-    await message.reply_text(caption)
+        for stage, result in zip(stages, await asyncio.gather(*stages, return_exceptions=True)):
+            if isinstance(result, Exception):
+                LOGGER.error(f"Stage `{stage.get_coro().__name__}` failed", exc_info=result)
 
-    artist_name, artist_pic, style_pic = random_artist_painting()
-    if artist_styled_image := await artist_style_transfer(image, style_pic, artist_pic):
-        artist_styled_prediction: models.Predict = await fetch_price(artist_styled_image)
-        await message.reply_photo(
-            artist_styled_image,
-            caption="Мало кто знает, но {artist} тоже вдохновлялся этим шедевром, ценник просто смешной - {price:0.0f}$".format(
-                price=artist_styled_prediction.price,
-                artist=artist_name,
-            ),
-        )
-    else:
-        artist_styled_prediction = models.Predict()
-
-    if user:
-        if user_photo := await user.get_profile_photos():
-            latest_user_photo: telegram.PhotoSize = user_photo.photos[0][-1]
-            if styled_photo := await style_transfer(await latest_user_photo.get_file(), image):
-                styled_photo_price = max(prediction.price, artist_styled_prediction.price) + random.randint(2000, 5000)
-                await message.reply_photo(
-                    styled_photo,
-                    caption="Ты униикальна(-ен) и неповторим(-а)! Но даже эта картина имеет цену {price:0.0f}$!".format(
-                        price=styled_photo_price
-                    ),
-                )
-            else:
-                await message.reply_text(
-                    "Хотели сделать кое-что интересное с твоей фотографией, но магия сломалась :( Приходи попозже!"
-                )
-
-
-APP = ApplicationBuilder().token(settings.telegram_token).build()
+
+async def load_assets(_) -> None:
+    await asyncio.to_thread(ASSETS.load)
+
+
+async def close_http_client(_) -> None:
+    await PREDICTION.aclose()
+    await HTTP_CLIENT.aclose()
+
+
+APP = (
+    ApplicationBuilder().token(settings.telegram_token).post_init(load_assets).post_shutdown(close_http_client).build()
+)
 APP.add_handler(CommandHandler("start", start))
 APP.add_handler(MessageHandler(filters.PHOTO, estimate_price))
 
@@ -220,5 +244,7 @@ if __name__ == "__main__":
     logging.basicConfig(
         level=logging.DEBUG if settings.debug else logging.INFO, format="%(name)s :: %(levelname)s :: %(message)s'"
     )
+    if settings.bot_metrics_port is not None:
+        prometheus_client.start_http_server(settings.bot_metrics_port)
     LOGGER.info("Launching our awesome bot!")
     APP.run_polling()
@@ -0,0 +1,9 @@
+from prometheus_client import Histogram
+
+
+BOT_STAGE_LATENCY = Histogram(
+    "bot_stage_latency_seconds",
+    "Latency of the photo handling stages of the bot, from start to the reply sent.",
+    ["stage"],
+    buckets=[0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320],
+)
@@ -0,0 +1,119 @@
+import asyncio
+import functools
+import logging
+import typing
+
+import httpx
+
+from painting_estimation import models
+from painting_estimation.settings import settings
+
+
+if typing.TYPE_CHECKING:
+    import numpy as np
+
+    from painting_estimation.images.encoding import ImageEncoder
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+PredictionBackendName = typing.Literal["http", "uds", "inprocess"]
+
+
+class PredictionBackend(typing.Protocol):
+    async def __call__(self, image: "bytes | np.ndarray") -> models.Predict:
+        ...
+
+    async def aclose(self) -> None:
+        ...
+
+
+@functools.cache
+def pricing_encoder() -> "ImageEncoder":
+    """Encoder of the arrays sent to the ML API, the model needs only a few hundred pixels of them."""
+    from painting_estimation.images.encoding import ImageEncoder  # pylint: disable=import-outside-toplevel
+
+    return ImageEncoder(
+        "jpeg", quality=95, max_dimension=settings.bot_pricing_max_dimension, backend=settings.image_encoder_backend
+    )
+
+
+def http_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    """Client with pooled keep-alive connections and the ML API timeout."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+        ),
+        timeout=settings.ml_api_timeout,
+        transport=transport,
+    )
+
+
+class HttpPrediction:
+    """Posts images to the ML API, arrays are encoded to a small JPEG first."""
+
+    def __init__(self, client: httpx.AsyncClient, url: str):
+        self.client = client
+        self.url = url
+
+    async def __call__(self, image: "bytes | np.ndarray") -> models.Predict:
+        if not isinstance(image, bytes):
+            image = await asyncio.to_thread(pricing_encoder(), image)
+        LOGGER.info(f"Making prediction request to {self.url}")
+        try:
+            response: httpx.Response = await self.client.post(self.url, files={"file": image})
+        except httpx.HTTPError as exc:
+            LOGGER.error(f"Failed to fetch predictions from ML API: {exc!r}")
+            return models.Predict()
+        if response.status_code != 200:
+            LOGGER.error(f"Failed to fetch predictions from ML API, status_code: {response.status_code}")
+        try:
+            parsed_predict = models.Predict.parse_raw(response.content)
+        except ValueError:
+            LOGGER.error("Failed to parse API response, returning default value")
+            return models.Predict()
+        return parsed_predict
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class InProcessPrediction:
+    """Runs the API serving model right in the bot process, arrays skip encoding and decoding altogether.
+
+    The serving stack (and the model) is imported on the first call, predictions run in its inference executor.
+    """
+
+    async def __call__(self, image: "bytes | np.ndarray") -> models.Predict:
+        # pylint: disable=import-outside-toplevel
+        from painting_estimation.images.utils import DecodedImage
+        from painting_estimation.inference import serving
+
+        try:
+            if isinstance(image, bytes):
+                return await serving.predict_painting_async(image)
+            return await serving.EXECUTOR.run(serving.predict_decoded, DecodedImage(image))
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.error("Failed to predict price in process", exc_info=True)
+            return models.Predict()
+
+    async def aclose(self) -> None:
+        pass
+
+
+def build_backend(
+    name: PredictionBackendName | None = None, client: httpx.AsyncClient | None = None
+) -> PredictionBackend:
+    """Prediction backend selected with `settings.bot_prediction_backend`, `http` posts with `client` when given."""
+    name = name or settings.bot_prediction_backend
+    if name == "http":
+        return HttpPrediction(client or http_client(), settings.ml_api)
+    if name == "uds":
+        if not settings.api_uds:
+            raise ValueError("`uds` prediction backend needs `API_UDS` socket path")
+        # the host is ignored, requests go through the socket
+        return HttpPrediction(http_client(httpx.AsyncHTTPTransport(uds=settings.api_uds)), "http://api/predict")
+    if name == "inprocess":
+        return InProcessPrediction()
+    raise ValueError(f"Unknown prediction backend `{name}`")
@@ -0,0 +1,24 @@
+"""Local stand-in for the style transfer API, to run the bot under concurrent load without Hugging Face.
+
+    uvicorn painting_estimation.bot.stub_server:APP --port 7860
+    STYLE_TRANSFER_API=http://localhost:7860/api/predict python -m painting_estimation.bot.main
+
+Every call sleeps for `STYLE_TRANSFER_STUB_DELAY` seconds and returns the content image as is.
+"""
+import asyncio
+import logging
+
+import fastapi
+
+from painting_estimation.settings import settings
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+APP: fastapi.FastAPI = fastapi.FastAPI(debug=settings.debug)
+
+
+@APP.post("/api/predict")
+async def predict(payload: dict) -> dict:
+    content, *_ = payload["data"]
+    await asyncio.sleep(settings.style_transfer_stub_delay)
+    return {"data": [content], "duration": settings.style_transfer_stub_delay}
@@ -0,0 +1,78 @@
+import asyncio
+import base64
+import logging
+import random
+
+import httpx
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+
+
+def base64_encode(data: bytes) -> str:
+    return f"data:image/png;base64,{base64.b64encode(data).decode()}"
+
+
+def base64_decode(data: str) -> bytes:
+    return base64.b64decode(data)
+
+
+class StyleTransferClient:
+    """Neural style transfer API (check it here: "https://huggingface.co/spaces/Hexii/Neural-Style-Transfer") called
+    through a shared pooled `httpx.AsyncClient`, so a slow call doesn't block the other bot users.
+
+    At most `max_concurrency` calls are in flight, the rest wait for a slot. Connection errors, timeouts, 429 and 5xx
+    responses are retried `retries` times with exponential backoff and jitter, every attempt gets `timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        timeout: float = 180.0,
+        max_concurrency: int = 4,
+        retries: int = 2,
+        backoff: float = 1.0,
+    ):
+        self.client = client
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _post(self, payload: dict) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            try:
+                response: httpx.Response = await self.client.post(self.url, json=payload, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    return response
+                LOGGER.warning(f"Style transfer API responded with {response.status_code}, retrying")
+            except httpx.TransportError as exc:
+                if attempt == self.retries:
+                    raise
+                LOGGER.warning(f"Style transfer API call failed with {exc!r}, retrying")
+            await asyncio.sleep(self.backoff * 2**attempt * random.uniform(0.5, 1.5))
+        raise AssertionError("unreachable")
+
+    async def __call__(self, content: bytes | str, style: bytes | str, *weights: float) -> bytes | None:
+        """Content image in the style of the style image, both are raw bytes or base64 data URLs. `weights` are passed
+        to the model as is. Returns `None` when the API fails."""
+        payload: dict = {
+            "data": [
+                content if isinstance(content, str) else base64_encode(content),
+                style if isinstance(style, str) else base64_encode(style),
+                *weights,
+            ]
+        }
+        async with self._semaphore:
+            try:
+                response: httpx.Response = await self._post(payload)
+                response.raise_for_status()
+                # strip "data:image/png;base64," prefix
+                return base64_decode(response.json()["data"][0].split(",", 1)[-1])
+            except (httpx.HTTPError, ValueError, KeyError, IndexError) as exc:
+                LOGGER.error(f"Failed to fetch style transfer result: {exc!r}")
+                return None
@@ -1,3 +1,4 @@
+import functools
 import typing
 
 import cv2
@@ -7,58 +8,104 @@ from painting_estimation.images import utils
 from painting_estimation.images.utils import ImgSize
 
 
-def insert_image(
-    img_to_insert: np.ndarray,
-    background_img: np.ndarray,
-    insertion_size_coef: float = 0.15,
-    right_indent: float = 0.03,
-    insertion_shape: typing.Literal["circle"] | None = None,
-    contour_to_insert: np.ndarray | None = None,
-) -> np.ndarray:
-    dst_img: np.ndarray = background_img.copy()
+InsertionShape = typing.Literal["circle"]
 
-    img_size: ImgSize = utils.image_size(img_to_insert)
-    bg_size: ImgSize = utils.image_size(dst_img)
 
+class AlphaMask(typing.NamedTuple):
+    # float32 weights of the inserted image and of the background, they sum up to 1
+    alpha: np.ndarray
+    inverse_alpha: np.ndarray
+    # bounding box (x, y, width, height) of the visible part
+    bbox: tuple[int, int, int, int]
+
+
+def _alpha_mask(mask: np.ndarray) -> AlphaMask:
+    bbox: tuple[int, int, int, int] = cv2.boundingRect(mask)
+    x, y, width, height = bbox
+    alpha: np.ndarray = mask[y : y + height, x : x + width].astype(np.float32) / 255
+    alpha.flags.writeable = False
+    inverse_alpha: np.ndarray = 1 - alpha
+    inverse_alpha.flags.writeable = False
+    return AlphaMask(alpha=alpha, inverse_alpha=inverse_alpha, bbox=bbox)
+
+
+@functools.lru_cache(maxsize=128)
+def shape_mask(shape: InsertionShape, size: ImgSize) -> AlphaMask:
+    """Anti-aliased alpha mask of the shape inscribed into an image of `size`, cached by shape and size."""
+    mask: np.ndarray = np.zeros((size.height, size.width), np.uint8)
+    if shape != "circle":
+        raise ValueError(f"Unknown insertion shape `{shape}`")
+    # subpixel center and radius, 4 fractional bits
+    shift: int = 4
+    center = (round((size.width - 1) / 2 * 2**shift), round((size.height - 1) / 2 * 2**shift))
+    radius: int = round(min(size.width, size.height) / 2 * 2**shift)
+    cv2.circle(mask, center, radius, 255, -1, cv2.LINE_AA, shift)
+    return _alpha_mask(mask)
+
+
+def contour_mask(contour: np.ndarray, size: ImgSize) -> AlphaMask:
+    mask: np.ndarray = np.zeros((size.height, size.width), np.uint8)
+    cv2.drawContours(mask, [contour], -1, 255, -1, cv2.LINE_AA)
+    return _alpha_mask(mask)
+
+
+def insertion_size(img_size: ImgSize, bg_size: ImgSize, insertion_size_coef: float = 0.15) -> ImgSize:
+    """Size the inserted image is resized to, its shorter side is `insertion_size_coef` of the background width."""
     scale_coef: float = insertion_size_coef * bg_size.width / min(img_size.width, img_size.height)
+    return ImgSize(width=round(img_size.width * scale_coef), height=round(img_size.height * scale_coef))
+
 
-    img: np.ndarray = cv2.resize(
-        img_to_insert,
-        dsize=(round(img_size.width * scale_coef), round(img_size.height * scale_coef)),
-        interpolation=cv2.INTER_AREA,
-    )
-    img_size = utils.image_size(img)
+def _resize(img_to_insert: np.ndarray, size: ImgSize) -> np.ndarray:
+    return cv2.resize(img_to_insert, dsize=(size.width, size.height), interpolation=cv2.INTER_AREA)
+
+
+def _composite(
+    img: np.ndarray,
+    dst_img: np.ndarray,
+    right_indent: float,
+    mask: AlphaMask | None,
+) -> np.ndarray:
+    """Blend the resized image into the bottom right corner of `dst_img` in place."""
+    bg_size: ImgSize = utils.image_size(dst_img)
+    if mask is not None:
+        x, y, width, height = mask.bbox
+        img = img[y : y + height, x : x + width]
+    img_size: ImgSize = utils.image_size(img)
 
     indent: int = round(right_indent * min(bg_size.width, bg_size.height))
     start_width: int = bg_size.width - indent - img_size.width
     start_height: int = bg_size.height - indent - img_size.height
+    roi: np.ndarray = dst_img[start_height : start_height + img_size.height, start_width : start_width + img_size.width]
+
+    if mask is None:
+        roi[...] = img
+    else:
+        # a single weighted sum over the ROI only
+        roi[...] = cv2.blendLinear(img, roi, mask.alpha, mask.inverse_alpha)
+    return dst_img
 
-    if contour_to_insert is not None:
-        contour_to_insert = np.rint(contour_to_insert.astype(float) * scale_coef).astype(np.int32)
-    elif insertion_shape is not None:
-        contour_to_insert = getattr(utils, f"build_{insertion_shape}_shape")(img)
 
+def insert_image(
+    img_to_insert: np.ndarray,
+    background_img: np.ndarray,
+    insertion_size_coef: float = 0.15,
+    right_indent: float = 0.03,
+    insertion_shape: InsertionShape | None = None,
+    contour_to_insert: np.ndarray | None = None,
+) -> np.ndarray:
+    """Insert the image into the bottom right corner of the background, cut to a shape or a contour (given in
+    `img_to_insert` coordinates), with anti-aliased edges."""
+    img_size: ImgSize = utils.image_size(img_to_insert)
+    bg_size: ImgSize = utils.image_size(background_img)
+    size: ImgSize = insertion_size(img_size, bg_size, insertion_size_coef)
+    img: np.ndarray = _resize(img_to_insert, size)
+
+    mask: AlphaMask | None = None
     if contour_to_insert is not None:
-        min_x, min_y = contour_to_insert.min(0).tolist()[0]
-        max_x, max_y = contour_to_insert.max(0).tolist()[0]
-
-        contour_to_insert -= (min_x, min_y)
-        img = img[min_y : max_y + 1, min_x : max_x + 1]
-        start_width += min_x + img_size.width - max_x - 1
-        start_height += min_y + img_size.height - max_y - 1
-        img_size = utils.image_size(img)
-
-        bg_part: np.ndarray = dst_img[
-            start_height : start_height + img_size.height, start_width : start_width + img_size.width
-        ]
-        cv2.drawContours(bg_part, [contour_to_insert], -1, (0, 0, 0), -1, cv2.LINE_AA)
-        mask: np.ndarray = np.zeros(bg_part.shape[:2], np.uint8)
-        cv2.drawContours(mask, [contour_to_insert], -1, (255, 255, 255), -1, cv2.LINE_AA)
-        original_without_bg: np.ndarray = cv2.bitwise_and(img, img, mask=mask)
-        to_insert = cv2.bitwise_or(bg_part, original_without_bg)
-    else:
-        to_insert = img
+        scale_coef: float = insertion_size_coef * bg_size.width / min(img_size.width, img_size.height)
+        mask = contour_mask(np.rint(contour_to_insert.astype(float) * scale_coef).astype(np.int32), size)
+    elif insertion_shape is not None:
+        mask = shape_mask(insertion_shape, size)
 
-    dst_img[start_height : start_height + img_size.height, start_width : start_width + img_size.width] = to_insert
+    return _composite(img, background_img.copy(), right_indent, mask)
 
-    return dst_img
@@ -1,3 +1,4 @@
+import hashlib
 import math
 import typing
 
@@ -8,6 +9,13 @@ from painting_estimation.images.utils import ImgSize, image_size
 
 
 class ImagePreprocessor:
+    """Resize, crop, normalize and lay out an RGB image as a model input.
+
+    Normalization, means and stds are folded into a single `x * scale + bias` step, which is written straight into the
+    output tensor (through a transposed view, so no separate transpose or batch dim copies are made). The output can be
+    preallocated and reused with `out`, and a list of images is preprocessed into one contiguous batch tensor.
+    """
+
     def __init__(
         self,
         target_size: ImgSize,
@@ -31,6 +39,67 @@ class ImagePreprocessor:
         self.means = means
         self.stds = stds
         self.initial_size_before_crop = initial_size_before_crop
+        self._scale, self._bias = self._fused_scale_and_bias()
+
+    def _config(self) -> tuple:
+        return (
+            self.target_size,
+            self.target_dim_order,
+            np.dtype(self.target_dtype).str,
+            self.interpolation,
+            self.to_bgr,
+            self.extra_batch_dim,
+            self.normalize,
+            self.means,
+            self.stds,
+            self.initial_size_before_crop,
+        )
+
+    def __eq__(self, other: object) -> bool:
+        # preprocessors with equal settings produce equal inputs, which lets model ensembles share them
+        return isinstance(other, ImagePreprocessor) and self._config() == other._config()
+
+    def __hash__(self) -> int:
+        return hash(self._config())
+
+    def fingerprint(self) -> str:
+        """Hash of the settings which is stable across processes, unlike `hash`."""
+        return hashlib.sha1(repr(self._config()).encode()).hexdigest()[:12]
+
+    def _fused_scale_and_bias(self) -> tuple[np.ndarray | None, np.ndarray | None]:
+        # ((x / 255) - means) / stds == x * scale + bias
+        scale: np.ndarray = np.ones(3, dtype=np.float64)
+        bias: np.ndarray = np.zeros(3, dtype=np.float64)
+        if self.normalize:
+            scale /= 255.0
+        if self.means is not None:
+            bias -= np.asarray(self.means, dtype=np.float64)
+        if self.stds is not None:
+            scale /= np.asarray(self.stds, dtype=np.float64)
+            bias /= np.asarray(self.stds, dtype=np.float64)
+        return (
+            None if np.all(scale == 1) else scale.astype(self.target_dtype),
+            None if np.all(bias == 0) else bias.astype(self.target_dtype),
+        )
+
+    @property
+    def input_size(self) -> ImgSize:
+        """Size the source image is resized to, decoding at a higher resolution than this is wasted."""
+        return self.initial_size_before_crop or self.target_size
+
+    @property
+    def _batch_axis(self) -> int:
+        return 0 if self.extra_batch_dim is None else self.extra_batch_dim
+
+    def output_shape(self, batch_size: int | None = None) -> tuple[int, ...]:
+        """Shape of a single preprocessed image, or of a batch of `batch_size` images."""
+        hwc_shape: tuple[int, int, int] = (self.target_size.height, self.target_size.width, 3)
+        shape: list[int] = [hwc_shape[axis] for axis in self.target_dim_order]
+        if batch_size is not None:
+            shape.insert(self._batch_axis, batch_size)
+        elif self.extra_batch_dim is not None:
+            shape.insert(self.extra_batch_dim, 1)
+        return tuple(shape)
 
     @staticmethod
     def _central_crop(image: np.ndarray, *, target_size: ImgSize) -> np.ndarray:
@@ -44,30 +113,40 @@ class ImagePreprocessor:
         width_end: int = cx + math.ceil(target_size.width / 2)
         return image[height_start:height_end, width_start:width_end]
 
-    def __call__(self, image: np.ndarray) -> np.ndarray:
+    def _fill(self, image: np.ndarray, hwc_out: np.ndarray) -> None:
+        size: ImgSize = self.input_size
+        resized: np.ndarray = cv2.resize(image, dsize=(size.width, size.height), interpolation=self.interpolation)
+        if self.initial_size_before_crop is not None:
+            resized = self._central_crop(resized, target_size=self.target_size)
         if self.to_bgr:
-            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            resized = resized[..., ::-1]
 
-        if self.initial_size_before_crop is not None:
-            size: ImgSize = self.initial_size_before_crop
+        if self._scale is not None:
+            np.multiply(resized, self._scale, out=hwc_out, casting="unsafe")
         else:
-            size = self.target_size
-        normalized_img = cv2.resize(image, dsize=(size.width, size.height), interpolation=self.interpolation).astype(
-            self.target_dtype
-        )
-        if self.initial_size_before_crop is not None:
-            normalized_img = self._central_crop(normalized_img, target_size=self.target_size)
+            np.copyto(hwc_out, resized, casting="unsafe")
+        if self._bias is not None:
+            np.add(hwc_out, self._bias, out=hwc_out)
 
-        if self.normalize:
-            normalized_img /= 255.0
-        if self.means is not None:
-            normalized_img = normalized_img - np.asarray(self.means, dtype=self.target_dtype)
-        if self.stds is not None:
-            normalized_img = normalized_img / np.asarray(self.stds, dtype=self.target_dtype)
+    def _hwc_view(self, out: np.ndarray, idx: int | None = None) -> np.ndarray:
+        """Writable view of the `idx`-th image of `out` in height, width, channels order."""
+        if idx is not None:
+            out = out[(slice(None),) * self._batch_axis + (idx,)]
+        return out.transpose(np.argsort(self.target_dim_order))
 
-        prepared_img: np.ndarray = normalized_img.transpose(self.target_dim_order)
+    def batch(self, images: typing.Sequence[np.ndarray], out: np.ndarray | None = None) -> np.ndarray:
+        """Preprocess images into one batch tensor, stacked along `extra_batch_dim` (or a new first axis)."""
+        if out is None:
+            out = np.empty(self.output_shape(len(images)), dtype=self.target_dtype)
+        for idx, image in enumerate(images):
+            self._fill(image, self._hwc_view(out, idx))
+        return out
 
-        if self.extra_batch_dim is not None:
-            prepared_img = np.expand_dims(prepared_img, axis=self.extra_batch_dim)
+    def __call__(self, image: np.ndarray | typing.Sequence[np.ndarray], out: np.ndarray | None = None) -> np.ndarray:
+        if isinstance(image, (list, tuple)):
+            return self.batch(image, out=out)
 
-        return prepared_img
+        if out is None:
+            out = np.empty(self.output_shape(), dtype=self.target_dtype)
+        self._fill(image, self._hwc_view(out, None if self.extra_batch_dim is None else 0))
+        return out
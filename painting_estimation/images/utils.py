@@ -1,4 +1,6 @@
+import functools
 import io
+import math
 import typing
 
 import cv2
@@ -6,8 +8,29 @@ import numpy as np
 from PIL import Image
 
 
-def cv2_image_from_byte_io(byte_io: io.BytesIO) -> np.ndarray:
-    pil_image: Image = Image.open(byte_io).convert("RGB")
+# images read from directories and archives
+IMAGE_SUFFIXES: tuple[str, ...] = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+
+class ImgSize(typing.NamedTuple):
+    width: int
+    height: int
+
+
+def _open_rgb(byte_io: io.BytesIO, min_size: ImgSize | None = None) -> tuple[Image.Image, ImgSize]:
+    pil_image: Image.Image = Image.open(byte_io)
+    source_size = ImgSize(width=pil_image.width, height=pil_image.height)
+    if min_size is not None and pil_image.format == "JPEG":
+        # libjpeg DCT scaling: decode at 1/2, 1/4 or 1/8 of the resolution, keeping both sides >= `min_size`
+        pil_image.draft("RGB", (min_size.width, min_size.height))
+    if pil_image.mode != "RGB":
+        pil_image = pil_image.convert("RGB")
+    return pil_image, source_size
+
+
+def cv2_image_from_byte_io(byte_io: io.BytesIO, min_size: ImgSize | None = None) -> np.ndarray:
+    """Decode an image to RGB array, JPEGs are decoded right at reduced resolution when `min_size` is given."""
+    pil_image, _ = _open_rgb(byte_io, min_size=min_size)
     return np.asarray(pil_image, dtype=np.uint8)
 
 
@@ -17,24 +40,62 @@ def cv2_image_to_bytes(image: np.ndarray) -> bytes:
     return bytes_io.getvalue()
 
 
-class ImgSize(typing.NamedTuple):
-    width: int
-    height: int
-
-
 def image_size(img: np.ndarray) -> ImgSize:
     height, width, *_ = img.shape
     return ImgSize(width=width, height=height)
 
 
-def build_circle_shape(image: np.ndarray) -> np.ndarray:
-    img_size: ImgSize = image_size(image)
-    min_dim: int = min(img_size.width, img_size.height)
+def _decoded_pixel_weights(decoded: int, source: int) -> np.ndarray:
+    """Source pixels covered by every decoded pixel of a side scaled by 1/2, 1/4 or 1/8, relative to the scale."""
+    weights = np.ones(decoded)
+    scale: int = 2 ** round(math.log2(source / decoded))
+    if math.ceil(source / scale) == decoded:
+        weights[-1] = (source - (decoded - 1) * scale) / scale
+    return weights
 
-    black_img = np.zeros_like(image)
-    center = (round(img_size.width / 2), round(img_size.height / 2))
 
-    cv2.circle(black_img, center, min_dim // 2, 255)
-    circle_contour = np.transpose(np.where(black_img == 255))
+class DecodedImage:
+    """Uploaded image decoded once per request, shared by the serving and the image feature metrics."""
+
+    def __init__(self, array: np.ndarray, source_size: ImgSize | None = None):
+        self.array = array
+        # size of the uploaded image, `array` may be decoded at a lower resolution
+        self.source_size = source_size or image_size(array)
+
+    @property
+    def size(self) -> ImgSize:
+        return image_size(self.array)
+
+    @property
+    def aspect(self) -> float:
+        return self.source_size.width / self.source_size.height
+
+    @functools.cached_property
+    def mean_pixel(self) -> float:
+        """Mean of the uploaded image, the same (up to libjpeg rounding, ~0.1) whatever resolution it's decoded at."""
+        if self.size == self.source_size:
+            return float(self.array.mean())
+        # the last row and column of a DCT-scaled JPEG cover partial blocks, i.e. fewer source pixels than the others
+        row_weights = _decoded_pixel_weights(self.size.height, self.source_size.height)
+        column_weights = _decoded_pixel_weights(self.size.width, self.source_size.width)
+        channel_means: np.ndarray = self.array.mean(axis=2, dtype=np.float64)
+        return float(row_weights @ channel_means @ column_weights / (row_weights.sum() * column_weights.sum()))
 
-    return circle_contour[:, :2][:, [1, 0]].reshape(-1, 1, 2)
+    @property
+    def features(self) -> dict:
+        return {"aspect": self.aspect, "mean_pixel": self.mean_pixel}
+
+
+def decode_image(file: bytes | io.BytesIO, min_size: ImgSize | None = None) -> DecodedImage:
+    if isinstance(file, bytes):
+        file = io.BytesIO(file)
+    pil_image, source_size = _open_rgb(file, min_size=min_size)
+    return DecodedImage(np.asarray(pil_image, dtype=np.uint8), source_size=source_size)
+
+
+def build_circle_shape(image: np.ndarray) -> np.ndarray:
+    """Contour (N x 1 x 2 array of x, y points) of the circle inscribed into the image."""
+    img_size: ImgSize = image_size(image)
+    radius: int = min(img_size.width, img_size.height) // 2
+    center = (round(img_size.width / 2), round(img_size.height / 2))
+    return cv2.ellipse2Poly(center, (radius, radius), 0, 0, 360, 1).reshape(-1, 1, 2)
@@ -0,0 +1,121 @@
+import asyncio
+import itertools
+import logging
+import typing
+
+import numpy as np
+
+from painting_estimation.inference.executor import InferenceExecutor
+from painting_estimation.inference.inference import ModelServing
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+class BatchingServing:
+    """Dynamic micro-batching on top of `ModelServing`.
+
+    Concurrent callers put their preprocessed images into a shared queue, which is flushed as soon as it holds
+    `max_batch_size` items or the oldest item waited for `max_wait_ms`. Each flush makes one model call and one
+    batch postprocessor call, results are handed back to the callers through their futures.
+
+    The serving is resolved with `get_serving` on every call, so a hot-swapped model is picked up by the next request.
+    Servings without a batch postprocessor are called one image at a time. Images with features in the serving
+    feature store skip the queue and only run the postprocessor.
+    """
+
+    def __init__(
+        self,
+        get_serving: typing.Callable[[], typing.Any],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        executor: InferenceExecutor | None = None,
+    ):
+        if executor is not None and executor.mode == "process":
+            raise ValueError("Batching shares the in-process model and can't be used with a process pool")
+        self.get_serving = get_serving
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._worker: asyncio.Task | None = None
+        self._pending: list[tuple[ModelServing, np.ndarray, str | None, asyncio.Future]] = []
+        self._has_items: asyncio.Event = asyncio.Event()
+        self._is_full: asyncio.Event = asyncio.Event()
+
+    def _ensure_worker(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        # the worker is bound to the loop it was started in, restart it when the loop changes (tests, reloads)
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._pending = []
+            self._has_items = asyncio.Event()
+            self._is_full = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+        return loop
+
+    async def _submit(self, func: typing.Callable, *args: typing.Any) -> typing.Any:
+        if self.executor is not None:
+            return await self.executor.submit(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def __call__(self, image: np.ndarray) -> typing.Union[np.ndarray, float]:
+        serving = self.get_serving()
+        if not isinstance(serving, ModelServing) or not serving.supports_batching:
+            return await self._submit(serving, image)
+
+        feature_key: str | None = None
+        if serving.uses_feature_store:
+            feature_key, stored = await self._submit(serving.predict_stored, image)
+            if stored is not None:
+                return stored
+
+        loop = self._ensure_worker()
+        nn_input: np.ndarray = await self._submit(serving.preprocess, image)
+
+        future: asyncio.Future = loop.create_future()
+        self._pending.append((serving, nn_input, feature_key, future))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._is_full.set()
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_items.wait()
+            if len(self._pending) < self.max_batch_size:
+                try:
+                    await asyncio.wait_for(self._is_full.wait(), timeout=self.max_wait_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+            if not self._pending:
+                self._has_items.clear()
+            if len(self._pending) < self.max_batch_size:
+                self._is_full.clear()
+
+            # inputs preprocessed by different model versions (around a hot swap) can't share a model call
+            for serving, items in itertools.groupby(batch, key=lambda item: item[0]):
+                await self._flush(serving, [(nn_input, key, future) for _, nn_input, key, future in items])
+
+    async def _flush(self, serving: ModelServing, batch: list[tuple[np.ndarray, str | None, asyncio.Future]]) -> None:
+        LOGGER.debug(f"Flushing batch of {len(batch)} images")
+        feature_keys: list[str | None] = [feature_key for _, feature_key, _ in batch]
+        try:
+            outputs = await self._submit(
+                serving.predict_batch,
+                [nn_input for nn_input, _, _ in batch],
+                None if None in feature_keys else feature_keys,
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (*_, future), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output)
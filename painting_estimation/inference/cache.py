@@ -0,0 +1,137 @@
+import asyncio
+import collections
+import hashlib
+import logging
+import threading
+import time
+import typing
+
+import cv2
+import numpy as np
+
+from painting_estimation import models
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+CacheMode = typing.Literal["content", "perceptual"]
+
+
+class MemoryCache:
+    """Thread-safe LRU cache with a TTL and a bounded number of entries."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: collections.OrderedDict[str, tuple[float, models.Predict]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> models.Predict | None:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return None
+            expires_at, prediction = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return prediction
+
+    def set(self, key: str, prediction: models.Predict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, prediction)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisCache:
+    """Cache shared by all the workers, eviction is left to redis `maxmemory-policy` and key expiration."""
+
+    def __init__(self, url: str, ttl: float = 3600.0, prefix: str = "prediction:"):
+        try:
+            import redis  # pylint: disable=import-outside-toplevel
+        except ImportError as exc:
+            raise ImportError("Shared prediction cache requires `redis`, install `cache` extras") from exc
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self._errors: tuple[type[Exception], ...] = (redis.RedisError,)
+        self.client = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1)
+
+    def get(self, key: str) -> models.Predict | None:
+        try:
+            raw: bytes | None = self.client.get(self.prefix + key)
+        except self._errors:
+            LOGGER.warning("Failed to read from shared prediction cache", exc_info=True)
+            return None
+        return None if raw is None else models.Predict.parse_raw(raw)
+
+    def set(self, key: str, prediction: models.Predict) -> None:
+        try:
+            self.client.set(self.prefix + key, prediction.json(), ex=max(1, round(self.ttl)))
+        except self._errors:
+            LOGGER.warning("Failed to write to shared prediction cache", exc_info=True)
+
+
+class PredictionCache:
+    """Prediction cache keyed by a hash of the uploaded image.
+
+    `content` mode keys by SHA-256 of the uploaded bytes and is checked before the image is even decoded.
+    `perceptual` mode keys by a 64-bit difference hash of the decoded image, so re-encoded, resized or recompressed
+    copies of the same picture (forwarded or retried uploads) hit the cache as well, it still saves the whole model
+    pipeline. A local LRU/TTL cache sits in front of an optional redis cache shared by all the workers.
+    Listeners are called with `True` on a hit and `False` on a miss.
+    """
+
+    def __init__(
+        self,
+        mode: CacheMode = "content",
+        max_entries: int = 1024,
+        ttl: float = 3600.0,
+        shared_url: str | None = None,
+    ):
+        self.mode = mode
+        self.local = MemoryCache(max_entries=max_entries, ttl=ttl)
+        self.shared: RedisCache | None = RedisCache(shared_url, ttl=ttl) if shared_url else None
+        self.listeners: list[typing.Callable[[bool], None]] = []
+
+    @staticmethod
+    def content_key(data: bytes) -> str:
+        return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+    @staticmethod
+    def perceptual_key(image: np.ndarray) -> str:
+        small: np.ndarray = cv2.resize(image, dsize=(9, 8), interpolation=cv2.INTER_AREA)
+        gray: np.ndarray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY) if small.ndim == 3 else small
+        return f"dhash:{np.packbits(gray[:, 1:] > gray[:, :-1]).tobytes().hex()}"
+
+    def get(self, key: str) -> models.Predict | None:
+        prediction: models.Predict | None = self.local.get(key)
+        if prediction is None and self.shared is not None:
+            if (prediction := self.shared.get(key)) is not None:
+                self.local.set(key, prediction)
+
+        for listener in self.listeners:
+            listener(prediction is not None)
+        return None if prediction is None else prediction.copy()
+
+    def set(self, key: str, prediction: models.Predict) -> None:
+        self.local.set(key, prediction)
+        if self.shared is not None:
+            self.shared.set(key, prediction)
+
+    async def aget(self, key: str) -> models.Predict | None:
+        if self.shared is None:
+            return self.get(key)
+        # network round trip to the shared cache shouldn't block the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    async def aset(self, key: str, prediction: models.Predict) -> None:
+        if self.shared is None:
+            self.set(key, prediction)
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self.set, key, prediction)
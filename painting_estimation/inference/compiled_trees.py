@@ -0,0 +1,318 @@
+"""LightGBM tree ensembles compiled to flat NumPy arrays and evaluated for a whole batch at once.
+
+The sklearn wrapper validates the input and calls into the native library on every `predict`, which dominates the
+time of a single row prediction. Compiled trees skip all of it and don't need LightGBM (or a pickle of a matching
+version) to be loaded, their predictions match LightGBM up to float rounding.
+
+Export a pickled model to `<model>.npz`, which `LGBMPriceRegressor` loads instead when `LGBM_BACKEND=numpy`, and
+benchmark both against each other, for every batch size:
+    python -m painting_estimation.inference.compiled_trees models/2/lgb_new.pkl --benchmark
+"""
+import argparse
+import pathlib
+import time
+import typing
+
+import numpy as np
+
+
+# LightGBM treats values within this distance of zero as zero for `Zero` missing type splits
+ZERO_THRESHOLD: float = 1e-35
+MISSING_TYPES: dict[str, int] = {"None": 0, "Zero": 1, "NaN": 2}
+OUTPUT_TRANSFORMS: dict[str, typing.Callable[[np.ndarray], np.ndarray]] = {
+    "regression": lambda raw: raw,
+    "regression_l1": lambda raw: raw,
+    "huber": lambda raw: raw,
+    "fair": lambda raw: raw,
+    "quantile": lambda raw: raw,
+    "mape": lambda raw: raw,
+    "poisson": np.exp,
+    "gamma": np.exp,
+    "tweedie": np.exp,
+}
+
+
+class CompiledTrees:
+    """Nodes of all trees in flat arrays, leaves are nodes pointing to themselves with their value in `node_value`.
+    Batches are evaluated level by level, small ones with leaf bit masks."""
+
+    # largest batch evaluated with leaf bit masks, which are faster than level by level evaluation up to it
+    bitvector_max_batch: int = 2
+
+    def __init__(
+        self,
+        split_feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        default_left: np.ndarray,
+        missing_type: np.ndarray,
+        node_value: np.ndarray,
+        roots: np.ndarray,
+        depth: int,
+        objective: str = "regression",
+        average_output: bool = False,
+    ):
+        if objective not in OUTPUT_TRANSFORMS:
+            raise ValueError(f"Unsupported objective `{objective}`")
+        self.split_feature = split_feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.missing_type = missing_type
+        self.node_value = node_value
+        self.roots = roots
+        self.depth = depth
+        self.objective = objective
+        self.average_output = average_output
+        # splits without missing value handling only need NaN replaced by zero, as LightGBM does
+        self._plain: bool = not missing_type.any()
+        self._children: np.ndarray = np.stack([left, right], axis=1).ravel()
+        self._build_bitvectors()
+
+    def _is_leaf(self, node: int) -> bool:
+        return self.left[node] == node
+
+    def _leaves(self, node: int) -> list[int]:
+        """Leaves under the node, from left to right."""
+        leaves: list[int] = []
+        stack: list[int] = [node]
+        while stack:
+            node = stack.pop()
+            if self._is_leaf(node):
+                leaves.append(node)
+            else:
+                stack.extend((self.right[node], self.left[node]))
+        return leaves
+
+    def _build_bitvectors(self) -> None:
+        splits: list[int] = []
+        masks: list[int] = []
+        tree_starts: list[int] = []
+        leaves: list[list[int]] = []
+        for root in self.roots:
+            tree_leaves: list[int] = self._leaves(root)
+            if not 1 < len(tree_leaves) <= 64:
+                # masks are 64 bit and trees without splits have none, small batches are evaluated level by level
+                self._bitvectors = None
+                return
+            bits: dict[int, int] = {leaf: bit for bit, leaf in enumerate(tree_leaves)}
+            leaves.append(tree_leaves)
+            tree_starts.append(len(splits))
+            for node in (node for node in self._preorder(root) if not self._is_leaf(node)):
+                splits.append(node)
+                masks.append((1 << 64) - 1 - sum(1 << bits[leaf] for leaf in self._leaves(self.left[node])))
+
+        leaf_values = np.zeros((len(self.roots), 64), dtype=np.float64)
+        for tree, tree_leaves in enumerate(leaves):
+            leaf_values[tree, : len(tree_leaves)] = self.node_value[tree_leaves]
+        self._bitvectors = (
+            np.array(splits, dtype=np.int32),
+            np.array(masks, dtype=np.uint64),
+            np.array(tree_starts, dtype=np.intp),
+            leaf_values,
+        )
+
+    def _preorder(self, node: int) -> typing.Iterator[int]:
+        stack: list[int] = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            if not self._is_leaf(node):
+                stack.extend((self.right[node], self.left[node]))
+
+    @classmethod
+    def from_lightgbm(cls, model: typing.Any) -> "CompiledTrees":
+        """Compile a `lightgbm.Booster` or a fitted sklearn wrapper, up to its best iteration if it has one."""
+        booster = getattr(model, "booster_", model)
+        dump: dict = booster.dump_model()
+        if dump["num_class"] != 1:
+            raise ValueError("Only single output models can be compiled")
+
+        columns: dict[str, list] = {
+            name: []
+            for name in ("split_feature", "threshold", "left", "right", "default_left", "missing_type", "value")
+        }
+        roots: list[int] = []
+        depth: int = 0
+
+        def add_node(node: dict, level: int) -> int:
+            nonlocal depth
+            index: int = len(columns["value"])
+            for column in columns.values():
+                column.append(0)
+            if "leaf_value" in node:
+                depth = max(depth, level)
+                columns["left"][index] = columns["right"][index] = index
+                columns["threshold"][index] = np.inf
+                columns["value"][index] = node["leaf_value"]
+                return index
+            if node["decision_type"] != "<=":
+                raise ValueError(f"Unsupported `{node['decision_type']}` split, categorical features can't be compiled")
+            columns["split_feature"][index] = node["split_feature"]
+            columns["threshold"][index] = node["threshold"]
+            columns["default_left"][index] = node["default_left"]
+            columns["missing_type"][index] = MISSING_TYPES[node["missing_type"]]
+            columns["left"][index] = add_node(node["left_child"], level + 1)
+            columns["right"][index] = add_node(node["right_child"], level + 1)
+            return index
+
+        for tree in dump["tree_info"]:
+            roots.append(add_node(tree["tree_structure"], 0))
+
+        return cls(
+            split_feature=np.array(columns["split_feature"], dtype=np.int32),
+            threshold=np.array(columns["threshold"], dtype=np.float64),
+            left=np.array(columns["left"], dtype=np.int32),
+            right=np.array(columns["right"], dtype=np.int32),
+            default_left=np.array(columns["default_left"], dtype=bool),
+            missing_type=np.array(columns["missing_type"], dtype=np.int8),
+            node_value=np.array(columns["value"], dtype=np.float64),
+            roots=np.array(roots, dtype=np.int32),
+            depth=depth,
+            objective=dump["objective"].split()[0],
+            average_output=bool(dump.get("average_output")),
+        )
+
+    def save(self, path: typing.Union[pathlib.Path, str]) -> None:
+        np.savez_compressed(
+            path,
+            split_feature=self.split_feature,
+            threshold=self.threshold,
+            left=self.left,
+            right=self.right,
+            default_left=self.default_left,
+            missing_type=self.missing_type,
+            node_value=self.node_value,
+            roots=self.roots,
+            depth=np.array(self.depth),
+            objective=np.array(self.objective),
+            average_output=np.array(self.average_output),
+        )
+
+    @classmethod
+    def load(cls, path: typing.Union[pathlib.Path, str]) -> "CompiledTrees":
+        with np.load(path) as arrays:
+            return cls(
+                **{name: arrays[name] for name in arrays.files if name not in ("depth", "objective", "average_output")},
+                depth=int(arrays["depth"]),
+                objective=str(arrays["objective"]),
+                average_output=bool(arrays["average_output"]),
+            )
+
+    def _go_left(self, nodes: np.ndarray, values: np.ndarray) -> np.ndarray:
+        if self._plain:
+            return values <= self.threshold[nodes]
+        missing_type = self.missing_type[nodes]
+        is_nan = np.isnan(values)
+        is_missing = ((missing_type == MISSING_TYPES["NaN"]) & is_nan) | (
+            (missing_type == MISSING_TYPES["Zero"]) & (is_nan | (np.abs(values) <= ZERO_THRESHOLD))
+        )
+        values = np.where(is_nan & (missing_type == MISSING_TYPES["None"]), 0.0, values)
+        return np.where(is_missing, self.default_left[nodes], values <= self.threshold[nodes])
+
+    def _predict_levels(self, features: np.ndarray) -> np.ndarray:
+        # every step moves each (row, tree) pair one level down, `depth` steps reach the leaves of all trees
+        num_rows, num_features = features.shape
+        flat: np.ndarray = features.ravel()
+        offsets: np.ndarray = (np.arange(num_rows, dtype=np.int32) * num_features)[:, np.newaxis]
+        nodes: np.ndarray = np.tile(self.roots, (num_rows, 1))
+        for _ in range(self.depth):
+            go_left = self._go_left(nodes, flat.take(offsets + self.split_feature.take(nodes)))
+            nodes = self._children.take(nodes * 2 + ~go_left)
+        return self.node_value.take(nodes).sum(axis=1)
+
+    def _predict_bitvectors(self, features: np.ndarray) -> np.ndarray:
+        assert self._bitvectors is not None
+        splits, masks, tree_starts, leaf_values = self._bitvectors
+        # QuickScorer: a split going right rules out the leaves of its left subtree, the leftmost leaf left is the exit
+        go_left = self._go_left(splits, features[:, self.split_feature[splits]])
+        leaf_masks = np.bitwise_and.reduceat(np.where(go_left, np.uint64((1 << 64) - 1), masks), tree_starts, axis=1)
+        # lowest set bit is the leftmost leaf left, its index is exact in float64
+        exit_leaves = np.log2((leaf_masks & (~leaf_masks + np.uint64(1))).astype(np.float64)).astype(np.intp)
+        return leaf_values[np.arange(len(self.roots)), exit_leaves].sum(axis=1)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Predictions for a `(batch, features)` matrix."""
+        features = np.asarray(features, dtype=np.float64).reshape(len(features), -1)
+        if self._plain:
+            features = np.nan_to_num(features, nan=0.0)
+        raw: np.ndarray = (
+            self._predict_bitvectors(features)
+            if self._bitvectors is not None and len(features) <= self.bitvector_max_batch
+            else self._predict_levels(features)
+        )
+        if self.average_output:
+            raw /= len(self.roots)
+        return OUTPUT_TRANSFORMS[self.objective](raw)
+
+    def __call__(self, features: np.ndarray) -> np.ndarray:
+        return self.predict(features)
+
+
+def max_abs_difference(compiled: CompiledTrees, model: typing.Any, features: np.ndarray) -> float:
+    return float(np.abs(compiled.predict(features) - model.predict(features)).max())
+
+
+def benchmark(
+    compiled: CompiledTrees,
+    model: typing.Any,
+    num_features: int,
+    batch_sizes: typing.Sequence[int] = (1, 4, 16, 64, 256, 1024),
+    repeat: int = 20,
+) -> list[dict]:
+    """Mean `predict` time of the pickled and the compiled model for every batch size, on random features."""
+    rng = np.random.default_rng(0)
+    rows: list[dict] = []
+    for batch_size in batch_sizes:
+        features = rng.random((batch_size, num_features), dtype=np.float32)
+        timings: dict[str, float] = {}
+        for name, predict in (("lightgbm", model.predict), ("numpy", compiled.predict)):
+            predict(features)
+            started_at: float = time.perf_counter()
+            for _ in range(repeat):
+                predict(features)
+            timings[name] = (time.perf_counter() - started_at) / repeat * 1000
+        rows.append(
+            {
+                "batch_size": batch_size,
+                "lightgbm_ms": timings["lightgbm"],
+                "numpy_ms": timings["numpy"],
+                "speedup": timings["lightgbm"] / timings["numpy"],
+                "max_abs_diff": max_abs_difference(compiled, model, features),
+            }
+        )
+    return rows
+
+
+def main() -> None:
+    # pylint: disable=import-outside-toplevel
+    import joblib
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", type=pathlib.Path, help="pickled LightGBM model")
+    parser.add_argument("--output", type=pathlib.Path, help="`<model>.npz` by default")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    compiled = CompiledTrees.from_lightgbm(model)
+    output: pathlib.Path = args.output or args.model.with_suffix(".npz")
+    compiled.save(output)
+    print(f"Compiled {len(compiled.roots)} trees of depth {compiled.depth} to {output}")
+
+    if args.benchmark:
+        print("batch_size\tlightgbm_ms\tnumpy_ms\tspeedup\tmax_abs_diff")
+        for row in benchmark(
+            compiled, model, getattr(model, "n_features_in_", None) or model.num_feature(), repeat=args.repeat
+        ):
+            print(
+                f"{row['batch_size']}\t{row['lightgbm_ms']:.3f}\t{row['numpy_ms']:.3f}\t"
+                f"{row['speedup']:.1f}\t{row['max_abs_diff']:.2e}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import logging
+import multiprocessing
+import typing
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+ExecutionMode = typing.Literal["inline", "thread", "process"]
+T = typing.TypeVar("T")
+
+
+class ExecutorOverloadedError(RuntimeError):
+    pass
+
+
+def process_pool(max_workers: int | None = None) -> concurrent.futures.ProcessPoolExecutor:
+    # `spawn` avoids forking a process with live ONNX Runtime thread pools
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+class InferenceExecutor:
+    """Runs CPU-bound inference off the event loop with admission control.
+
+    `inline` keeps the old behaviour and runs functions right on the event loop, `thread` and `process` use a pool of
+    `max_workers`. At most `max_queue_depth` requests may be in flight (running or waiting for a worker), the next one
+    is rejected immediately with `ExecutorOverloadedError` instead of queueing up and blowing the tail latency.
+    Functions and arguments passed in `process` mode should be picklable.
+    """
+
+    def __init__(self, mode: ExecutionMode = "thread", max_workers: int = 2, max_queue_depth: int = 32):
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.in_flight: int = 0
+        self._executor: concurrent.futures.Executor | None = None
+
+    @property
+    def executor(self) -> concurrent.futures.Executor | None:
+        if self.mode == "inline":
+            return None
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = process_pool(self.max_workers)
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="inference"
+                )
+        return self._executor
+
+    @contextlib.contextmanager
+    def admit(self) -> typing.Iterator[None]:
+        if self.in_flight >= self.max_queue_depth:
+            LOGGER.warning(f"Rejecting request, {self.in_flight} inference requests are already in flight")
+            raise ExecutorOverloadedError(f"Inference queue is full ({self.max_queue_depth} requests)")
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    async def submit(self, func: typing.Callable[..., T], *args: typing.Any) -> T:
+        if self.mode == "inline":
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def run(self, func: typing.Callable[..., T], *args: typing.Any) -> T:
+        with self.admit():
+            return await self.submit(func, *args)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,211 @@
+import functools
+import hashlib
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import typing
+
+import numpy as np
+
+from painting_estimation.settings import settings
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+def image_key(image: np.ndarray) -> str:
+    """Content hash of a decoded image array, its shape included."""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(str(image.shape).encode(), digest_size=16)
+    digest.update(image.data)
+    return digest.hexdigest()
+
+
+def _placeholders(values: typing.Sized) -> str:
+    return ",".join("?" * len(values))
+
+
+class FeatureStore:
+    """Persistent store of CNN embeddings keyed by image hash and feature extractor version, shared by processes.
+    Rows of memory-mapped `<path>/<extractor hash>.f32` files are indexed in `<path>/index.sqlite3`."""
+
+    def __init__(self, path: pathlib.Path, initial_rows: int = 1024):
+        self.path = path
+        self.initial_rows = initial_rows
+        self._lock = threading.RLock()
+        self._pid: int | None = None
+        self._connection: sqlite3.Connection | None = None
+        self._arrays: dict[str, np.memmap] = {}
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # neither SQLite connections nor mappings are carried over to forked workers
+        if self._connection is None or self._pid != os.getpid():
+            self.path.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path / "index.sqlite3", timeout=30.0, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS extractors (extractor TEXT PRIMARY KEY, dim INTEGER, rows INTEGER)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS features "
+                "(extractor TEXT, image_key TEXT, row INTEGER, PRIMARY KEY (extractor, image_key))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS names "
+                "(extractor TEXT, name TEXT, image_key TEXT, PRIMARY KEY (extractor, name))"
+            )
+            self._connection, self._pid, self._arrays = connection, os.getpid(), {}
+        return self._connection
+
+    def _file(self, extractor: str) -> pathlib.Path:
+        return self.path / f"{hashlib.sha1(extractor.encode()).hexdigest()[:16]}.f32"
+
+    def _array(self, extractor: str, dim: int, min_rows: int = 0) -> np.memmap:
+        """Mapping of the extractor file with at least `min_rows` rows, remapped when another process grew it."""
+        array: np.memmap | None = self._arrays.get(extractor)
+        if array is None or array.shape[0] < min_rows:
+            file = self._file(extractor)
+            rows: int = file.stat().st_size // (4 * dim) if file.exists() else 0
+            if rows < min_rows:
+                raise RuntimeError(f"Feature file {file} has {rows} rows, {min_rows} expected")
+            array = np.memmap(file, dtype=np.float32, mode="r+", shape=(rows, dim))
+            self._arrays[extractor] = array
+        return array
+
+    def _dim(self, extractor: str) -> int | None:
+        row = self.connection.execute("SELECT dim FROM extractors WHERE extractor = ?", (extractor,)).fetchone()
+        return None if row is None else row[0]
+
+    def get(self, key: str, extractor: str) -> np.ndarray | None:
+        return self.get_many([key], extractor)[0]
+
+    def get_many(self, keys: typing.Sequence[str], extractor: str) -> list[np.ndarray | None]:
+        with self._lock:
+            if not keys or (dim := self._dim(extractor)) is None:
+                return [None] * len(keys)
+            found: dict[str, int] = dict(
+                self.connection.execute(
+                    f"SELECT image_key, row FROM features WHERE extractor = ? AND image_key IN ({_placeholders(keys)})",
+                    (extractor, *keys),
+                ).fetchall()
+            )
+            if not found:
+                return [None] * len(keys)
+            array = self._array(extractor, dim, min_rows=max(found.values()) + 1)
+            return [None if (row := found.get(key)) is None else np.array(array[row]) for key in keys]
+
+    def put_many(
+        self,
+        keys: typing.Sequence[str],
+        extractor: str,
+        features: np.ndarray,
+        names: typing.Sequence[str | None] | None = None,
+    ) -> None:
+        """Store one row of `features` per key, keys which are already stored keep their rows but get the new names."""
+        features = np.asarray(features, dtype=np.float32).reshape(len(keys), -1)
+        names = names or [None] * len(keys)
+        with self._lock:
+            connection = self.connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                dim, rows = connection.execute(
+                    "SELECT dim, rows FROM extractors WHERE extractor = ?", (extractor,)
+                ).fetchone() or (features.shape[1], 0)
+                if dim != features.shape[1]:
+                    raise ValueError(f"Extractor `{extractor}` stores {dim} features, got {features.shape[1]}")
+
+                stored: set[str] = {
+                    key
+                    for (key,) in connection.execute(
+                        f"SELECT image_key FROM features WHERE extractor = ? AND image_key IN ({_placeholders(keys)})",
+                        (extractor, *keys),
+                    )
+                }
+                new: dict[str, int] = {}
+                for index, key in enumerate(keys):
+                    if key not in stored and key not in new:
+                        new[key] = index
+                connection.executemany(
+                    "INSERT OR REPLACE INTO names (extractor, name, image_key) VALUES (?, ?, ?)",
+                    [(extractor, name, key) for key, name in zip(keys, names) if name is not None],
+                )
+                if not new:
+                    connection.execute("COMMIT")
+                    return
+
+                file = self._file(extractor)
+                capacity: int = file.stat().st_size // (4 * dim) if file.exists() else 0
+                if rows + len(new) > capacity:
+                    capacity = max(2 * capacity, rows + len(new), self.initial_rows)
+                    with file.open("ab") as file_obj:
+                        file_obj.truncate(capacity * dim * 4)
+                array = self._array(extractor, dim, min_rows=rows + len(new))
+                array[rows : rows + len(new)] = features[list(new.values())]
+
+                connection.execute(
+                    "INSERT OR REPLACE INTO extractors (extractor, dim, rows) VALUES (?, ?, ?)",
+                    (extractor, dim, rows + len(new)),
+                )
+                connection.executemany(
+                    "INSERT INTO features (extractor, image_key, row) VALUES (?, ?, ?)",
+                    [(extractor, key, rows + row) for row, key in enumerate(new)],
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def count(self, extractor: str) -> int:
+        with self._lock:
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM features WHERE extractor = ?", (extractor,)
+            ).fetchone()
+        return count
+
+    def iter_batches(
+        self, extractor: str, batch_size: int = 4096, named_only: bool = False
+    ) -> typing.Iterator[tuple[list[str], list[str | None], np.ndarray]]:
+        """Keys, names and a `(batch, dim)` features matrix of the stored images, in row (i.e. file) order.
+
+        An image stored under several names is yielded once per name, `named_only` skips images without names.
+        """
+        with self._lock:
+            if (dim := self._dim(extractor)) is None:
+                return
+            cursor = self.connection.execute(
+                "SELECT features.image_key, names.name, features.row FROM features "
+                + ("JOIN" if named_only else "LEFT JOIN")
+                + " names ON names.extractor = features.extractor AND names.image_key = features.image_key "
+                "WHERE features.extractor = ? ORDER BY features.row",
+                (extractor,),
+            )
+            entries: list[tuple[str, str | None, int]] = cursor.fetchall()
+            array = self._array(extractor, dim, min_rows=max((row for *_, row in entries), default=-1) + 1)
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start : start + batch_size]
+            yield [key for key, _, _ in batch], [name for _, name, _ in batch], np.array(
+                array[[row for *_, row in batch]]
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            for array in self._arrays.values():
+                array.flush()
+            self._arrays = {}
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+@functools.cache
+def default_store() -> FeatureStore | None:
+    """Store at `settings.feature_store_dir`, shared by all the servings of the process, if it's configured."""
+    if not settings.feature_store_dir:
+        return None
+    LOGGER.info(f"Using feature store at {settings.feature_store_dir}")
+    return FeatureStore(pathlib.Path(settings.feature_store_dir))
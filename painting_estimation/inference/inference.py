@@ -1,9 +1,34 @@
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import logging
+import os
 import pathlib
+import queue
+import threading
+import time
 import typing
 
+import joblib
 import numpy as np
 import onnxruntime
 
+from painting_estimation.images.preprocessing import ImagePreprocessor
+from painting_estimation.images.utils import ImgSize
+from painting_estimation.inference import onnx_sessions
+from painting_estimation.inference.compiled_trees import CompiledTrees, max_abs_difference
+from painting_estimation.inference.feature_store import FeatureStore, image_key
+from painting_estimation.instrumentation import time_stage
+from painting_estimation.settings import settings
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+def default_intra_op_threads() -> int:
+    return max(1, (os.cpu_count() or 1) // max(1, settings.api_workers))
+
 
 class ModelProtocol(typing.Protocol):
     def __call__(self, nn_input: np.ndarray) -> np.ndarray:
@@ -20,40 +45,272 @@ class PostprocessorProtocol(typing.Protocol):
         ...
 
 
+class BatchPostprocessorProtocol(typing.Protocol):
+    def __call__(self, nn_output: np.ndarray) -> np.ndarray:
+        ...
+
+
 class AggregatorProtocol(typing.Protocol):
     def __call__(self, outputs: typing.Mapping[str, np.ndarray | float]) -> float:
         ...
 
 
 class ONNXModel:
-    def __init__(self, model_path: typing.Union[pathlib.Path, str]):
-        self.onnx_session = onnxruntime.InferenceSession(str(model_path))
-        self._get_onnx_names()
+    """ONNX Runtime model with a session created lazily in the process which runs it, e.g. a gunicorn worker.
+    `profile` sets the session options, `variant` selects another file of the model, e.g. INT8 quantized."""
+
+    def __init__(
+        self,
+        model_path: typing.Union[pathlib.Path, str],
+        intra_op_num_threads: typing.Optional[int] = None,
+        inter_op_num_threads: typing.Optional[int] = None,
+        profile: typing.Optional[str] = None,
+        variant: typing.Optional[str] = None,
+        share_weights: typing.Optional[bool] = None,
+    ):
+        self.profile_name: str = profile or "default"
+        self.profile: onnx_sessions.SessionProfile = onnx_sessions.SESSION_PROFILES[self.profile_name]
+        self.variant = variant
+        # FP32 model the variants are built from
+        self.source_path = str(model_path)
+        self.model_path = str(onnx_sessions.variant_path(model_path, variant))
+        self.intra_op_num_threads = (
+            intra_op_num_threads
+            or self.profile.intra_op_num_threads
+            or settings.onnx_intra_op_threads
+            or default_intra_op_threads()
+        )
+        self.inter_op_num_threads = (
+            inter_op_num_threads or self.profile.inter_op_num_threads or settings.onnx_inter_op_threads
+        )
+        self.share_weights: bool = settings.onnx_share_weights if share_weights is None else share_weights
+        self._onnx_session: onnxruntime.InferenceSession | None = None
+        # initializers of the session mapped from the shared weights file, they have to outlive the session
+        self._shared_values: list[onnxruntime.OrtValue] = []
+        self._session_pid: int | None = None
+        self._session_lock = threading.Lock()
+
+    def _session_options(self, optimized: bool = False) -> onnxruntime.SessionOptions:
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = self.intra_op_num_threads
+        session_options.inter_op_num_threads = self.inter_op_num_threads
+        session_options.execution_mode = self.profile.execution_mode
+        session_options.enable_cpu_mem_arena = self.profile.enable_cpu_mem_arena
+        session_options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL if optimized else self.profile.graph_optimization_level
+        )
+        return session_options
+
+    @property
+    def shared_graph_path(self) -> pathlib.Path | None:
+        graph_path: pathlib.Path = onnx_sessions.shared_weights_path(self.model_path)
+        if not self.share_weights or not graph_path.exists():
+            return None
+        if graph_path.stat().st_mtime < os.stat(self.model_path).st_mtime:
+            LOGGER.warning(f"{graph_path} is older than {self.model_path}, split the model again to share its weights")
+            return None
+        return graph_path
+
+    def _create_session(self) -> onnxruntime.InferenceSession:
+        if (graph_path := self.shared_graph_path) is not None:
+            # an optimized graph isn't cached, it would hold its own copy of the weights
+            session_options = self._session_options()
+            self._shared_values = onnx_sessions.SharedWeights(graph_path).add_to(session_options)
+            return onnxruntime.InferenceSession(str(graph_path), session_options)
+
+        if not self.profile.cache_optimized_model:
+            return onnxruntime.InferenceSession(self.model_path, self._session_options())
+
+        optimized_path: pathlib.Path = onnx_sessions.optimized_model_path(self.model_path, self.profile_name)
+        if optimized_path.exists() and optimized_path.stat().st_mtime >= os.stat(self.model_path).st_mtime:
+            return onnxruntime.InferenceSession(str(optimized_path), self._session_options(optimized=True))
+
+        # every worker may get here on the first start, write to own file and move it in place atomically
+        tmp_path = optimized_path.with_name(f".{optimized_path.name}.{os.getpid()}")
+        session_options = self._session_options()
+        session_options.optimized_model_filepath = str(tmp_path)
+        try:
+            optimized_path.parent.mkdir(parents=True, exist_ok=True)
+            onnx_session = onnxruntime.InferenceSession(self.model_path, session_options)
+            os.replace(tmp_path, optimized_path)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.warning(f"Failed to cache optimized model to {optimized_path}", exc_info=True)
+            tmp_path.unlink(missing_ok=True)
+            onnx_session = onnxruntime.InferenceSession(self.model_path, self._session_options())
+        return onnx_session
+
+    def load(self) -> onnxruntime.InferenceSession:
+        with self._session_lock:
+            if self._onnx_session is None or self._session_pid != os.getpid():
+                self._onnx_session = self._create_session()
+                self._session_pid = os.getpid()
+                self._get_onnx_names()
+        return self._onnx_session
+
+    @property
+    def onnx_session(self) -> onnxruntime.InferenceSession:
+        if self._onnx_session is not None and self._session_pid == os.getpid():
+            return self._onnx_session
+        return self.load()
+
+    @functools.cached_property
+    def fingerprint(self) -> str:
+        """Name and content hash of the model file, identifies the features it extracts."""
+        digest = hashlib.sha256()
+        with open(self.model_path, "rb") as model_file:
+            while chunk := model_file.read(1 << 20):
+                digest.update(chunk)
+        return f"{pathlib.Path(self.model_path).name}:{digest.hexdigest()[:16]}"
 
     def _get_onnx_names(self) -> None:
         self.input_names = tuple(i.name for i in self.onnx_session.get_inputs())
         self.output_names = tuple(o.name for o in self.onnx_session.get_outputs())
 
     def __call__(self, nn_input: np.ndarray) -> np.ndarray:
-        onnx_output, *_ = self.onnx_session.run(
-            output_names=self.output_names, input_feed={self.input_names[0]: nn_input}
-        )
+        onnx_session = self.onnx_session
+        with time_stage("onnx"):
+            onnx_output, *_ = onnx_session.run(
+                output_names=self.output_names, input_feed={self.input_names[0]: nn_input}
+            )
         return onnx_output
 
 
+class LGBMPriceRegressor:
+    """LightGBM head predicting `log1p` of the price from image features, unpickled once on construction.
+
+    With the `numpy` backend the trees are evaluated by `CompiledTrees`, loaded from `<model>.npz` when it's exported
+    after the last change of the pickle, or compiled from the pickle and checked against it.
+    """
+
+    def __init__(
+        self,
+        model_path: typing.Union[pathlib.Path, str],
+        price_transform: typing.Optional[typing.Callable[[np.ndarray], np.ndarray]] = None,
+        backend: typing.Optional[str] = None,
+    ):
+        self.backend = backend or settings.lgbm_backend
+        self.lgbm: typing.Any = self._load_compiled(pathlib.Path(model_path)) if self.backend == "numpy" else None
+        if self.lgbm is None:
+            self.backend = "lightgbm"
+            self.lgbm = joblib.load(str(model_path))
+        self.price_transform = price_transform
+
+    @staticmethod
+    def _load_compiled(model_path: pathlib.Path) -> typing.Optional[CompiledTrees]:
+        compiled_path: pathlib.Path = model_path.with_suffix(".npz")
+        if compiled_path.exists() and compiled_path.stat().st_mtime >= model_path.stat().st_mtime:
+            return CompiledTrees.load(compiled_path)
+
+        lgbm = joblib.load(str(model_path))
+        try:
+            compiled = CompiledTrees.from_lightgbm(lgbm)
+        except ValueError:
+            LOGGER.warning(f"Failed to compile {model_path}, predicting with LightGBM", exc_info=True)
+            return None
+        num_features: int = getattr(lgbm, "n_features_in_", None) or lgbm.num_feature()
+        features: np.ndarray = np.random.default_rng(0).random((64, num_features), dtype=np.float32)
+        if (difference := max_abs_difference(compiled, lgbm, features)) > 1e-6:
+            LOGGER.error(f"Compiled {model_path} differs from LightGBM by {difference}, predicting with LightGBM")
+            return None
+        return compiled
+
+    def predict_batch(self, nn_output: np.ndarray) -> np.ndarray:
+        with time_stage("lightgbm"):
+            prices: np.ndarray = np.expm1(self.lgbm.predict(nn_output))
+        if self.price_transform is not None:
+            prices = self.price_transform(prices)
+        return prices
+
+    def __call__(self, nn_output: np.ndarray) -> float:
+        return self.predict_batch(nn_output)[0]
+
+
 class ModelServing:
+    """Preprocessor, model and postprocessor of a single model.
+
+    With a `feature_store`, outputs of ONNX models (image embeddings) are stored by image hash and the extractor
+    version (model file and preprocessing settings), stored images only run the postprocessor.
+    """
+
     def __init__(
         self,
         model: ModelProtocol,
         preprocessor: PreprocessorProtocol,
         postprocessor: typing.Optional[PostprocessorProtocol] = None,
+        batch_postprocessor: typing.Optional[BatchPostprocessorProtocol] = None,
+        feature_store: typing.Optional[FeatureStore] = None,
     ):
         self.model = model
         self.preprocessor = preprocessor
         self.postprocessor = postprocessor
+        # vectorized postprocessor returning one output per batch row, enables `predict_batch`
+        self.batch_postprocessor = batch_postprocessor
+        self.feature_store = feature_store
 
-    def __call__(self, image: np.ndarray) -> typing.Union[np.ndarray, float]:
-        nn_input: np.ndarray = self.preprocessor(image)
+    @property
+    def supports_batching(self) -> bool:
+        return self.batch_postprocessor is not None
+
+    @property
+    def input_size(self) -> ImgSize | None:
+        """Resolution the preprocessor resizes images to, if it's known."""
+        return getattr(self.preprocessor, "input_size", None)
+
+    @functools.cached_property
+    def extractor_version(self) -> typing.Optional[str]:
+        """Version of the features the model outputs, None when they can't be told apart from other versions."""
+        if not isinstance(self.model, ONNXModel) or not isinstance(self.preprocessor, ImagePreprocessor):
+            return None
+        return f"{self.model.fingerprint}:{self.preprocessor.fingerprint()}"
+
+    @property
+    def uses_feature_store(self) -> bool:
+        return self.feature_store is not None and self.postprocessor is not None and self.extractor_version is not None
+
+    def postprocess_batch(self, features: np.ndarray) -> list[typing.Union[np.ndarray, float]]:
+        if self.batch_postprocessor is not None:
+            return list(self.batch_postprocessor(features))
+        assert self.postprocessor is not None
+        return [self.postprocessor(row[np.newaxis]) for row in features]
+
+    def predict_stored(self, image: np.ndarray) -> tuple[str, typing.Union[np.ndarray, float, None]]:
+        """Feature store key of the image and its prediction from the stored features, None when they aren't stored."""
+        assert self.feature_store is not None and self.postprocessor is not None
+        key: str = image_key(image)
+        features: np.ndarray | None = self.feature_store.get(key, typing.cast(str, self.extractor_version))
+        return key, None if features is None else self.postprocessor(features[np.newaxis])
+
+    def extract_features(
+        self, images: typing.Sequence[np.ndarray], names: typing.Optional[typing.Sequence[typing.Optional[str]]] = None
+    ) -> np.ndarray:
+        """`(len(images), dim)` model outputs, read from the feature store or computed (and stored) for the rest."""
+        assert self.feature_store is not None
+        extractor: str = typing.cast(str, self.extractor_version)
+        keys: list[str] = [image_key(image) for image in images]
+        features: list[np.ndarray | None] = self.feature_store.get_many(keys, extractor)
+        missing: list[int] = [index for index, row in enumerate(features) if row is None]
+        if missing:
+            outputs: np.ndarray = self.model(self.preprocess_batch([images[index] for index in missing]))
+            for index, output in zip(missing, outputs.reshape(len(missing), -1)):
+                features[index] = output
+        stacked: np.ndarray = np.stack(typing.cast(list[np.ndarray], features))
+        if missing or names is not None:
+            # stored images keep their features, but get the names
+            self.feature_store.put_many(keys, extractor, stacked, names=names)
+        return stacked
+
+    @time_stage("preprocess")
+    def preprocess(self, image: np.ndarray) -> np.ndarray:
+        return self.preprocessor(image)
+
+    @time_stage("preprocess")
+    def preprocess_batch(self, images: typing.Sequence[np.ndarray]) -> np.ndarray:
+        if isinstance(self.preprocessor, ImagePreprocessor):
+            # fills a single contiguous batch tensor
+            return self.preprocessor.batch(images)
+        return np.concatenate([self.preprocessor(image) for image in images], axis=0)
+
+    def predict(self, nn_input: np.ndarray) -> typing.Union[np.ndarray, float]:
         # image feature set or final price estimation
         output: np.ndarray = self.model(nn_input)
 
@@ -62,16 +319,307 @@ class ModelServing:
 
         return output
 
+    def predict_batch(
+        self,
+        nn_inputs: typing.Union[typing.Sequence[np.ndarray], np.ndarray],
+        feature_keys: typing.Optional[typing.Sequence[str]] = None,
+    ) -> list[typing.Union[np.ndarray, float]]:
+        """Run preprocessed inputs (each with a leading batch dim, or already stacked) through the model in a single
+        call. Model outputs are put into the feature store under `feature_keys` (from `predict_stored`) when given."""
+        if self.batch_postprocessor is None:
+            if isinstance(nn_inputs, np.ndarray):
+                nn_inputs = np.split(nn_inputs, len(nn_inputs), axis=0)
+            return [self.predict(nn_input) for nn_input in nn_inputs]
+
+        if not isinstance(nn_inputs, np.ndarray):
+            nn_inputs = np.concatenate(nn_inputs, axis=0)
+        output: np.ndarray = self.model(nn_inputs)
+        if feature_keys is not None and self.uses_feature_store:
+            assert self.feature_store is not None
+            self.feature_store.put_many(feature_keys, typing.cast(str, self.extractor_version), output)
+        return list(self.batch_postprocessor(output))
+
+    def predict_images(
+        self, images: typing.Sequence[np.ndarray], names: typing.Optional[typing.Sequence[typing.Optional[str]]] = None
+    ) -> list[typing.Union[np.ndarray, float]]:
+        """Predict a batch of images, `names` (e.g. file paths) are saved with their stored features."""
+        if self.uses_feature_store:
+            return self.postprocess_batch(self.extract_features(images, names=names))
+        if not self.supports_batching:
+            return [self(image) for image in images]
+        return self.predict_batch(self.preprocess_batch(images))
+
+    def load(self) -> None:
+        """Create model sessions which are built lazily, to move the cost out of the first request."""
+        if isinstance(self.model, ONNXModel):
+            self.model.load()
+
+    def staged_pipeline(
+        self,
+        decode: typing.Optional[typing.Callable[[typing.Any], np.ndarray]] = None,
+        decode_workers: int = 2,
+        preprocess_workers: int = 2,
+        model_batch_size: int = 8,
+        model_workers: int = 1,
+        regressor_batch_size: int = 64,
+        buffer_size: int = 64,
+    ) -> "StagedPipeline":
+        """Pipeline of (decode →) preprocess → model → batch postprocessor stages, each batched and scaled on its
+        own, e.g. the LightGBM head predicts many rows per call instead of one."""
+        if self.batch_postprocessor is None:
+            raise ValueError("Staged pipeline needs a batch postprocessor")
+        batch_postprocessor: BatchPostprocessorProtocol = self.batch_postprocessor
+
+        def run_model(nn_inputs: list[np.ndarray]) -> list[np.ndarray]:
+            return list(self.model(np.concatenate(nn_inputs, axis=0)).reshape(len(nn_inputs), -1))
+
+        stages: list[PipelineStage] = [
+            PipelineStage(
+                "preprocess", lambda images: [self.preprocess(image) for image in images], 1, preprocess_workers
+            ),
+            PipelineStage("model", run_model, model_batch_size, model_workers),
+            PipelineStage("regressor", lambda rows: list(batch_postprocessor(np.stack(rows))), regressor_batch_size),
+        ]
+        if decode is not None:
+            stages.insert(0, PipelineStage("decode", lambda items: [decode(item) for item in items], 1, decode_workers))
+        return StagedPipeline(stages, buffer_size=buffer_size)
+
+    def __call__(self, image: np.ndarray) -> typing.Union[np.ndarray, float]:
+        if self.uses_feature_store:
+            return self.postprocess_batch(self.extract_features([image]))[0]
+        return self.predict(self.preprocess(image))
+
 
 class EnsembleServing:
-    def __init__(self, models: typing.Mapping[str, ModelServing], aggregator: AggregatorProtocol):
+    """Runs member servings concurrently and aggregates the outputs of the ones which finished in `member_timeouts`.
+    Members with equal preprocessors share one preprocessed input."""
+
+    def __init__(
+        self,
+        models: typing.Mapping[str, ModelServing],
+        aggregator: AggregatorProtocol,
+        member_timeouts: typing.Union[float, typing.Mapping[str, float], None] = None,
+        max_workers: typing.Optional[int] = None,
+        member_workers: int = 2,
+    ):
         self.models = models
         self.aggregator = aggregator
+        self.member_timeouts = member_timeouts
+        # preprocessing pool
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or len(models), thread_name_prefix="ensemble"
+        )
+        # a pool per member, so a slow member can't hold up the others
+        self._member_executors: dict[str, concurrent.futures.ThreadPoolExecutor] = {
+            name: concurrent.futures.ThreadPoolExecutor(
+                max_workers=member_workers, thread_name_prefix=f"ensemble-{name}"
+            )
+            for name in models
+        }
+        # timed out calls of the members which are still running
+        self._stragglers: dict[str, concurrent.futures.Future] = {}
+
+    @property
+    def input_size(self) -> ImgSize | None:
+        sizes = [model.input_size for model in self._members().values()]
+        if not sizes or any(size is None for size in sizes):
+            return None
+        return ImgSize(width=max(size.width for size in sizes), height=max(size.height for size in sizes))
+
+    def load(self) -> None:
+        for model in self._members().values():
+            model.load()
+
+    def _members(self, skip_busy: bool = False) -> dict[str, ModelServing]:
+        """Members resolved by name, the ones which fail to load are skipped like timed out ones."""
+        members: dict[str, ModelServing] = {}
+        for name in self.models:
+            if skip_busy and self._is_busy(name):
+                continue
+            try:
+                members[name] = self.models[name]
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.error(f"Failed to load ensemble member `{name}`, skipping it", exc_info=True)
+        return members
+
+    def _member_timeout(self, name: str) -> typing.Optional[float]:
+        if isinstance(self.member_timeouts, typing.Mapping):
+            return self.member_timeouts.get(name)
+        return self.member_timeouts
+
+    def _is_busy(self, name: str) -> bool:
+        straggler: concurrent.futures.Future | None = self._stragglers.get(name)
+        if straggler is None:
+            return False
+        if straggler.done():
+            self._stragglers.pop(name, None)
+            return False
+        LOGGER.warning(f"Ensemble member `{name}` is still running a timed out call, skipping it")
+        return True
+
+    def _run_members(self, image: np.ndarray) -> dict[str, np.ndarray | float]:
+        models: dict[str, ModelServing] = self._members(skip_busy=True)
+        started_at: float = time.monotonic()
+
+        preprocessed: dict[typing.Hashable, concurrent.futures.Future] = {}
+        for model in models.values():
+            if model.preprocessor not in preprocessed and not model.uses_feature_store:
+                preprocessed[model.preprocessor] = self._executor.submit(model.preprocess, image)
+
+        def predict(model: ModelServing) -> np.ndarray | float:
+            if model.uses_feature_store:
+                # looks up the stored features first and preprocesses only when they aren't stored
+                return model(image)
+            return model.predict(preprocessed[model.preprocessor].result())
+
+        futures = {name: self._member_executors[name].submit(predict, model) for name, model in models.items()}
+
+        outputs: dict[str, np.ndarray | float] = {}
+        for name, future in futures.items():
+            timeout: typing.Optional[float] = self._member_timeout(name)
+            try:
+                outputs[name] = future.result(
+                    timeout=None if timeout is None else max(0.0, started_at + timeout - time.monotonic())
+                )
+            except concurrent.futures.TimeoutError:
+                LOGGER.warning(f"Ensemble member `{name}` didn't finish in {timeout}s, skipping it")
+                # only calls still waiting in the member pool can be cancelled
+                if not future.cancel():
+                    self._stragglers[name] = future
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.error(f"Ensemble member `{name}` failed, skipping it", exc_info=True)
+
+        if not outputs:
+            raise RuntimeError("None of the ensemble members returned a prediction")
+        return outputs
 
     def __call__(self, image: np.ndarray, add_source_image: bool = False) -> float:
-        outputs = {name: model(image) for name, model in self.models.items()}
+        outputs = self._run_members(image)
         if add_source_image:
             outputs.update({"image": image})
 
         price: float = self.aggregator(outputs)
         return price
+
+
+class PipelineStage(typing.NamedTuple):
+    name: str
+    # called with a list of up to `batch_size` items, returns one output per item
+    fn: typing.Callable[[list], typing.Sequence]
+    batch_size: int = 1
+    workers: int = 1
+    # how long a worker waits for more items to fill a batch once it got the first one
+    max_wait_ms: float = 2.0
+
+
+# tells the workers of a stage to stop
+_STOP = object()
+
+
+class StagedPipeline:
+    """Batched stages run by their own worker threads and connected by bounded queues, a slow stage throttles the
+    input. Items of a failed batch are retried one by one."""
+
+    def __init__(self, stages: typing.Sequence[PipelineStage], buffer_size: int = 64):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = list(stages)
+        self.buffer_size = buffer_size
+        self._queues: list[queue.Queue] = [queue.Queue(maxsize=buffer_size) for _ in self.stages]
+        self._running_workers: list[int] = [stage.workers for stage in self.stages]
+        self._lock = threading.Lock()
+        self._closed: bool = False
+        self._threads: list[threading.Thread] = [
+            threading.Thread(target=self._work, args=(index,), name=f"pipeline-{stage.name}-{worker}", daemon=True)
+            for index, stage in enumerate(self.stages)
+            for worker in range(stage.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, item: typing.Any) -> concurrent.futures.Future:
+        """Put an item into the pipeline, blocks while the first stage queue is full."""
+        if self._closed:
+            raise RuntimeError("Pipeline is closed")
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._queues[0].put((future, item))
+        return future
+
+    def map(self, items: typing.Iterable[typing.Any]) -> typing.Iterator[typing.Any]:
+        """Outputs of the items in their order, with a bounded number of items in flight. Raises the exception of
+        the first failed item."""
+        pending: collections.deque[concurrent.futures.Future] = collections.deque()
+        for item in items:
+            pending.append(self.submit(item))
+            if len(pending) > self.buffer_size * len(self.stages):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _next_batch(self, index: int) -> list[tuple[concurrent.futures.Future, typing.Any]] | None:
+        stage: PipelineStage = self.stages[index]
+        inbox: queue.Queue = self._queues[index]
+        entry = inbox.get()
+        if entry is _STOP:
+            return None
+        batch = [entry]
+        deadline: float = time.monotonic() + stage.max_wait_ms / 1000
+        while len(batch) < stage.batch_size:
+            try:
+                entry = inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                # stop after this batch
+                inbox.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run_batch(self, stage: PipelineStage, batch: list[tuple[concurrent.futures.Future, typing.Any]]) -> list:
+        try:
+            outputs = stage.fn([item for _, item in batch])
+            if len(outputs) != len(batch):
+                raise RuntimeError(f"Stage `{stage.name}` returned {len(outputs)} outputs for {len(batch)} items")
+            return [(future, output, None) for (future, _), output in zip(batch, outputs)]
+        except Exception as exc:  # pylint: disable=broad-except
+            if len(batch) == 1:
+                return [(batch[0][0], None, exc)]
+            LOGGER.warning(f"Stage `{stage.name}` failed on a batch, retrying its items one by one", exc_info=True)
+            return [result for entry in batch for result in self._run_batch(stage, [entry])]
+
+    def _work(self, index: int) -> None:
+        stage: PipelineStage = self.stages[index]
+        is_last: bool = index == len(self.stages) - 1
+        while (batch := self._next_batch(index)) is not None:
+            for future, output, exc in self._run_batch(stage, batch):
+                if exc is not None:
+                    future.set_exception(exc)
+                elif is_last:
+                    future.set_result(output)
+                else:
+                    self._queues[index + 1].put((future, output))
+
+        with self._lock:
+            self._running_workers[index] -= 1
+            stopped: bool = self._running_workers[index] == 0
+        if not stopped:
+            # let the other workers of the stage see it
+            self._queues[index].put(_STOP)
+        elif not is_last:
+            self._queues[index + 1].put(_STOP)
+
+    def close(self) -> None:
+        """Finish the items in flight and stop the workers."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queues[0].put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self) -> "StagedPipeline":
+        return self
+
+    def __exit__(self, *exc_info: typing.Any) -> None:
+        self.close()
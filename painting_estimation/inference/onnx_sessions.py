@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import typing
+
+import numpy as np
+import onnxruntime
+
+from painting_estimation.settings import settings
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+class SessionProfile(typing.NamedTuple):
+    graph_optimization_level: onnxruntime.GraphOptimizationLevel = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    execution_mode: onnxruntime.ExecutionMode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    # `None` keeps the per-worker defaults of `ONNXModel`
+    intra_op_num_threads: int | None = None
+    inter_op_num_threads: int | None = None
+    enable_cpu_mem_arena: bool = True
+    # save the optimized graph to the cache directory and load it on the next start instead of optimizing again
+    cache_optimized_model: bool = True
+
+
+SESSION_PROFILES: dict[str, SessionProfile] = {
+    # ONNX Runtime defaults, nothing is cached
+    "default": SessionProfile(cache_optimized_model=False),
+    # single request latency: all graph optimizations, operators run one by one on all intra-op threads
+    "latency": SessionProfile(),
+    # batches from several requests: independent graph branches run in parallel as well
+    "throughput": SessionProfile(execution_mode=onnxruntime.ExecutionMode.ORT_PARALLEL, inter_op_num_threads=2),
+    # small machines: no memory arena, so activations are given back after every run
+    "low_memory": SessionProfile(enable_cpu_mem_arena=False, intra_op_num_threads=1),
+}
+
+
+def variant_path(model_path: pathlib.Path | str, variant: str | None) -> pathlib.Path:
+    """Path of a model variant, `efn.onnx` with variant `int8-dynamic` is `efn.int8-dynamic.onnx`."""
+    model_path = pathlib.Path(model_path)
+    if not variant or variant == "fp32":
+        return model_path
+    return model_path.with_name(f"{model_path.stem}.{variant}{model_path.suffix}")
+
+
+# offsets of the shared tensors in the weights file
+SHARED_WEIGHTS_ALIGNMENT: int = 64
+
+
+def shared_weights_path(model_path: pathlib.Path | str) -> pathlib.Path:
+    """Graph of the model with its weights stored apart, `efn.onnx` is split into `efn.shared.onnx` and its data."""
+    model_path = pathlib.Path(model_path)
+    return model_path.with_name(f"{model_path.stem}.shared{model_path.suffix}")
+
+
+class SharedWeights:
+    """Weights of a split model (`painting_estimation.model.shared_weights`) mapped read-only from its data file.
+
+    Sessions get the mapped arrays as initializers, which ONNX Runtime uses in place: all the sessions of all the
+    processes read the same pages of the OS page cache instead of every session owning a copy of the weights.
+    """
+
+    def __init__(self, graph_path: pathlib.Path | str):
+        self.graph_path = pathlib.Path(graph_path)
+        manifest: dict[str, dict] = json.loads(self.graph_path.with_name(f"{self.graph_path.name}.json").read_text())
+        data = np.memmap(self.graph_path.with_name(f"{self.graph_path.name}.data"), dtype=np.uint8, mode="r")
+        self.arrays: dict[str, np.ndarray] = {
+            name: np.ndarray(tensor["shape"], dtype=np.dtype(tensor["dtype"]), buffer=data, offset=tensor["offset"])
+            for name, tensor in manifest.items()
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def add_to(self, session_options: onnxruntime.SessionOptions) -> list[onnxruntime.OrtValue]:
+        """Add the weights to the session options, the returned values have to outlive the session."""
+        values: list[onnxruntime.OrtValue] = []
+        for name, array in self.arrays.items():
+            value = onnxruntime.OrtValue.ortvalue_from_numpy(array)
+            session_options.add_initializer(name, value)
+            values.append(value)
+        # pre-packed copies of the weights would be owned by every session again
+        session_options.add_session_config_entry("session.disable_prepacking", "1")
+        return values
+
+
+def cache_dir() -> pathlib.Path:
+    """`ONNX_CACHE_DIR`, or the user cache directory, the models directory may be read-only or under version control."""
+    if settings.onnx_cache_dir:
+        return pathlib.Path(settings.onnx_cache_dir)
+    return (
+        pathlib.Path(os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache")
+        / "painting_estimation"
+        / "onnx"
+    )
+
+
+def optimized_model_path(model_path: pathlib.Path | str, profile_name: str) -> pathlib.Path:
+    """Cached optimized graph of the model, models of different directories (versions) with the same file name get
+    different files."""
+    model_path = pathlib.Path(model_path)
+    path_hash: str = hashlib.sha1(str(model_path.resolve()).encode()).hexdigest()[:12]
+    return cache_dir() / f"{model_path.stem}.{path_hash}.{profile_name}.optimized{model_path.suffix}"
+
+
+def onnx_model_options(model_name: str) -> dict[str, str | None]:
+    """Session profile and model variant of a registry model from settings."""
+    return {
+        "profile": settings.onnx_profiles.get(model_name, settings.onnx_profile),
+        "variant": settings.onnx_variants.get(model_name),
+    }
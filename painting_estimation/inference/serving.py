@@ -1,21 +1,213 @@
+import asyncio
 import io
+import itertools
+import logging
+import threading
 import typing
 
 import numpy as np
 
-from painting_estimation.images.utils import cv2_image_from_byte_io
+from painting_estimation import models
+from painting_estimation.images.utils import DecodedImage, ImgSize, decode_image
+from painting_estimation.inference.batching import BatchingServing
+from painting_estimation.inference.cache import PredictionCache
+from painting_estimation.inference.executor import InferenceExecutor
 from painting_estimation.inference.inference import EnsembleServing, ModelServing
-from painting_estimation.model.effnet_model import SECOND_SERVING
+from painting_estimation.instrumentation import observe_prediction, time_stage
+from painting_estimation.model.registry import REGISTRY
+from painting_estimation.settings import settings
 
 
-SERVING: typing.Union[ModelServing, EnsembleServing] = SECOND_SERVING
+LOGGER: logging.Logger = logging.getLogger(__name__)
 
+EXECUTOR: InferenceExecutor = InferenceExecutor(
+    mode=settings.inference_executor,
+    max_workers=settings.inference_workers,
+    max_queue_depth=settings.inference_max_queue_depth,
+)
+
+
+def get_serving() -> typing.Union[ModelServing, EnsembleServing]:
+    """Active version of `settings.serving_model`, loaded on first use."""
+    return REGISTRY.get(settings.serving_model)
+
+
+BATCHER: BatchingServing | None = (
+    BatchingServing(
+        get_serving,
+        max_batch_size=settings.batch_max_size,
+        max_wait_ms=settings.batch_max_wait_ms,
+        executor=EXECUTOR,
+    )
+    if settings.batch_max_size > 1 and EXECUTOR.mode != "process"
+    else None
+)
+
+CACHE: PredictionCache | None = (
+    PredictionCache(
+        mode=settings.prediction_cache_mode,
+        max_entries=settings.prediction_cache_size,
+        ttl=settings.prediction_cache_ttl,
+        shared_url=settings.prediction_cache_url,
+    )
+    if settings.prediction_cache_size > 0
+    else None
+)
+
+
+# set once the serving model is warmed up in this process
+MODELS_READY: threading.Event = threading.Event()
+
+
+def warm_up() -> None:
+    """Load the serving model and run it on a blank image, so the first request doesn't pay for model loading,
+    session creation and first-run allocations."""
+    serving = get_serving()
+    serving.load()
+    size: ImgSize = serving.input_size or ImgSize(width=224, height=224)
+    serving(np.zeros((size.height, size.width, 3), dtype=np.uint8))
+    MODELS_READY.set()
+    LOGGER.info(f"Model `{settings.serving_model}` is warmed up")
 
-def predict_painting_price(byte_io: io.BytesIO) -> float:
-    rgb_numpy_image: np.ndarray = cv2_image_from_byte_io(byte_io=byte_io)
-    price: np.ndarray | float = SERVING(rgb_numpy_image)
 
+async def warm_up_async() -> None:
+    """`warm_up` off the event loop, in the pool processes when inference runs there."""
+    if EXECUTOR.mode != "process":
+        await asyncio.get_running_loop().run_in_executor(None, warm_up)
+        return
+
+    # best effort, a pool process may get several of these while another one gets none
+    await asyncio.gather(*(EXECUTOR.submit(warm_up) for _ in range(EXECUTOR.max_workers)))
+    MODELS_READY.set()
+
+
+def decode_upload(byte_io: io.BytesIO) -> DecodedImage:
+    """Decode the upload at no more than the resolution the active model needs."""
+    min_size: ImgSize | None = get_serving().input_size if settings.draft_decoding else None
+    with time_stage("decode"):
+        return decode_image(byte_io, min_size=min_size)
+
+
+def _check_price(price: np.ndarray | float) -> float:
     if not isinstance(price, float):
         raise ValueError("Price estimation should be of type float")
 
     return price
+
+
+def predict_painting_price(byte_io: io.BytesIO) -> float:
+    return predict_image_price(decode_upload(byte_io))
+
+
+def predict_image_price(image: DecodedImage) -> float:
+    return _check_price(get_serving()(image.array))
+
+
+def predict_decoded(image: DecodedImage) -> models.Predict:
+    return models.Predict(price=predict_image_price(image), **image.features)
+
+
+def predict_painting(byte_io: io.BytesIO) -> models.Predict:
+    """Price and image features computed from a single decode of the upload."""
+    return predict_decoded(decode_upload(byte_io))
+
+
+def _cache_key(image_key: str) -> str:
+    # predictions of another model (version) shouldn't be served after a hot swap
+    return f"{settings.serving_model}:{REGISTRY.active_version(settings.serving_model)}:{image_key}"
+
+
+async def predict_painting_async(data: bytes) -> models.Predict:
+    """Same as `predict_painting`, but runs in `EXECUTOR`, looks up `CACHE` first and batches the model call with
+    concurrent requests when enabled.
+
+    Raises `ExecutorOverloadedError` when too many requests are already in flight.
+    """
+    with EXECUTOR.admit():
+        cache_key: str | None = None
+        if CACHE is not None and CACHE.mode == "content":
+            cache_key = _cache_key(CACHE.content_key(data))
+            if (cached := await CACHE.aget(cache_key)) is not None:
+                observe_prediction(cached)
+                return cached
+
+        image: DecodedImage | None = None
+        if BATCHER is not None or (CACHE is not None and cache_key is None):
+            image = await EXECUTOR.submit(decode_upload, io.BytesIO(data))
+        if image is not None and CACHE is not None and cache_key is None:
+            cache_key = _cache_key(CACHE.perceptual_key(image.array))
+            if (cached := await CACHE.aget(cache_key)) is not None:
+                cached = cached.copy(update=image.features)
+                observe_prediction(cached)
+                return cached
+
+        prediction: models.Predict
+        if image is None:
+            prediction = await EXECUTOR.submit(predict_painting, io.BytesIO(data))
+        elif BATCHER is not None:
+            prediction = models.Predict(price=_check_price(await BATCHER(image.array)), **image.features)
+        else:
+            prediction = await EXECUTOR.submit(predict_decoded, image)
+
+        if CACHE is not None and cache_key is not None:
+            await CACHE.aset(cache_key, prediction)
+        observe_prediction(prediction)
+        return prediction
+
+
+def predict_named_images(items: typing.Sequence[tuple[str, bytes]]) -> list[models.BatchPredictItem]:
+    """Predict a batch of named uploads with as few model calls as the serving allows, an image failing to decode
+    or predict gets an `error` instead of failing the others."""
+    predictions: list[models.BatchPredictItem] = []
+    decoded: list[tuple[models.BatchPredictItem, DecodedImage]] = []
+    for name, data in items:
+        prediction = models.BatchPredictItem(name=name)
+        predictions.append(prediction)
+        try:
+            decoded.append((prediction, decode_upload(io.BytesIO(data))))
+        except Exception as exc:  # pylint: disable=broad-except
+            prediction.error = f"Failed to decode image: {exc}"
+    if not decoded:
+        return predictions
+
+    serving = get_serving()
+    arrays: list[np.ndarray] = [image.array for _, image in decoded]
+    try:
+        prices = serving.predict_images(arrays) if isinstance(serving, ModelServing) else list(map(serving, arrays))
+    except Exception:  # pylint: disable=broad-except
+        LOGGER.error("Failed to predict a batch, falling back to one image at a time", exc_info=True)
+        prices = [None] * len(arrays)
+
+    for (prediction, image), price in zip(decoded, prices):
+        try:
+            if price is None:
+                price = serving(image.array)
+            prediction.price = _check_price(price)
+        except Exception as exc:  # pylint: disable=broad-except
+            prediction.error = f"Failed to predict price: {exc}"
+            continue
+        for feature, value in image.features.items():
+            setattr(prediction, feature, value)
+    return predictions
+
+
+async def predict_many_async(
+    items: typing.Iterator[tuple[str, bytes]], batch_size: int | None = None
+) -> typing.AsyncIterator[models.BatchPredictItem]:
+    """Predict `(name, image bytes)` pairs in chunks of `batch_size`, yielding results chunk by chunk.
+
+    Items are pulled lazily, only one chunk of uploads is held in memory. Each chunk goes through `EXECUTOR`
+    admission, so batch jobs are shed together with single requests under overload.
+    """
+    loop = asyncio.get_running_loop()
+    batch_size = batch_size or settings.predict_batch_size
+    while chunk := await loop.run_in_executor(None, lambda: list(itertools.islice(items, batch_size))):
+        try:
+            predictions = await EXECUTOR.run(predict_named_images, chunk)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.error("Failed to predict a batch chunk", exc_info=True)
+            predictions = [models.BatchPredictItem(name=name, error=str(exc)) for name, _ in chunk]
+        for prediction in predictions:
+            if prediction.error is None:
+                observe_prediction(prediction)
+            yield prediction
@@ -0,0 +1,52 @@
+"""Prometheus metrics recorded right where the values are computed, by the serving pipeline itself.
+
+Metrics of the work done in `process` inference executor workers stay in those processes and aren't exported.
+"""
+import functools
+import math
+import typing
+
+from prometheus_client import Histogram, Summary
+
+from painting_estimation import models
+
+
+Stage = typing.Literal["decode", "preprocess", "onnx", "lightgbm", "encode"]
+
+ML_STAGE_LATENCY = Histogram(
+    "ml_stage_latency_seconds",
+    "Latency of the prediction pipeline stages, per call (a call may process a batch of images).",
+    ["stage"],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5],
+)
+ML_PREDICTION_LOG10 = Histogram(
+    "ml_prediction_log10",
+    "Distribution of logarithm base 10 of painting price prediction by model.",
+    buckets=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
+)
+ML_FEATURE_ASPECT = Histogram(
+    "ml_image_aspect",
+    "Distribution of input image aspect.",
+    buckets=[0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.4, 1.6, 1.8, 2.0, 2.2],
+)
+ML_FEATURE_MEAN_PIXEL = Summary("ml_feature_mean_pixel", "Mean value of input image pixels")
+
+
+@functools.cache
+def _stage_histogram(stage: Stage) -> typing.Any:
+    # resolving labels takes a lock and a dict lookup, children are reused instead
+    return ML_STAGE_LATENCY.labels(stage)
+
+
+def time_stage(stage: Stage) -> typing.ContextManager:
+    """Context manager (or decorator) observing the latency of a pipeline stage."""
+    return _stage_histogram(stage).time()
+
+
+def observe_prediction(prediction: models.Predict) -> None:
+    if prediction.price > 0:
+        ML_PREDICTION_LOG10.observe(math.log10(prediction.price))
+    if prediction.aspect:
+        ML_FEATURE_ASPECT.observe(prediction.aspect)
+    if prediction.mean_pixel:
+        ML_FEATURE_MEAN_PIXEL.observe(prediction.mean_pixel)
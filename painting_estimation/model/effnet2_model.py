@@ -1,18 +1,16 @@
 import pathlib
 
 import cv2
-import joblib
 import numpy as np
 
 from painting_estimation.images.preprocessing import ImagePreprocessor, ImgSize
-from painting_estimation.inference.inference import ModelServing, ONNXModel
+from painting_estimation.inference import feature_store
+from painting_estimation.inference.inference import LGBMPriceRegressor, ModelServing, ONNXModel
+from painting_estimation.inference.onnx_sessions import onnx_model_options
 
 
 MODELS_DIR = pathlib.Path(__file__).parents[2] / "models/3/"
 
-EFF_NET_ONNX_FEATURE_EXTRACTOR = ONNXModel(str(MODELS_DIR / "eff_net_b3.onnx.onnx"))
-LIGHT_GBM_REGR = joblib.load(str(MODELS_DIR / "lgbm.pkl"))
-
 
 EFF_NET_PREPROCESSOR = ImagePreprocessor(
     target_size=ImgSize(width=300, height=300),
@@ -28,14 +26,12 @@ EFF_NET_PREPROCESSOR = ImagePreprocessor(
 )
 
 
-def postprocessor(nn_output: np.ndarray) -> float:
-    lgbm = LIGHT_GBM_REGR
-    price = np.expm1(lgbm.predict(nn_output))[0]
-    return price
-
-
-THIRD_SERVING: ModelServing = ModelServing(
-    model=EFF_NET_ONNX_FEATURE_EXTRACTOR,
-    preprocessor=EFF_NET_PREPROCESSOR,
-    postprocessor=postprocessor,
-)
+def load_serving(models_dir: pathlib.Path = MODELS_DIR) -> ModelServing:
+    regressor = LGBMPriceRegressor(models_dir / "lgbm.pkl")
+    return ModelServing(
+        model=ONNXModel(models_dir / "eff_net_b3.onnx.onnx", **onnx_model_options("effnet_b3")),
+        preprocessor=EFF_NET_PREPROCESSOR,
+        postprocessor=regressor,
+        batch_postprocessor=regressor.predict_batch,
+        feature_store=feature_store.default_store(),
+    )
@@ -1,31 +1,26 @@
 import pathlib
 
-import joblib
 import numpy as np
 
 from painting_estimation.images.preprocessing import ImagePreprocessor, ImgSize
-from painting_estimation.inference.inference import ModelServing, ONNXModel
+from painting_estimation.inference import feature_store
+from painting_estimation.inference.inference import LGBMPriceRegressor, ModelServing, ONNXModel
+from painting_estimation.inference.onnx_sessions import onnx_model_options
 
 
 MODELS_DIR = pathlib.Path(__file__).parents[2] / "models/2/"
 
-
-def preprocessor(image: np.ndarray) -> np.ndarray:
-    preproc = ImagePreprocessor(
-        target_size=ImgSize(width=299, height=299), target_dim_order=(0, 1, 2), target_dtype=np.float32
-    )
-    image = preproc(image)
-    return image
-
-
-def postprocessor(nn_output: np.ndarray) -> float:
-    lgbm = joblib.load(str(MODELS_DIR / "lgb_new.pkl"))
-    price = np.expm1(lgbm.predict(nn_output))[0]
-    return price
+PREPROCESSOR = ImagePreprocessor(
+    target_size=ImgSize(width=299, height=299), target_dim_order=(0, 1, 2), target_dtype=np.float32
+)
 
 
-SECOND_SERVING: ModelServing = ModelServing(
-    model=ONNXModel(str(MODELS_DIR / "efn.onnx")),
-    preprocessor=preprocessor,
-    postprocessor=postprocessor,
-)
+def load_serving(models_dir: pathlib.Path = MODELS_DIR) -> ModelServing:
+    regressor = LGBMPriceRegressor(models_dir / "lgb_new.pkl")
+    return ModelServing(
+        model=ONNXModel(models_dir / "efn.onnx", **onnx_model_options("effnet")),
+        preprocessor=PREPROCESSOR,
+        postprocessor=regressor,
+        batch_postprocessor=regressor.predict_batch,
+        feature_store=feature_store.default_store(),
+    )
@@ -0,0 +1,18 @@
+import typing
+
+import numpy as np
+
+from painting_estimation.inference.inference import EnsembleServing, ModelServing
+
+
+def mean_log_price_aggregator(outputs: typing.Mapping[str, np.ndarray | float]) -> float:
+    """Geometric mean of the member prices, the members are trained on log prices."""
+    prices = [price for name, price in outputs.items() if name != "image"]
+    return float(np.expm1(np.mean(np.log1p(prices))))
+
+
+def build_serving(
+    members: typing.Mapping[str, ModelServing],
+    member_timeouts: typing.Union[float, typing.Mapping[str, float], None] = None,
+) -> EnsembleServing:
+    return EnsembleServing(models=members, aggregator=mean_log_price_aggregator, member_timeouts=member_timeouts)
@@ -1,32 +1,30 @@
 import pathlib
 
-import joblib
 import numpy as np
 
 from painting_estimation.images.preprocessing import ImagePreprocessor, ImgSize
-from painting_estimation.inference.inference import ModelServing, ONNXModel
+from painting_estimation.inference import feature_store
+from painting_estimation.inference.inference import LGBMPriceRegressor, ModelServing, ONNXModel
+from painting_estimation.inference.onnx_sessions import onnx_model_options
 
 
 MODELS_DIR = pathlib.Path(__file__).parents[2] / "models/1/"
 
-
-def preprocessor(image: np.ndarray) -> np.ndarray:
-    preproc = ImagePreprocessor(
-        target_size=ImgSize(width=299, height=299), target_dim_order=(0, 1, 2), target_dtype=np.float32
-    )
-    image = preproc(image)
-    return image
+PREPROCESSOR = ImagePreprocessor(
+    target_size=ImgSize(width=299, height=299), target_dim_order=(0, 1, 2), target_dtype=np.float32
+)
 
 
-def postprocessor(nn_output: np.ndarray) -> float:
-    lgbm = joblib.load(str(MODELS_DIR / "lgb.pkl"))
-    price = np.expm1(lgbm.predict(nn_output))[0]
-    price = price if price < 10000 else price * 1.5
-    return price
+def price_transform(prices: np.ndarray) -> np.ndarray:
+    return np.where(prices < 10000, prices, prices * 1.5)
 
 
-FIRST_SERVING: ModelServing = ModelServing(
-    model=ONNXModel(str(MODELS_DIR / "incept_v3_1.onnx")),
-    preprocessor=preprocessor,
-    postprocessor=postprocessor,
-)
+def load_serving(models_dir: pathlib.Path = MODELS_DIR) -> ModelServing:
+    regressor = LGBMPriceRegressor(models_dir / "lgb.pkl", price_transform=price_transform)
+    return ModelServing(
+        model=ONNXModel(models_dir / "incept_v3_1.onnx", **onnx_model_options("inception")),
+        preprocessor=PREPROCESSOR,
+        postprocessor=regressor,
+        batch_postprocessor=regressor.predict_batch,
+        feature_store=feature_store.default_store(),
+    )
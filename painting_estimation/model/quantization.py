@@ -0,0 +1,162 @@
+"""INT8 variants of the ONNX feature extractors and their accuracy vs latency report.
+
+Quantize `efn.onnx` of the `effnet` model into `efn.int8-dynamic.onnx` / `efn.int8-static.onnx`:
+    python -m painting_estimation.model.quantization quantize effnet --mode dynamic
+    python -m painting_estimation.model.quantization quantize effnet --mode static --images-dir data/pics/paintings
+
+Compare variants on a held-out image set (prices are compared with the first variant):
+    python -m painting_estimation.model.quantization report effnet --images-dir <dir> --variants fp32 int8-static
+
+A variant is then selected per model with `ONNX_VARIANTS='{"effnet": "int8-static"}'`. Quantization needs the `onnx`
+extras installed.
+"""
+import argparse
+import json
+import logging
+import pathlib
+import time
+import typing
+
+import numpy as np
+
+from painting_estimation.images.utils import IMAGE_SUFFIXES, decode_image
+from painting_estimation.inference.inference import ModelServing, ONNXModel
+from painting_estimation.inference.onnx_sessions import variant_path
+from painting_estimation.model.registry import REGISTRY
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+def onnx_serving(name: str) -> ModelServing:
+    serving = REGISTRY.get(name)
+    if not isinstance(serving, ModelServing) or not isinstance(serving.model, ONNXModel):
+        raise ValueError(f"Model `{name}` isn't served with an ONNX model")
+    return serving
+
+
+def load_images(images_dir: pathlib.Path, serving: ModelServing, limit: int | None = None) -> list[np.ndarray]:
+    paths = sorted(path for path in images_dir.iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)[:limit]
+    if not paths:
+        raise ValueError(f"No images found in {images_dir}")
+    return [decode_image(path.read_bytes(), min_size=serving.input_size).array for path in paths]
+
+
+def quantize(
+    name: str, mode: typing.Literal["dynamic", "static"], images: typing.Sequence[np.ndarray] = ()
+) -> pathlib.Path:
+    # pylint: disable=import-outside-toplevel
+    from onnxruntime import quantization
+
+    serving: ModelServing = onnx_serving(name)
+    model: ONNXModel = typing.cast(ONNXModel, serving.model)
+    target_path: pathlib.Path = variant_path(model.source_path, f"int8-{mode}")
+    LOGGER.info(f"Quantizing {model.source_path} to {target_path}")
+
+    if mode == "dynamic":
+        quantization.quantize_dynamic(model.source_path, target_path, weight_type=quantization.QuantType.QUInt8)
+        return target_path
+
+    if not images:
+        raise ValueError("Static quantization needs calibration images")
+
+    class CalibrationReader(quantization.CalibrationDataReader):
+        def __init__(self):
+            self.input_name: str = ONNXModel(model.source_path).load().get_inputs()[0].name
+            self.nn_inputs = iter(serving.preprocess(image) for image in images)
+
+        def get_next(self) -> dict[str, np.ndarray] | None:
+            nn_input = next(self.nn_inputs, None)
+            return None if nn_input is None else {self.input_name: nn_input}
+
+    quantization.quantize_static(
+        model.source_path,
+        target_path,
+        CalibrationReader(),
+        quant_format=quantization.QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=quantization.QuantType.QUInt8,
+        weight_type=quantization.QuantType.QInt8,
+    )
+    return target_path
+
+
+def report(name: str, images: typing.Sequence[np.ndarray], variants: typing.Sequence[str]) -> list[dict]:
+    base: ModelServing = onnx_serving(name)
+    base_model: ONNXModel = typing.cast(ONNXModel, base.model)
+
+    rows: list[dict] = []
+    reference_prices: np.ndarray | None = None
+    for variant in variants:
+        serving = ModelServing(
+            model=ONNXModel(base_model.source_path, profile=base_model.profile_name, variant=variant),
+            preprocessor=base.preprocessor,
+            postprocessor=base.postprocessor,
+            batch_postprocessor=base.batch_postprocessor,
+        )
+        serving.load()
+
+        latencies: list[float] = []
+        prices: list[float] = []
+        for image in images:
+            started_at = time.perf_counter()
+            prices.append(typing.cast(float, serving(image)))
+            latencies.append(time.perf_counter() - started_at)
+
+        variant_prices = np.asarray(prices)
+        if reference_prices is None:
+            reference_prices = variant_prices
+        log_errors = np.abs(np.log1p(variant_prices) - np.log1p(reference_prices))
+        rows.append(
+            {
+                "variant": variant,
+                "size_mb": pathlib.Path(typing.cast(ONNXModel, serving.model).model_path).stat().st_size / 2**20,
+                "p50_ms": float(np.percentile(latencies, 50) * 1000),
+                "p95_ms": float(np.percentile(latencies, 95) * 1000),
+                "mean_abs_log_error": float(log_errors.mean()),
+                "max_rel_error": float(np.max(np.abs(variant_prices / reference_prices - 1))),
+            }
+        )
+    return rows
+
+
+def _format_report(rows: list[dict]) -> str:
+    columns = list(rows[0])
+    lines = ["\t".join(columns)]
+    lines += [
+        "\t".join(f"{row[column]:.4f}" if isinstance(row[column], float) else row[column] for column in columns)
+        for row in rows
+    ]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["quantize", "report"])
+    parser.add_argument("model", help="model name in the registry, e.g. `effnet`")
+    parser.add_argument("--mode", choices=["dynamic", "static"], default="static")
+    parser.add_argument("--images-dir", type=pathlib.Path, help="calibration or held-out images")
+    parser.add_argument("--limit", type=int, default=None, help="use at most this number of images")
+    parser.add_argument("--variants", nargs="+", default=["fp32", "int8-dynamic", "int8-static"])
+    parser.add_argument("--output", type=pathlib.Path, help="save the report as JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(name)s :: %(levelname)s :: %(message)s")
+
+    images: list[np.ndarray] = []
+    if args.images_dir is not None:
+        images = load_images(args.images_dir, onnx_serving(args.model), limit=args.limit)
+
+    if args.command == "quantize":
+        print(quantize(args.model, args.mode, images))
+        return
+
+    if not images:
+        parser.error("report needs --images-dir")
+    rows = report(args.model, images, args.variants)
+    print(_format_report(rows))
+    if args.output is not None:
+        args.output.write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import json
+import logging
+import pathlib
+import threading
+import time
+import typing
+
+from painting_estimation.inference.inference import EnsembleServing, ModelServing
+from painting_estimation.model import dummy_model, effnet2_model, effnet_model, ensemble_model, inception_model
+from painting_estimation.settings import settings
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+MODELS_DIR = pathlib.Path(__file__).parents[2] / "models"
+
+Serving = typing.Union[ModelServing, EnsembleServing]
+ServingLoader = typing.Callable[[pathlib.Path], Serving]
+
+
+class ModelRegistry:
+    """Loads every model version once and hands out the active one by name.
+
+    Version `N` of a model is loaded from `models/N` with the loader registered for its name. Switching the active
+    version (`activate`) loads the new version first and only then swaps it in, so in-flight requests are served by
+    the old one. When `active_models_file` is set, it is polled for a JSON mapping `{"<name>": <version>}` and the
+    versions listed there are activated in the background, which lets every gunicorn worker hot-swap a model without
+    restart.
+    """
+
+    def __init__(
+        self,
+        models_dir: pathlib.Path = MODELS_DIR,
+        active_models_file: pathlib.Path | None = None,
+        refresh_interval: float = 5.0,
+    ):
+        self.models_dir = models_dir
+        self.active_models_file = active_models_file
+        self.refresh_interval = refresh_interval
+        self._loaders: dict[str, ServingLoader] = {}
+        self._active: dict[str, int] = {}
+        self._loaded: dict[tuple[str, int], Serving] = {}
+        self._lock = threading.Lock()
+        self._refreshed_at: float = 0.0
+        self._active_models_mtime: float | None = None
+
+    def register(self, name: str, loader: ServingLoader, version: int) -> None:
+        """Register `loader` for the model `name` and make `version` its default active version."""
+        self._loaders[name] = loader
+        self._active[name] = version
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._loaders)
+
+    def active_version(self, name: str) -> int:
+        self._maybe_refresh()
+        return self._active[name]
+
+    def loaded_versions(self, name: str) -> list[int]:
+        return sorted(version for loaded_name, version in self._loaded if loaded_name == name)
+
+    def get(self, name: str, version: int | None = None) -> Serving:
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model `{name}`, registered models: {self.names}")
+        if version is None:
+            version = self.active_version(name)
+
+        if (serving := self._loaded.get((name, version))) is not None:
+            return serving
+
+        with self._lock:
+            if (serving := self._loaded.get((name, version))) is None:
+                model_dir = self.models_dir / str(version)
+                LOGGER.info(f"Loading model `{name}` version {version} from {model_dir}")
+                serving = self._loaders[name](model_dir)
+                self._loaded[(name, version)] = serving
+        return serving
+
+    def activate(self, name: str, version: int) -> Serving:
+        serving = self.get(name, version)
+        if self._active.get(name) != version:
+            LOGGER.info(f"Switching model `{name}` from version {self._active.get(name)} to {version}")
+            self._active[name] = version
+        return serving
+
+    def unload(self, name: str, version: int) -> None:
+        if self._active.get(name) == version:
+            raise ValueError(f"Can't unload active version {version} of model `{name}`")
+        with self._lock:
+            self._loaded.pop((name, version), None)
+
+    def _maybe_refresh(self) -> None:
+        if self.active_models_file is None or time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        self._refreshed_at = time.monotonic()
+
+        try:
+            mtime: float = self.active_models_file.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._active_models_mtime:
+            return
+        self._active_models_mtime = mtime
+
+        try:
+            active_models: dict = json.loads(self.active_models_file.read_text())
+        except ValueError:
+            LOGGER.error(f"Failed to parse active models from {self.active_models_file}", exc_info=True)
+            return
+        for name, version in active_models.items():
+            if name in self._loaders and self._active.get(name) != int(version):
+                threading.Thread(target=self._activate_safely, args=(name, int(version)), daemon=True).start()
+
+    def _activate_safely(self, name: str, version: int) -> None:
+        try:
+            self.activate(name, version)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.error(f"Failed to activate model `{name}` version {version}", exc_info=True)
+
+
+class ActiveModels(typing.Mapping[str, Serving]):
+    """Read-only mapping of model names to their currently active versions in the registry."""
+
+    def __init__(self, registry: ModelRegistry, names: typing.Sequence[str]):
+        self.registry = registry
+        self.names = list(names)
+
+    def __getitem__(self, name: str) -> Serving:
+        if name not in self.names:
+            raise KeyError(name)
+        return self.registry.get(name)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+REGISTRY: ModelRegistry = ModelRegistry(
+    active_models_file=pathlib.Path(settings.active_models_file) if settings.active_models_file else None
+)
+REGISTRY.register("dummy", lambda _: dummy_model.DUMMY_SERVING, version=0)
+REGISTRY.register("inception", inception_model.load_serving, version=1)
+REGISTRY.register("effnet", effnet_model.load_serving, version=2)
+REGISTRY.register("effnet_b3", effnet2_model.load_serving, version=3)
+# members are resolved on every call, so hot-swapping a member model also updates the ensemble
+REGISTRY.register(
+    "ensemble",
+    lambda _: ensemble_model.build_serving(
+        ActiveModels(REGISTRY, settings.ensemble_members), member_timeouts=settings.ensemble_member_timeout
+    ),
+    version=0,
+)
@@ -0,0 +1,79 @@
+"""Split the weights of ONNX feature extractors out of their graphs, so API workers share one copy of them.
+
+    python -m painting_estimation.model.shared_weights effnet
+
+writes `efn.shared.onnx` (the graph, initializers stored as external data), `efn.shared.onnx.data` (the raw weights)
+and `efn.shared.onnx.json` (their offsets, types and shapes) next to `efn.onnx` of the `effnet` model, or of its
+variant from `ONNX_VARIANTS`. `ONNXModel` picks the shared graph up automatically, see `onnx_sessions.SharedWeights`.
+Splitting needs the `onnx` extras installed, serving doesn't.
+"""
+import argparse
+import json
+import logging
+import pathlib
+import typing
+
+import numpy as np
+
+from painting_estimation.inference.inference import ONNXModel
+from painting_estimation.inference.onnx_sessions import SHARED_WEIGHTS_ALIGNMENT, shared_weights_path
+from painting_estimation.model.quantization import onnx_serving
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+# small tensors (shapes, scales) stay in the graph
+MIN_SHARED_BYTES: int = 1024
+
+
+def split_weights(model_path: pathlib.Path | str, min_bytes: int = MIN_SHARED_BYTES) -> pathlib.Path:
+    """Write the shared graph, weights and manifest of the model, returns the path of the graph."""
+    # pylint: disable=import-outside-toplevel
+    import onnx
+    from onnx import external_data_helper, numpy_helper
+
+    graph_path: pathlib.Path = shared_weights_path(model_path)
+    data_path = graph_path.with_name(f"{graph_path.name}.data")
+    model = onnx.load(str(model_path))
+
+    manifest: dict[str, dict] = {}
+    offset: int = 0
+    with data_path.open("wb") as data_file:
+        for tensor in model.graph.initializer:
+            array: np.ndarray = numpy_helper.to_array(tensor)
+            if array.nbytes < min_bytes or array.dtype == object:
+                continue
+            # aligned rows of the memory map are aligned in memory, as the CPU kernels expect
+            offset += -offset % SHARED_WEIGHTS_ALIGNMENT
+            data_file.seek(offset)
+            data_file.write(np.ascontiguousarray(array).tobytes())
+            manifest[tensor.name] = {
+                "offset": offset,
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+            }
+            external_data_helper.set_external_data(tensor, data_path.name, offset=offset, length=array.nbytes)
+            for field in ("raw_data", "float_data", "double_data", "int32_data", "int64_data", "uint64_data"):
+                tensor.ClearField(field)
+            tensor.data_location = onnx.TensorProto.EXTERNAL
+            offset += array.nbytes
+
+    onnx.save(model, str(graph_path))
+    graph_path.with_name(f"{graph_path.name}.json").write_text(json.dumps(manifest))
+    LOGGER.info(f"Wrote {len(manifest)} shared tensors ({offset / 2**20:.1f} MB) of {model_path} to {data_path}")
+    return graph_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", nargs="+", help="model names in the registry, e.g. `effnet`")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(name)s :: %(levelname)s :: %(message)s")
+
+    for name in args.models:
+        model: ONNXModel = typing.cast(ONNXModel, onnx_serving(name).model)
+        print(split_weights(model.model_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,3 +5,10 @@ class Predict(pydantic.BaseModel):
     price: float = 7000
     aspect: float | None = None
     mean_pixel: float | None = None
+
+
+class BatchPredictItem(Predict):
+    """Prediction for one image of a batch, `error` is set instead of failing the whole batch."""
+
+    name: str
+    error: str | None = None
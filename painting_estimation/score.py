@@ -0,0 +1,356 @@
+"""Offline price scoring of image directories, e.g. to re-price the whole catalogue with a new model version.
+
+    python -m painting_estimation.score data/catalogue --output prices.jsonl
+    python -m painting_estimation.score manifest.txt --output prices.parquet --model effnet --version 3
+
+The input is a directory (walked recursively) or a manifest with one image path per line, relative to the manifest.
+Images are decoded in a process pool and predicted in batches, by the staged pipeline of the model (preprocessing,
+CNN and LightGBM head batched separately) when it has one. Results are appended to the output (`.jsonl`, `.csv` or
+`.parquet`, the latter needs the `score` extras) after every batch. Processed files are recorded in
+`<output>.checkpoint`, so an interrupted run picks up where it stopped when started again with the same output and
+model version (another model or version needs another output).
+
+With `FEATURE_STORE_DIR` set, image embeddings are stored with their paths, and a model version with a retrained
+LightGBM head re-scores them without decoding images or running the CNN (image features are left empty):
+    python -m painting_estimation.score --from-features --output prices.jsonl --model effnet --version 4
+"""
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import json
+import logging
+import pathlib
+import time
+import typing
+
+import numpy as np
+
+from painting_estimation.images.utils import IMAGE_SUFFIXES, DecodedImage, ImgSize, decode_image
+from painting_estimation.inference.executor import process_pool
+from painting_estimation.inference.feature_store import FeatureStore
+from painting_estimation.inference.inference import ModelServing, StagedPipeline
+from painting_estimation.model.registry import REGISTRY, Serving
+from painting_estimation.settings import settings
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+FIELDS: tuple[str, ...] = ("path", "price", "aspect", "mean_pixel", "error", "model", "version")
+
+
+def list_images(source: pathlib.Path) -> list[pathlib.Path]:
+    """Images of a directory, or the paths listed in a manifest file."""
+    if source.is_dir():
+        return sorted(path for path in source.rglob("*") if path.suffix.lower() in IMAGE_SUFFIXES and path.is_file())
+    lines = (line.strip() for line in source.read_text().splitlines())
+    return [source.parent / line for line in lines if line and not line.startswith("#")]
+
+
+def decode_file(path: pathlib.Path, min_size: ImgSize | None) -> tuple[DecodedImage | None, str | None]:
+    try:
+        return decode_image(path.read_bytes(), min_size=min_size), None
+    except Exception as exc:  # pylint: disable=broad-except
+        return None, f"Failed to decode image: {exc}"
+
+
+class ResultWriter:
+    """Appends result records to a JSONL, CSV or Parquet file, flushing them after every batch."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.format = path.suffix.lstrip(".").lower()
+        if self.format not in ("jsonl", "csv", "parquet"):
+            raise ValueError(f"Unsupported output format `{self.format}`, use .jsonl, .csv or .parquet")
+
+        self._file: typing.TextIO | None = None
+        self._csv_writer: csv.DictWriter | None = None
+        self._parquet_writer: typing.Any = None
+        if self.format == "parquet":
+            try:
+                import pyarrow  # pylint: disable=import-outside-toplevel,unused-import
+            except ImportError as exc:
+                raise ImportError("Parquet output requires `pyarrow`, install `score` extras") from exc
+            # parquet files can't be appended to, every run writes its own part of the dataset directory
+            self.path.mkdir(parents=True, exist_ok=True)
+        else:
+            is_new: bool = not path.exists() or path.stat().st_size == 0
+            self._file = path.open("a", newline="")
+            if self.format == "csv":
+                self._csv_writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+                if is_new:
+                    self._csv_writer.writeheader()
+
+    def write(self, records: list[dict]) -> None:
+        if self.format == "parquet":
+            self._write_parquet(records)
+            return
+
+        assert self._file is not None
+        if self._csv_writer is not None:
+            self._csv_writer.writerows(records)
+        else:
+            self._file.writelines(json.dumps(record) + "\n" for record in records)
+        self._file.flush()
+
+    def _write_parquet(self, records: list[dict]) -> None:
+        # pylint: disable=import-outside-toplevel
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(records, schema=self._parquet_schema())
+        if self._parquet_writer is None:
+            part: int = len(list(self.path.glob("part-*.parquet")))
+            self._parquet_writer = pq.ParquetWriter(self.path / f"part-{part:05d}.parquet", table.schema)
+        self._parquet_writer.write_table(table)
+
+    @staticmethod
+    def _parquet_schema() -> typing.Any:
+        import pyarrow as pa  # pylint: disable=import-outside-toplevel
+
+        return pa.schema(
+            [
+                ("path", pa.string()),
+                ("price", pa.float64()),
+                ("aspect", pa.float64()),
+                ("mean_pixel", pa.float64()),
+                ("error", pa.string()),
+                ("model", pa.string()),
+                ("version", pa.int64()),
+            ]
+        )
+
+    def close(self) -> None:
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        if self._file is not None:
+            self._file.close()
+
+
+class Checkpoint:
+    """Scored paths with the model version which scored them, `<path>\t<model>\t<version>` per line, appended only
+    after their results are written. An output holds the prices of a single model version, so a checkpoint of another
+    model or version can't be resumed."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.done: set[str] = set()
+        self.models: set[tuple[str, int]] = set()
+        for line in path.read_text().splitlines() if path.exists() else []:
+            scored_path, model_name, version = line.rsplit("\t", 2)
+            self.done.add(scored_path)
+            self.models.add((model_name, int(version)))
+        self._file: typing.TextIO = path.open("a")
+
+    def check(self, model_name: str, version: int) -> None:
+        if other_models := self.models - {(model_name, version)}:
+            scored_by = ", ".join(f"`{name}` version {scored_version}" for name, scored_version in sorted(other_models))
+            raise ValueError(
+                f"Checkpoint {self.path} was written by {scored_by}, not `{model_name}` version {version}, "
+                "use another output or checkpoint"
+            )
+
+    def add(self, paths: typing.Iterable[str], model_name: str, version: int) -> None:
+        self.models.add((model_name, version))
+        self._file.writelines(f"{path}\t{model_name}\t{version}\n" for path in paths)
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def staged_pipeline(serving: Serving, batch_size: int) -> StagedPipeline | None:
+    """Staged pipeline of the serving, none for ensembles, models without a batch postprocessor and ones storing
+    features, the pipeline doesn't store them with their paths."""
+    if not isinstance(serving, ModelServing) or serving.batch_postprocessor is None or serving.uses_feature_store:
+        return None
+    return serving.staged_pipeline(model_batch_size=batch_size, regressor_batch_size=batch_size)
+
+
+def predict_batch(
+    serving: Serving,
+    images: list[DecodedImage],
+    names: list[str] | None = None,
+    pipeline: StagedPipeline | None = None,
+) -> list[tuple[float | None, str | None]]:
+    """`(price, error)` of every image. Only the failed images of a pipeline get an error, a failed batch of a serving
+    fails all of them."""
+    arrays: list[np.ndarray] = [image.array for image in images]
+    if pipeline is not None:
+        results: list[tuple[float | None, str | None]] = []
+        for future in [pipeline.submit(array) for array in arrays]:
+            try:
+                results.append((float(future.result()), None))
+            except Exception as exc:  # pylint: disable=broad-except
+                results.append((None, f"Failed to predict price: {exc}"))
+        return results
+
+    try:
+        if isinstance(serving, ModelServing):
+            prices = list(serving.predict_images(arrays, names=names))
+        else:
+            prices = [serving(array) for array in arrays]
+    except Exception as exc:  # pylint: disable=broad-except
+        LOGGER.error("Failed to predict a batch", exc_info=True)
+        return [(None, f"Failed to predict price: {exc}")] * len(images)
+    return [(float(price), None) for price in prices]
+
+
+def score(
+    paths: typing.Sequence[pathlib.Path],
+    writer: ResultWriter,
+    checkpoint: Checkpoint,
+    model_name: str,
+    version: int | None = None,
+    batch_size: int = 32,
+    workers: int | None = None,
+) -> int:
+    """Score all the images not in the checkpoint yet, returns the number of scored images."""
+    version = REGISTRY.active_version(model_name) if version is None else version
+    checkpoint.check(model_name, version)
+    todo = [path for path in paths if str(path) not in checkpoint.done]
+    LOGGER.info(f"Scoring {len(todo)} images, {len(paths) - len(todo)} are already in the checkpoint")
+    if not todo:
+        return 0
+
+    serving: Serving = REGISTRY.get(model_name, version)
+    min_size: ImgSize | None = serving.input_size if settings.draft_decoding else None
+    pipeline: StagedPipeline | None = staged_pipeline(serving, batch_size)
+
+    started_at: float = time.perf_counter()
+    scored: int = 0
+    with process_pool(workers) as pool, pipeline if pipeline is not None else contextlib.nullcontext():
+        pending: collections.deque[tuple[pathlib.Path, concurrent.futures.Future]] = collections.deque()
+        queue_size: int = 4 * batch_size
+        paths_iter = iter(todo)
+
+        while True:
+            # keep a bounded number of decoded images in flight, the catalogue may not fit in memory
+            while len(pending) < queue_size and (path := next(paths_iter, None)) is not None:
+                pending.append((path, pool.submit(decode_file, path, min_size)))
+            if not pending:
+                break
+
+            batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+            records: list[dict] = []
+            decoded: list[tuple[dict, DecodedImage]] = []
+            for path, future in batch:
+                image, error = future.result()
+                record = dict.fromkeys(FIELDS) | {
+                    "path": str(path),
+                    "error": error,
+                    "model": model_name,
+                    "version": version,
+                }
+                records.append(record)
+                if image is not None:
+                    decoded.append((record, image))
+
+            if decoded:
+                results = predict_batch(
+                    serving,
+                    [image for _, image in decoded],
+                    names=[record["path"] for record, _ in decoded],
+                    pipeline=pipeline,
+                )
+                for (record, image), (price, error) in zip(decoded, results):
+                    if price is None:
+                        record["error"] = error
+                    else:
+                        record.update(price=price, **image.features)
+
+            writer.write(records)
+            checkpoint.add((record["path"] for record in records), model_name, version)
+            scored += len(records)
+            LOGGER.info(f"Scored {scored}/{len(todo)} images, {scored / (time.perf_counter() - started_at):.1f} img/s")
+
+    elapsed: float = time.perf_counter() - started_at
+    LOGGER.info(f"Scored {scored} images in {elapsed:.1f}s, {scored / elapsed:.1f} img/s")
+    return scored
+
+
+def rescore_features(
+    writer: ResultWriter,
+    checkpoint: Checkpoint,
+    model_name: str,
+    version: int | None = None,
+    batch_size: int = 4096,
+) -> int:
+    """Score the images stored in the feature store of the model with its postprocessor only, returns the number of
+    scored images. Only images stored with a name (path) are scored."""
+    version = REGISTRY.active_version(model_name) if version is None else version
+    checkpoint.check(model_name, version)
+    serving: Serving = REGISTRY.get(model_name, version)
+    if not isinstance(serving, ModelServing) or not serving.uses_feature_store:
+        raise ValueError(f"Model `{model_name}` version {version} doesn't use a feature store, set FEATURE_STORE_DIR")
+    store: FeatureStore = typing.cast(FeatureStore, serving.feature_store)
+    extractor: str = typing.cast(str, serving.extractor_version)
+
+    started_at: float = time.perf_counter()
+    scored: int = 0
+    for _, names, features in store.iter_batches(extractor, batch_size=batch_size, named_only=True):
+        todo = [index for index, name in enumerate(names) if name not in checkpoint.done]
+        if not todo:
+            continue
+        records: list[dict] = [
+            dict.fromkeys(FIELDS) | {"path": names[index], "model": model_name, "version": version} for index in todo
+        ]
+        try:
+            prices = serving.postprocess_batch(features[todo])
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.error("Failed to predict a batch", exc_info=True)
+            for record in records:
+                record["error"] = f"Failed to predict price: {exc}"
+        else:
+            for record, price in zip(records, prices):
+                record["price"] = float(price)
+
+        writer.write(records)
+        checkpoint.add((record["path"] for record in records), model_name, version)
+        scored += len(records)
+
+    elapsed: float = time.perf_counter() - started_at
+    LOGGER.info(f"Re-scored {scored} stored images in {elapsed:.1f}s, {scored / max(elapsed, 1e-9):.1f} img/s")
+    return scored
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", type=pathlib.Path, nargs="?", help="image directory or manifest file")
+    parser.add_argument("--output", type=pathlib.Path, required=True, help=".jsonl, .csv or .parquet")
+    parser.add_argument("--model", default=settings.serving_model, help="model name in the registry")
+    parser.add_argument("--version", type=int, default=None, help="model version, the active one by default")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None, help="decoding processes, CPU count by default")
+    parser.add_argument("--checkpoint", type=pathlib.Path, help="`<output>.checkpoint` by default")
+    parser.add_argument(
+        "--from-features", action="store_true", help="re-score the images of the feature store instead of `source`"
+    )
+    args = parser.parse_args()
+    if args.source is None and not args.from_features:
+        parser.error("`source` is required unless `--from-features` is given")
+    logging.basicConfig(level=logging.INFO, format="%(name)s :: %(levelname)s :: %(message)s")
+
+    writer = ResultWriter(args.output)
+    checkpoint = Checkpoint(args.checkpoint or args.output.with_name(f"{args.output.name}.checkpoint"))
+    try:
+        if args.from_features:
+            rescore_features(writer, checkpoint, model_name=args.model, version=args.version)
+        else:
+            score(
+                list_images(args.source),
+                writer,
+                checkpoint,
+                model_name=args.model,
+                version=args.version,
+                batch_size=args.batch_size,
+                workers=args.workers,
+            )
+    finally:
+        writer.close()
+        checkpoint.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import typing
+
 import pydantic
 
 
@@ -5,6 +7,78 @@ class Settings(pydantic.BaseSettings):
     debug: bool = True
     telegram_token: str = "===WRONG_TELEGRAM_TOKEN==="
     ml_api: str = "https://velvet-wolves-art-expert-api.fly.dev/predict"
+    # how the bot prices images: the ML API over HTTP, over the API Unix socket, or the serving model in the bot itself
+    bot_prediction_backend: typing.Literal["http", "uds", "inprocess"] = "http"
+    # Unix domain socket the API listens on besides TCP, when set
+    api_uds: str | None = None
+    # HTTP client of the bot, connections are pooled and kept alive between calls
+    ml_api_timeout: float = 30.0
+    http_max_connections: int = 32
+    http_max_keepalive_connections: int = 16
+    # style transfer API, each attempt gets `style_transfer_timeout` seconds, failed ones are retried with backoff
+    style_transfer_api: str = "https://hexii-neural-style-transfer.hf.space/api/predict"
+    style_transfer_timeout: float = 180.0
+    style_transfer_max_concurrency: int = 4
+    style_transfer_retries: int = 2
+    # images the bot replies with, and the ones it sends to the ML API to price, longer side limited to max dimension
+    bot_image_format: typing.Literal["png", "jpeg", "webp"] = "jpeg"
+    bot_image_quality: int = 90
+    bot_image_max_dimension: int | None = 1280
+    bot_pricing_max_dimension: int | None = 640
+    image_encoder_backend: typing.Literal["cv2", "pil"] = "cv2"
+    # port of the bot Prometheus metrics endpoint, disabled by default
+    bot_metrics_port: int | None = None
+    # response delay of the local style transfer stub (`painting_estimation.bot.stub_server`)
+    style_transfer_stub_delay: float = 1.0
+    # gunicorn workers of the API, `preload_models` loads the models once in the master to share them copy-on-write
+    api_workers: int = 4
+    preload_models: bool = True
+    # load and run the serving model once on API startup, `/ready` reports 503 until it's done
+    warm_up_models: bool = True
+    # ONNX Runtime threads per worker, intra-op threads default to CPU count divided between the API workers
+    onnx_intra_op_threads: int | None = None
+    onnx_inter_op_threads: int = 1
+    # ONNX Runtime session profile ("default", "latency", "throughput" or "low_memory") for all or specific models,
+    # and model file variants ("fp32", "int8-dynamic", "int8-static") per model name
+    onnx_profile: str = "latency"
+    onnx_profiles: dict[str, str] = {}
+    onnx_variants: dict[str, str] = {}
+    # sessions of the models split with `painting_estimation.model.shared_weights` map their weights from the shared
+    # file instead of copying them, at the cost of ONNX Runtime's pre-packed weights
+    onnx_share_weights: bool = True
+    # where optimized ONNX graphs are cached, `$XDG_CACHE_HOME/painting_estimation/onnx` by default
+    onnx_cache_dir: str | None = None
+    # name of the model from the registry used by the API
+    serving_model: str = "effnet"
+    # members of the "ensemble" model and the time each of them gets before the ensemble proceeds without it
+    ensemble_members: list[str] = ["inception", "effnet", "effnet_b3"]
+    ensemble_member_timeout: float | None = None
+    # JSON file `{"<model name>": <version>}` polled by every worker to hot-swap model versions
+    active_models_file: str | None = None
+    # decode JPEG uploads right at the model input resolution instead of full size
+    draft_decoding: bool = True
+    # cache of predictions keyed by uploaded bytes ("content") or a perceptual hash of the image, 0 size disables it
+    prediction_cache_mode: typing.Literal["content", "perceptual"] = "content"
+    prediction_cache_size: int = 1024
+    prediction_cache_ttl: float = 3600.0
+    # redis URL of a prediction cache shared by all API workers
+    prediction_cache_url: str | None = None
+    # directory of the persistent CNN embeddings store, only the LightGBM heads run on stored images
+    feature_store_dir: str | None = None
+    # LightGBM heads predict with the pickled models or with trees compiled to NumPy arrays (`<model>.npz` when it's
+    # exported, compiled on load otherwise), the latter is faster for single images only
+    lgbm_backend: typing.Literal["lightgbm", "numpy"] = "lightgbm"
+    # dynamic micro-batching of /predict requests, batch size 1 disables batching
+    batch_max_size: int = 8
+    batch_max_wait_ms: float = 5.0
+    # images per model call of /predict/batch, and files (form fields) a multipart upload of it may have
+    predict_batch_size: int = 16
+    predict_batch_max_files: int = 10000
+    # where CPU-bound inference runs: on the event loop ("inline"), in a thread or a process pool
+    inference_executor: typing.Literal["inline", "thread", "process"] = "thread"
+    inference_workers: int = 2
+    # requests in flight above this limit are rejected with 503
+    inference_max_queue_depth: int = 32
 
 
 settings: Settings = Settings()
@@ -1,9 +1,51 @@
 import pathlib
+import shutil
 
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
 
 from painting_estimation.api.main import APP, INSTRUMENTATOR
+from painting_estimation.model.registry import REGISTRY
+from painting_estimation.settings import settings
+
+
+@pytest.fixture(autouse=True, scope="session")
+def onnx_cache_dir(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    # optimized graphs of the tests don't end up in the user cache
+    settings.onnx_cache_dir = str(tmp_path_factory.mktemp("onnx_cache"))
+    return pathlib.Path(settings.onnx_cache_dir)
+
+
+def build_feature_extractor(path: pathlib.Path, features: int = 1280) -> pathlib.Path:
+    """Stub of an image feature extractor: a random projection of the mean pixel of NHWC images."""
+    import onnx  # pylint: disable=import-outside-toplevel
+
+    weights = np.random.default_rng(0).random((3, features), dtype=np.float32) / 100
+    graph = onnx.helper.make_graph(
+        [
+            onnx.helper.make_node("ReduceMean", ["input_1"], ["mean"], axes=[1, 2], keepdims=0),
+            onnx.helper.make_node("MatMul", ["mean", "weights"], ["features"]),
+        ],
+        "feature_extractor",
+        [onnx.helper.make_tensor_value_info("input_1", onnx.TensorProto.FLOAT, ["N", 299, 299, 3])],
+        [onnx.helper.make_tensor_value_info("features", onnx.TensorProto.FLOAT, ["N", features])],
+        [onnx.numpy_helper.from_array(weights, "weights")],
+    )
+    model = onnx.helper.make_model(graph, opset_imports=[onnx.helper.make_opsetid("", 13)], ir_version=8)
+    onnx.save(model, path)
+    return path
+
+
+@pytest.fixture(autouse=True, scope="session")
+def models_dir(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    # ONNX models aren't under version control, `effnet` gets a stub extractor and its real LightGBM head
+    models_dir = tmp_path_factory.mktemp("models")
+    (models_dir / "2").mkdir()
+    build_feature_extractor(models_dir / "2" / "efn.onnx")
+    shutil.copy(REGISTRY.models_dir / "2" / "lgb_new.pkl", models_dir / "2" / "lgb_new.pkl")
+    REGISTRY.models_dir = models_dir
+    return models_dir
 
 
 @pytest.fixture
@@ -0,0 +1,25 @@
+import os
+import pathlib
+import shutil
+
+from painting_estimation.bot.assets import AssetStore
+from painting_estimation.bot.style_transfer import base64_decode
+
+
+def test_assets_reload_on_change(tmp_path: pathlib.Path) -> None:
+    fixture = pathlib.Path(__file__).parent / "fixtures" / "test_image.png"
+    for name in ("artists/a.jpg", "paintings/a_pic.jpg"):
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        shutil.copy(fixture, tmp_path / name)
+    store = AssetStore({"a": "Artist"}, tmp_path / "artists", tmp_path / "paintings", refresh_interval=0)
+
+    artist = store.random()
+    assert artist.name == "Artist"
+    assert artist.label.ndim == 3
+    assert base64_decode(artist.style_payload.split(",", 1)[1]) == artist.style
+    assert store.get("a") is artist
+
+    style_path = tmp_path / "paintings" / "a_pic.jpg"
+    style_path.write_bytes(b"new style")
+    os.utime(style_path, (0, 0))
+    assert store.get("a").style == b"new style"
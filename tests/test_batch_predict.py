@@ -0,0 +1,67 @@
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from painting_estimation.settings import settings
+
+
+def _predictions(response) -> list[dict]:
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_multipart(test_image: bytes, test_client: TestClient) -> None:
+    files = [("files", (f"{idx}.png", test_image)) for idx in range(3)] + [("files", ("broken.png", b"not an image"))]
+    predictions = _predictions(test_client.post("/predict/batch", files=files))
+
+    assert [prediction["name"] for prediction in predictions] == ["0.png", "1.png", "2.png", "broken.png"]
+    assert all(prediction["error"] is None and prediction["aspect"] for prediction in predictions[:3])
+    assert len({prediction["price"] for prediction in predictions[:3]}) == 1
+    assert predictions[3]["error"]
+
+
+def test_batch_multipart_above_starlette_limit(test_client: TestClient) -> None:
+    # Starlette parses at most 1000 files of a form by default
+    files = [("files", (f"{idx}.png", b"not an image")) for idx in range(1001)]
+    assert len(_predictions(test_client.post("/predict/batch", files=files))) == 1001
+
+
+def test_batch_multipart_max_files(test_client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "predict_batch_max_files", 2)
+    files = [("files", (f"{idx}.png", b"not an image")) for idx in range(3)]
+    assert test_client.post("/predict/batch", files=files).status_code == 400
+
+
+def test_batch_zip(test_image: bytes, test_client: TestClient) -> None:
+    body = io.BytesIO()
+    with zipfile.ZipFile(body, "w") as archive:
+        archive.writestr("a.png", test_image)
+        archive.writestr("notes.txt", "skipped")
+        archive.writestr("b/c.png", test_image)
+    predictions = _predictions(
+        test_client.post("/predict/batch", content=body.getvalue(), headers={"content-type": "application/zip"})
+    )
+    assert [prediction["name"] for prediction in predictions] == ["a.png", "b/c.png"]
+
+
+def test_batch_tar(test_image: bytes, test_client: TestClient) -> None:
+    body = io.BytesIO()
+    with tarfile.open(fileobj=body, mode="w:gz") as archive:
+        info = tarfile.TarInfo("a.png")
+        info.size = len(test_image)
+        archive.addfile(info, io.BytesIO(test_image))
+    predictions = _predictions(
+        test_client.post("/predict/batch", content=body.getvalue(), headers={"content-type": "application/gzip"})
+    )
+    assert [prediction["name"] for prediction in predictions] == ["a.png"]
+    assert predictions[0]["error"] is None
+
+
+def test_batch_invalid_body(test_client: TestClient) -> None:
+    response = test_client.post("/predict/batch", content=b"garbage", headers={"content-type": "application/zip"})
+    assert response.status_code == 400
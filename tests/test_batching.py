@@ -0,0 +1,49 @@
+import asyncio
+
+import numpy as np
+
+from painting_estimation.inference.batching import BatchingServing
+from painting_estimation.inference.inference import ModelServing
+
+
+class CountingModel:
+    def __init__(self):
+        self.batch_sizes: list[int] = []
+
+    def __call__(self, nn_input: np.ndarray) -> np.ndarray:
+        self.batch_sizes.append(nn_input.shape[0])
+        return nn_input.reshape(nn_input.shape[0], -1)
+
+
+def _serving(model: CountingModel) -> ModelServing:
+    return ModelServing(
+        model=model,
+        preprocessor=lambda image: np.expand_dims(image.astype(np.float32), 0),
+        postprocessor=lambda nn_output: float(nn_output.sum(axis=1)[0]),
+        batch_postprocessor=lambda nn_output: nn_output.sum(axis=1),
+    )
+
+
+def test_batching_flushes_on_max_batch_size() -> None:
+    model = CountingModel()
+    serving = _serving(model)
+    batcher = BatchingServing(lambda: serving, max_batch_size=4, max_wait_ms=1000)
+
+    async def run() -> list:
+        return await asyncio.gather(*(batcher(np.full((2, 2), i)) for i in range(8)))
+
+    prices = asyncio.run(run())
+    assert prices == [4.0 * i for i in range(8)]
+    assert model.batch_sizes == [4, 4]
+
+
+def test_batching_flushes_on_max_wait() -> None:
+    model = CountingModel()
+    serving = _serving(model)
+    batcher = BatchingServing(lambda: serving, max_batch_size=16, max_wait_ms=1)
+
+    async def run() -> list:
+        return await asyncio.gather(*(batcher(np.ones((2, 2))) for _ in range(3)))
+
+    assert asyncio.run(run()) == [4.0, 4.0, 4.0]
+    assert sum(model.batch_sizes) == 3
@@ -0,0 +1,32 @@
+import copy
+import json
+
+import pytest
+
+from painting_estimation.benchmarks import suite
+
+
+def test_benchmark_run_and_compare() -> None:
+    cases = suite.build_cases(["decode", "preprocess", "lightgbm"], image_sizes=[64], batch_sizes=[1, 2])
+    assert [case.key for case in cases] == [
+        "decode/size=64/batch=1",
+        "preprocess/size=64/batch=1",
+        "preprocess/size=64/batch=2",
+        "lightgbm/lightgbm/size=None/batch=1",
+        "lightgbm/lightgbm/size=None/batch=2",
+        "lightgbm/numpy/size=None/batch=1",
+        "lightgbm/numpy/size=None/batch=2",
+    ]
+    report = json.loads(json.dumps(suite.run(cases[:2], repeat=3, warmup=1)))
+    result = report["results"][0]
+    assert 0 < result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+    assert result["peak_traced_mb"] > 0
+
+    slower = copy.deepcopy(report)
+    slower["results"][1]["p50_ms"] *= 2
+    assert [row["regression"] for row in suite.compare(report, slower)] == [False, True]
+
+
+def test_unknown_stage() -> None:
+    with pytest.raises(ValueError):
+        suite.build_cases(["resize"])
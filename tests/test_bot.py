@@ -0,0 +1,94 @@
+import asyncio
+import time
+import types
+
+import numpy as np
+import pytest
+
+from painting_estimation import models
+from painting_estimation.bot import main
+
+
+STAGE_DELAY: float = 0.2
+
+
+async def _async(value):
+    return value
+
+
+class FakeMessage:
+    def __init__(self, photo_file: "FakeFile"):
+        self.photo = [types.SimpleNamespace(get_file=self._get_file)]
+        self.photo_file = photo_file
+        self.replies: list[tuple[float, str]] = []
+
+    async def _get_file(self) -> "FakeFile":
+        return self.photo_file
+
+    async def reply_text(self, text: str) -> None:
+        self.replies.append((time.monotonic(), text))
+
+    async def reply_photo(self, _: bytes, caption: str) -> None:
+        self.replies.append((time.monotonic(), caption))
+
+
+class FakeFile:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.downloads: int = 0
+
+    async def download_to_memory(self, out) -> None:
+        self.downloads += 1
+        out.write(self.content)
+
+
+def test_estimate_price_runs_stages_concurrently(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def fetch_price(image: bytes) -> models.Predict:
+        await asyncio.sleep(STAGE_DELAY)
+        # styled images are priced as arrays
+        return models.Predict(price=1000 if isinstance(image, bytes) else 2000)
+
+    async def style_transfer(content: bytes, style: bytes | str, *_: float) -> bytes:
+        await asyncio.sleep(STAGE_DELAY)
+        return content + b"-styled"
+
+    monkeypatch.setattr(main, "fetch_price", fetch_price)
+    monkeypatch.setattr(main, "STYLE_TRANSFER", style_transfer)
+    monkeypatch.setattr(main, "insert_label", lambda label, image: np.zeros((8, 8, 3), dtype=np.uint8))
+
+    photo, profile_photo = FakeFile(b"photo"), FakeFile(b"profile")
+    message = FakeMessage(photo)
+
+    async def get_profile_photos():
+        return types.SimpleNamespace(photos=[[types.SimpleNamespace(get_file=lambda: _async(profile_photo))]])
+
+    user = types.SimpleNamespace(full_name="Test", get_profile_photos=get_profile_photos)
+    update = types.SimpleNamespace(effective_user=user, message=message)
+
+    started_at = time.monotonic()
+    asyncio.run(main.estimate_price(update, None))
+
+    assert photo.downloads == 1
+    assert len(message.replies) == 3
+    # price and both style transfers overlap, the artist's one is followed by its price
+    assert message.replies[-1][0] - started_at < 2.5 * STAGE_DELAY
+    assert "1000$" in message.replies[0][1]
+    assert "2000$" in message.replies[1][1]
+
+
+def test_style_transfer_handlers(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[tuple] = []
+
+    async def style_transfer(content: bytes, style: bytes | str, *weights: float) -> bytes:
+        calls.append((content, style, *weights))
+        return content + b"-styled"
+
+    monkeypatch.setattr(main, "STYLE_TRANSFER", style_transfer)
+    monkeypatch.setattr(main, "insert_label", lambda label, image: np.zeros((8, 8, 3), dtype=np.uint8))
+    artist = main.ArtistAssets("Artist", np.zeros((4, 4, 3), dtype=np.uint8), b"style", "data:style")
+
+    assert asyncio.run(main.style_transfer(b"photo", b"profile")) == b"photo-styled"
+    assert asyncio.run(main.artist_style_transfer(b"photo", artist)).shape == (8, 8, 3)
+    (_, style, content_weight, style_weight), (_, artist_style, artist_content_weight, artist_style_weight) = calls
+    assert style == b"profile" and 0.75 <= content_weight <= 1.25 and 1.0 <= style_weight <= 2.0
+    assert artist_style == "data:style" and 0.5 <= artist_content_weight <= 1.5 and 1.0 <= artist_style_weight <= 3.0
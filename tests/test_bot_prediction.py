@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import numpy as np
+import pytest
+
+from painting_estimation import models
+from painting_estimation.bot.prediction import HttpPrediction, InProcessPrediction, build_backend
+from painting_estimation.settings import settings
+
+
+def test_http_prediction_encodes_arrays() -> None:
+    uploads: list[bytes] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        uploads.append(request.read())
+        return httpx.Response(200, json={"price": 123.0})
+
+    async def run() -> models.Predict:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await HttpPrediction(client, "http://api/predict")(np.zeros((2000, 1000, 3), dtype=np.uint8))
+
+    assert asyncio.run(run()).price == 123.0
+    # JPEG magic bytes, downscaled to a few KB
+    assert b"\xff\xd8\xff" in uploads[0] and len(uploads[0]) < 50_000
+
+
+def test_http_prediction_falls_back_on_errors() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("refused", request=request)
+
+    async def run() -> models.Predict:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await HttpPrediction(client, "http://api/predict")(b"image")
+
+    assert asyncio.run(run()) == models.Predict()
+
+
+def test_inprocess_prediction(test_image: bytes) -> None:
+    from painting_estimation.images.utils import decode_image  # pylint: disable=import-outside-toplevel
+
+    backend = InProcessPrediction()
+    from_bytes = asyncio.run(backend(test_image))
+    from_array = asyncio.run(backend(decode_image(test_image).array))
+    assert from_bytes.price == pytest.approx(from_array.price)
+    assert from_bytes.aspect == from_array.aspect
+
+
+def test_uds_backend_requires_socket(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "api_uds", None)
+    with pytest.raises(ValueError):
+        build_backend("uds")
+    monkeypatch.setattr(settings, "api_uds", "/tmp/api.sock")
+    assert isinstance(build_backend("uds"), HttpPrediction)
@@ -0,0 +1,45 @@
+import time
+from io import BytesIO
+
+import cv2
+
+from painting_estimation import models
+from painting_estimation.images.utils import cv2_image_from_byte_io
+from painting_estimation.inference.cache import MemoryCache, PredictionCache
+
+
+def test_memory_cache_lru_and_ttl() -> None:
+    cache = MemoryCache(max_entries=2, ttl=0.05)
+    cache.set("a", models.Predict(price=1))
+    cache.set("b", models.Predict(price=2))
+    assert cache.get("a") is not None
+    cache.set("c", models.Predict(price=3))
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_prediction_cache_keys_and_listeners(test_image: bytes) -> None:
+    lookups: list[bool] = []
+    cache = PredictionCache(max_entries=8)
+    cache.listeners.append(lookups.append)
+
+    key = cache.content_key(test_image)
+    assert cache.get(key) is None
+    cache.set(key, models.Predict(price=42))
+    assert cache.get(key) == models.Predict(price=42)
+    assert lookups == [False, True]
+
+    image = cv2_image_from_byte_io(BytesIO(test_image))
+    resized = cv2.resize(image, dsize=(image.shape[1] // 2, image.shape[0] // 2), interpolation=cv2.INTER_AREA)
+    assert cache.perceptual_key(image) == cache.perceptual_key(resized)
+    assert cache.perceptual_key(image) != cache.perceptual_key(image[::-1])
+
+
+def test_predict_endpoint_uses_cache(test_image: bytes, test_client) -> None:
+    first = test_client.post("/predict", files={"file": ("test_image.png", test_image)})
+    second = test_client.post("/predict", files={"file": ("test_image.png", test_image)})
+    assert first.json() == second.json()
+    assert "ml_prediction_cache_hits_total" in test_client.get("/metrics").text
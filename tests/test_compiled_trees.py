@@ -0,0 +1,36 @@
+import pathlib
+
+import lightgbm
+import numpy as np
+
+from painting_estimation.inference.compiled_trees import CompiledTrees
+from painting_estimation.inference.inference import LGBMPriceRegressor
+
+
+MODEL_PATH = pathlib.Path(__file__).parents[1] / "models" / "2" / "lgb_new.pkl"
+
+
+def test_compiled_trees_match_lightgbm_with_missing_values(tmp_path: pathlib.Path) -> None:
+    rng = np.random.default_rng(0)
+    features = rng.random((500, 6))
+    features[rng.random(features.shape) < 0.1] = np.nan
+    features[rng.random(features.shape) < 0.1] = 0.0
+    target = np.nan_to_num(features[:, 0]) * 3 + np.isnan(features[:, 1]) - (features[:, 2] == 0)
+    model = lightgbm.LGBMRegressor(n_estimators=20, num_leaves=15, min_child_samples=5, verbose=-1)
+    model.fit(features, target)
+
+    compiled = CompiledTrees.from_lightgbm(model)
+    compiled.save(tmp_path / "model.npz")
+    for trees in (compiled, CompiledTrees.load(tmp_path / "model.npz")):
+        np.testing.assert_allclose(trees.predict(features), model.predict(features), atol=1e-9)
+        # a single row takes the bit mask path
+        np.testing.assert_allclose(trees.predict(features[:1]), model.predict(features[:1]), atol=1e-9)
+
+
+def test_numpy_backend_matches_lightgbm() -> None:
+    features = np.random.default_rng(1).random((10, 1280), dtype=np.float32)
+    regressor = LGBMPriceRegressor(MODEL_PATH, backend="numpy")
+    assert isinstance(regressor.lgbm, CompiledTrees)
+    expected = LGBMPriceRegressor(MODEL_PATH, backend="lightgbm").predict_batch(features)
+    np.testing.assert_allclose(regressor.predict_batch(features), expected, rtol=1e-9)
+    assert np.isclose(regressor(features[:1]), expected[0], rtol=1e-9)
@@ -0,0 +1,52 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from painting_estimation.images.encoding import ImageEncoder
+from painting_estimation.images.utils import ImgSize, decode_image
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    byte_io = BytesIO()
+    Image.fromarray(np.random.randint(0, 255, (height, width, 3), dtype=np.uint8)).save(byte_io, format="JPEG")
+    return byte_io.getvalue()
+
+
+def test_draft_decoding_keeps_model_resolution() -> None:
+    image = decode_image(_jpeg(4000, 3000), min_size=ImgSize(width=299, height=299))
+    assert image.size == ImgSize(width=500, height=375)
+    assert image.source_size == ImgSize(width=4000, height=3000)
+    assert image.aspect == 4000 / 3000
+
+
+def test_mean_pixel_doesnt_depend_on_draft_scale() -> None:
+    # smooth image with sides which aren't multiples of the DCT block, so the scaled edge blocks are partial
+    gradient = np.linspace(0, 255, 437 * 3, dtype=np.float32).reshape(1, 437, 3)
+    byte_io = BytesIO()
+    Image.fromarray(np.repeat(gradient, 331, axis=0).astype(np.uint8)).save(byte_io, format="JPEG", quality=95)
+    full = decode_image(byte_io.getvalue())
+
+    for scale in (2, 4, 8):
+        image = decode_image(byte_io.getvalue(), min_size=ImgSize(width=437 // scale, height=331 // scale))
+        assert image.size.width == -(-437 // scale)
+        assert image.mean_pixel == pytest.approx(full.mean_pixel, abs=0.25)
+
+
+def test_full_decoding(test_image: bytes) -> None:
+    image = decode_image(test_image, min_size=ImgSize(width=10, height=10))
+    assert image.size == image.source_size
+    assert image.array.dtype == np.uint8
+
+
+@pytest.mark.parametrize("image_format", ["png", "jpeg", "webp"])
+@pytest.mark.parametrize("backend", ["cv2", "pil"])
+def test_encoder(test_image: bytes, image_format: str, backend: str) -> None:
+    image = decode_image(test_image).array
+    encoder = ImageEncoder(image_format, quality=95, max_dimension=100, backend=backend)
+    decoded = decode_image(encoder(image))
+
+    assert max(decoded.size) == 100
+    assert decoded.aspect == pytest.approx(image.shape[1] / image.shape[0], rel=0.02)
+    assert Image.open(BytesIO(encoder(image))).format == image_format.upper()
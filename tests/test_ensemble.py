@@ -0,0 +1,122 @@
+import threading
+import time
+import typing
+
+import numpy as np
+
+from painting_estimation.images.preprocessing import ImagePreprocessor
+from painting_estimation.images.utils import ImgSize
+from painting_estimation.inference.inference import EnsembleServing, ModelServing
+from painting_estimation.model.ensemble_model import mean_log_price_aggregator
+
+
+class CountingPreprocessor:
+    def __init__(self):
+        self.calls: int = 0
+
+    def __call__(self, image: np.ndarray) -> np.ndarray:
+        self.calls += 1
+        return image
+
+
+def _member(preprocessor: CountingPreprocessor, price: float, delay: float = 0.0) -> ModelServing:
+    def model(nn_input: np.ndarray) -> np.ndarray:
+        time.sleep(delay)
+        return nn_input
+
+    return ModelServing(model=model, preprocessor=preprocessor, postprocessor=lambda _: price)
+
+
+def test_ensemble_shares_preprocessing() -> None:
+    preprocessor = CountingPreprocessor()
+    ensemble = EnsembleServing(
+        models={"first": _member(preprocessor, 99.0), "second": _member(preprocessor, 9999.0)},
+        aggregator=mean_log_price_aggregator,
+    )
+    assert np.isclose(ensemble(np.zeros((4, 4, 3))), 999.0)
+    assert preprocessor.calls == 1
+
+
+def test_ensemble_skips_slow_members() -> None:
+    ensemble = EnsembleServing(
+        models={
+            "fast": _member(CountingPreprocessor(), 100.0),
+            "slow": _member(CountingPreprocessor(), 1.0, delay=1.0),
+        },
+        aggregator=mean_log_price_aggregator,
+        member_timeouts={"slow": 0.05},
+    )
+    started_at = time.monotonic()
+    assert np.isclose(ensemble(np.zeros((4, 4, 3))), 100.0)
+    assert time.monotonic() - started_at < 0.5
+
+
+def test_ensemble_doesnt_queue_calls_behind_blocked_member() -> None:
+    release = threading.Event()
+    calls: list[float] = []
+
+    def blocking_model(nn_input: np.ndarray) -> np.ndarray:
+        calls.append(time.monotonic())
+        release.wait(timeout=5.0)
+        return nn_input
+
+    ensemble = EnsembleServing(
+        models={
+            "fast": _member(CountingPreprocessor(), 100.0),
+            "blocked": ModelServing(
+                model=blocking_model, preprocessor=CountingPreprocessor(), postprocessor=lambda _: 1.0
+            ),
+        },
+        aggregator=mean_log_price_aggregator,
+        member_timeouts={"blocked": 0.05},
+        member_workers=1,
+    )
+    try:
+        started_at = time.monotonic()
+        for _ in range(5):
+            assert np.isclose(ensemble(np.zeros((4, 4, 3))), 100.0)
+        # only the first call waited for the timeout, the blocked member got no more calls
+        assert time.monotonic() - started_at < 0.5
+        assert len(calls) == 1
+    finally:
+        release.set()
+
+    # the member is back once its call finished
+    time.sleep(0.05)
+    assert ensemble(np.zeros((4, 4, 3))) < 100.0
+    assert len(calls) == 2
+
+
+class FailingMembers(typing.Mapping[str, ModelServing]):
+    """Members like `ActiveModels` resolves them, `broken` fails to load."""
+
+    def __init__(self, members: dict[str, ModelServing]):
+        self.members = members
+
+    def __getitem__(self, name: str) -> ModelServing:
+        if name == "broken":
+            raise FileNotFoundError("models/0/broken.onnx")
+        return self.members[name]
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter([*self.members, "broken"])
+
+    def __len__(self) -> int:
+        return len(self.members) + 1
+
+
+def test_ensemble_skips_members_failing_to_load() -> None:
+    ensemble = EnsembleServing(
+        models=FailingMembers({"first": _member(CountingPreprocessor(), 100.0)}), aggregator=mean_log_price_aggregator
+    )
+    ensemble.load()
+    assert ensemble.input_size is None
+    assert np.isclose(ensemble(np.zeros((4, 4, 3))), 100.0)
+
+
+def test_equal_image_preprocessors() -> None:
+    def build() -> ImagePreprocessor:
+        return ImagePreprocessor(target_size=ImgSize(299, 299), target_dim_order=(0, 1, 2), target_dtype=np.float32)
+
+    assert build() == build()
+    assert len({build(), build()}) == 1
@@ -0,0 +1,30 @@
+import asyncio
+import time
+
+import pytest
+
+from painting_estimation.inference.executor import ExecutorOverloadedError, InferenceExecutor
+
+
+def test_executor_runs_off_event_loop() -> None:
+    executor = InferenceExecutor(mode="thread", max_workers=2, max_queue_depth=4)
+    assert asyncio.run(executor.run(pow, 2, 10)) == 1024
+    executor.shutdown()
+
+
+def test_executor_rejects_when_queue_is_full() -> None:
+    executor = InferenceExecutor(mode="thread", max_workers=1, max_queue_depth=2)
+
+    async def run() -> list:
+        return await asyncio.gather(*(executor.run(time.sleep, 0.05) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert sum(isinstance(result, ExecutorOverloadedError) for result in results) == 1
+    assert executor.in_flight == 0
+    executor.shutdown()
+
+
+def test_inline_executor() -> None:
+    executor = InferenceExecutor(mode="inline", max_queue_depth=0)
+    with pytest.raises(ExecutorOverloadedError):
+        asyncio.run(executor.run(pow, 2, 10))
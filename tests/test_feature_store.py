@@ -0,0 +1,87 @@
+import asyncio
+import pathlib
+
+import numpy as np
+
+from painting_estimation.images.preprocessing import ImagePreprocessor, ImgSize
+from painting_estimation.inference.batching import BatchingServing
+from painting_estimation.inference.feature_store import FeatureStore, image_key
+from painting_estimation.inference.inference import ModelServing, ONNXModel
+
+
+class CountingONNXModel(ONNXModel):
+    fingerprint = "fake.onnx:0"
+
+    def __init__(self):
+        super().__init__("fake.onnx")
+        self.batch_sizes: list[int] = []
+
+    def __call__(self, nn_input: np.ndarray) -> np.ndarray:
+        self.batch_sizes.append(nn_input.shape[0])
+        return nn_input.reshape(nn_input.shape[0], -1)[:, :4]
+
+
+def _serving(model: CountingONNXModel, store: FeatureStore, scale: float = 1.0) -> ModelServing:
+    return ModelServing(
+        model=model,
+        preprocessor=ImagePreprocessor(
+            target_size=ImgSize(width=4, height=4), target_dim_order=(0, 1, 2), target_dtype=np.float32
+        ),
+        postprocessor=lambda features: float(features.sum()) * scale,
+        batch_postprocessor=lambda features: features.sum(axis=1) * scale,
+        feature_store=store,
+    )
+
+
+def test_feature_store_put_get_and_iterate(tmp_path: pathlib.Path) -> None:
+    store = FeatureStore(tmp_path, initial_rows=2)
+    features = np.arange(15, dtype=np.float32).reshape(5, 3)
+    keys = [f"key{i}" for i in range(5)]
+    store.put_many(keys[:3], "v1", features[:3], names=["a", None, "c"])
+    store.put_many(keys, "v1", features + 100)
+    store.put_many(["key0"], "v1", features[:1], names=["a copy"])
+    assert store.count("v1") == 5
+    assert store.get("missing", "v1") is None
+    assert store.get("key0", "v2") is None
+
+    reopened = FeatureStore(tmp_path)
+    # already stored keys keep their features
+    np.testing.assert_array_equal(reopened.get("key1", "v1"), features[1])
+    np.testing.assert_array_equal(reopened.get("key4", "v1"), features[4] + 100)
+    batches = list(reopened.iter_batches("v1", batch_size=2, named_only=True))
+    assert sorted(name for _, names, _ in batches for name in names) == ["a", "a copy", "c"]
+    np.testing.assert_array_equal(np.concatenate([batch for *_, batch in batches])[-1], features[2])
+    store.close()
+    reopened.close()
+
+
+def test_serving_runs_the_model_once_per_image(tmp_path: pathlib.Path) -> None:
+    model = CountingONNXModel()
+    serving = _serving(model, FeatureStore(tmp_path))
+    first, second = np.full((8, 8, 3), 10, np.uint8), np.full((8, 8, 3), 20, np.uint8)
+
+    price: float = serving(first)
+    assert serving(first) == price
+    assert serving.predict_images([first, second]) == [price, serving(second)]
+    assert model.batch_sizes == [1, 1]
+    assert image_key(first) != image_key(second)
+
+    # a retrained head reuses the stored features
+    retrained = _serving(model, FeatureStore(tmp_path), scale=2.0)
+    assert retrained(first) == 2 * price
+    assert model.batch_sizes == [1, 1]
+
+
+def test_batching_skips_stored_images(tmp_path: pathlib.Path) -> None:
+    model = CountingONNXModel()
+    serving = _serving(model, FeatureStore(tmp_path))
+    batcher = BatchingServing(lambda: serving, max_batch_size=4, max_wait_ms=1)
+    images = [np.full((8, 8, 3), i, np.uint8) for i in range(3)]
+
+    async def run() -> list:
+        return await asyncio.gather(*(batcher(image) for image in images))
+
+    prices = asyncio.run(run())
+    assert model.batch_sizes == [3]
+    assert asyncio.run(run()) == prices
+    assert model.batch_sizes == [3]
@@ -2,8 +2,8 @@ from io import BytesIO
 
 import numpy as np
 
-from painting_estimation.images.insertion import insert_image
-from painting_estimation.images.utils import cv2_image_from_byte_io
+from painting_estimation.images.insertion import insert_image, shape_mask
+from painting_estimation.images.utils import ImgSize, build_circle_shape, cv2_image_from_byte_io
 
 
 def test_insertion(test_image: bytes) -> None:
@@ -12,3 +12,20 @@ def test_insertion(test_image: bytes) -> None:
     assert inserted_img.shape == image.shape
     assert inserted_img.dtype == image.dtype
     assert np.sum(np.all(inserted_img - image)) / np.sum(image) <= 0.15
+
+
+def test_circle_insertion(test_image: bytes) -> None:
+    image = cv2_image_from_byte_io(BytesIO(test_image))
+    label = np.zeros((40, 30, 3), dtype=np.uint8)
+    label[..., [0, 2]] = 255
+    inserted_img = insert_image(label, image, insertion_shape="circle")
+    by_contour = insert_image(label, image, contour_to_insert=build_circle_shape(label))
+
+    changed = np.all(inserted_img == (255, 0, 255), axis=-1)
+    ys, xs = np.nonzero(changed)
+    # only the circle in the bottom right corner is touched
+    assert abs((xs.max() - xs.min()) - (ys.max() - ys.min())) <= 1
+    assert xs.min() > image.shape[1] / 2 and ys.min() > image.shape[0] / 2
+    assert np.mean(np.abs(by_contour.astype(int) - inserted_img)) < 0.5
+    assert shape_mask("circle", ImgSize(width=10, height=12)) is shape_mask("circle", ImgSize(width=10, height=12))
+
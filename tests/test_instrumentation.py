@@ -0,0 +1,28 @@
+from io import BytesIO
+
+import cv2
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from painting_estimation.images.utils import cv2_image_from_byte_io
+
+
+def _sample(name: str, labels: dict | None = None) -> float:
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def test_predict_records_stages_and_prediction(test_image: bytes, test_client: TestClient):
+    stages = ["decode", "preprocess", "onnx", "lightgbm"]
+    before = {stage: _sample("ml_stage_latency_seconds_count", {"stage": stage}) for stage in stages}
+    predictions_before = _sample("ml_prediction_log10_count")
+
+    # an image no other test predicts, so the prediction cache misses
+    image = cv2_image_from_byte_io(BytesIO(test_image))[:, ::-1]
+    image_bytes = cv2.imencode(".png", cv2.cvtColor(image, cv2.COLOR_RGB2BGR))[1].tobytes()
+    response = test_client.post("/predict", files={'file': ("flipped.png", image_bytes)})
+    assert response.status_code == 200
+
+    for stage in stages:
+        assert _sample("ml_stage_latency_seconds_count", {"stage": stage}) > before[stage]
+    assert _sample("ml_prediction_log10_count") == predictions_before + 1
+    assert "ml_stage_latency_seconds_bucket" in test_client.get("/metrics").text
@@ -0,0 +1,21 @@
+import asyncio
+
+import pytest
+
+from painting_estimation.benchmarks import load
+from painting_estimation.inference import serving
+from painting_estimation.settings import settings
+
+
+def test_load_steps_meet_slo(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "serving_model", settings.serving_model)
+    monkeypatch.setattr(serving, "CACHE", serving.CACHE)
+
+    results = asyncio.run(load.run_load(load.load_corpus(size=3), [1, 2], duration=0.3, model="dummy"))
+    assert [result["concurrency"] for result in results] == [1, 2]
+    assert all(result["requests"] > 0 and result["error_rate"] == 0 for result in results)
+    assert not load.check_slo(results[0], load.SLO(p99_ms=60_000))
+    assert load.check_slo(results[0], load.SLO(p95_ms=0, min_rps=1e9)) == [
+        f"p95 {results[0]['p95_ms']:.1f}ms > 0ms",
+        f"throughput {results[0]['rps']:.1f} rps < 1000000000.0 rps",
+    ]
@@ -0,0 +1,72 @@
+import os
+import pathlib
+
+import numpy as np
+import pytest
+
+from painting_estimation.inference.inference import ONNXModel, default_intra_op_threads
+from painting_estimation.inference.onnx_sessions import optimized_model_path, variant_path
+from painting_estimation.settings import settings
+
+
+def test_onnx_session_is_created_lazily() -> None:
+    model = ONNXModel("does-not-exist.onnx")
+    assert model.intra_op_num_threads == default_intra_op_threads()
+    with pytest.raises(Exception):
+        model.load()
+
+
+def test_intra_op_threads_are_split_between_workers() -> None:
+    assert default_intra_op_threads() == max(1, (os.cpu_count() or 1) // settings.api_workers)
+    assert ONNXModel("model.onnx", intra_op_num_threads=3).intra_op_num_threads == 3
+
+
+def test_model_variants_and_profiles() -> None:
+    model = ONNXModel("models/2/efn.onnx", profile="low_memory", variant="int8-static")
+    assert model.model_path == str(pathlib.Path("models/2/efn.int8-static.onnx"))
+    assert model.source_path == "models/2/efn.onnx"
+    assert model.intra_op_num_threads == 1
+    assert not model._session_options().enable_cpu_mem_arena
+
+    assert variant_path("efn.onnx", "fp32") == pathlib.Path("efn.onnx")
+    optimized_path = optimized_model_path("models/2/efn.onnx", "latency")
+    assert optimized_path.name.startswith("efn.") and optimized_path.name.endswith(".latency.optimized.onnx")
+    assert optimized_path != optimized_model_path("models/3/efn.onnx", "latency")
+
+
+def test_optimized_models_are_cached_outside_models(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    monkeypatch.setattr(settings, "onnx_cache_dir", None)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    optimized_path = optimized_model_path("models/2/efn.onnx", "latency")
+    assert optimized_path.parent == tmp_path / "painting_estimation" / "onnx"
+
+
+def test_shared_weights(tmp_path: pathlib.Path) -> None:
+    onnx = pytest.importorskip("onnx")
+    from painting_estimation.model.shared_weights import split_weights  # pylint: disable=import-outside-toplevel
+
+    weights = np.random.default_rng(0).random((32, 16), dtype=np.float32)
+    graph = onnx.helper.make_graph(
+        [onnx.helper.make_node("MatMul", ["input", "weights"], ["output"])],
+        "matmul",
+        [onnx.helper.make_tensor_value_info("input", onnx.TensorProto.FLOAT, ["N", 32])],
+        [onnx.helper.make_tensor_value_info("output", onnx.TensorProto.FLOAT, ["N", 16])],
+        [onnx.numpy_helper.from_array(weights, "weights")],
+    )
+    model_path = tmp_path / "model.onnx"
+    onnx.save(onnx.helper.make_model(graph, opset_imports=[onnx.helper.make_opsetid("", 13)], ir_version=8), model_path)
+    assert split_weights(model_path) == tmp_path / "model.shared.onnx"
+
+    nn_input = np.ones((2, 32), dtype=np.float32)
+    shared, embedded = ONNXModel(model_path, profile="latency"), ONNXModel(model_path, share_weights=False)
+    assert shared.shared_graph_path == tmp_path / "model.shared.onnx"
+    np.testing.assert_allclose(shared(nn_input), embedded(nn_input), rtol=1e-6)
+    # the session reads the mapped file, it doesn't copy the weights
+    (mapped,) = shared._shared_values
+    data_file = str(tmp_path / "model.shared.onnx.data")
+    mapped_ranges = [
+        [int(address, 16) for address in line.split()[0].split("-")]
+        for line in pathlib.Path("/proc/self/maps").read_text().splitlines()
+        if line.endswith(data_file)
+    ]
+    assert any(start <= mapped.data_ptr() < end for start, end in mapped_ranges)
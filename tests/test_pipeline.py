@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from painting_estimation.inference.inference import ModelServing, PipelineStage, StagedPipeline
+
+
+def test_pipeline_batches_stages_and_keeps_order() -> None:
+    batch_sizes: list[int] = []
+
+    def regress(items: list[int]) -> list[int]:
+        batch_sizes.append(len(items))
+        return [item * 10 for item in items]
+
+    stages = [
+        PipelineStage("double", lambda items: [item * 2 for item in items], workers=3),
+        PipelineStage("regress", regress, batch_size=16, max_wait_ms=50),
+    ]
+    with StagedPipeline(stages, buffer_size=4) as pipeline:
+        assert list(pipeline.map(range(100))) == [item * 20 for item in range(100)]
+    assert sum(batch_sizes) == 100
+    assert max(batch_sizes) > 1
+
+
+def test_pipeline_isolates_failing_items() -> None:
+    def check(items: list[int]) -> list[int]:
+        if 3 in items:
+            raise ValueError("bad item")
+        return items
+
+    with StagedPipeline([PipelineStage("check", check, batch_size=8, max_wait_ms=50)]) as pipeline:
+        futures = [pipeline.submit(item) for item in range(6)]
+        with pytest.raises(ValueError):
+            futures[3].result()
+        assert [future.result() for index, future in enumerate(futures) if index != 3] == [0, 1, 2, 4, 5]
+
+
+def test_serving_staged_pipeline_matches_direct_calls() -> None:
+    serving = ModelServing(
+        model=lambda nn_input: nn_input.reshape(nn_input.shape[0], -1),
+        preprocessor=lambda image: np.expand_dims(image.astype(np.float32), 0),
+        postprocessor=lambda nn_output: float(nn_output.sum()),
+        batch_postprocessor=lambda nn_output: nn_output.sum(axis=1),
+    )
+    images = [np.full((2, 2), i, np.uint8) for i in range(20)]
+    with serving.staged_pipeline(decode=np.asarray, model_batch_size=4) as pipeline:
+        assert list(pipeline.map(images)) == [serving(image) for image in images]
@@ -1,5 +1,6 @@
 from io import BytesIO
 
+import cv2
 import numpy as np
 
 from painting_estimation.images.preprocessing import ImagePreprocessor
@@ -14,3 +15,27 @@ def test_preproc(test_image: bytes) -> None:
     img_preproc = preproc(image)
     assert img_preproc.dtype == np.float32
     assert ImgSize(img_preproc.shape[2], img_preproc.shape[1]) == ImgSize(width=100, height=200)
+
+
+def test_preproc_batch(test_image: bytes) -> None:
+    preproc = ImagePreprocessor(
+        target_size=ImgSize(width=300, height=300),
+        target_dim_order=(2, 0, 1),
+        target_dtype=np.float32,
+        normalize=True,
+        means=(0.485, 0.456, 0.406),
+        stds=(0.229, 0.224, 0.225),
+        initial_size_before_crop=ImgSize(width=320, height=320),
+    )
+    image = cv2_image_from_byte_io(BytesIO(test_image))
+    batch = preproc([image, image])
+    assert batch.shape == (2, 3, 300, 300)
+    assert batch.flags.c_contiguous
+
+    expected = cv2.resize(image, dsize=(320, 320)).astype(np.float32)[10:310, 10:310] / 255.0
+    expected = ((expected - np.asarray(preproc.means)) / np.asarray(preproc.stds)).transpose(2, 0, 1)
+    assert np.allclose(batch[1], expected, atol=1e-5)
+
+    out = np.empty(preproc.output_shape(), dtype=np.float32)
+    assert preproc(image, out=out) is out
+    assert np.array_equal(out[0], batch[0])
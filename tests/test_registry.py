@@ -0,0 +1,44 @@
+import json
+import pathlib
+import time
+
+from painting_estimation.model.dummy_model import DUMMY_SERVING
+from painting_estimation.model.registry import REGISTRY, ModelRegistry
+
+
+def test_registry_loads_once(tmp_path: pathlib.Path) -> None:
+    loaded: list[pathlib.Path] = []
+
+    def loader(model_dir: pathlib.Path):
+        loaded.append(model_dir)
+        return DUMMY_SERVING
+
+    registry = ModelRegistry(models_dir=tmp_path)
+    registry.register("dummy", loader, version=1)
+    assert registry.get("dummy") is registry.get("dummy", 1)
+    assert loaded == [tmp_path / "1"]
+
+    registry.activate("dummy", 2)
+    assert registry.active_version("dummy") == 2
+    assert registry.loaded_versions("dummy") == [1, 2]
+    assert loaded == [tmp_path / "1", tmp_path / "2"]
+
+
+def test_registry_hot_swap_from_file(tmp_path: pathlib.Path) -> None:
+    active_models_file = tmp_path / "active.json"
+    registry = ModelRegistry(models_dir=tmp_path, active_models_file=active_models_file, refresh_interval=0)
+    registry.register("dummy", lambda _: DUMMY_SERVING, version=1)
+    assert registry.active_version("dummy") == 1
+
+    active_models_file.write_text(json.dumps({"dummy": 3}))
+    registry.active_version("dummy")
+    for _ in range(100):
+        if registry.active_version("dummy") == 3:
+            break
+        time.sleep(0.01)
+    assert registry.active_version("dummy") == 3
+
+
+def test_default_registry() -> None:
+    assert {"dummy", "inception", "effnet", "effnet_b3"} <= set(REGISTRY.names)
+    assert REGISTRY.get("dummy") is DUMMY_SERVING
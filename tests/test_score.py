@@ -0,0 +1,72 @@
+import json
+import pathlib
+import shutil
+
+import pytest
+
+from painting_estimation.images.utils import decode_image
+from painting_estimation.model.registry import REGISTRY
+from painting_estimation.score import Checkpoint, ResultWriter, list_images, score
+from painting_estimation.settings import settings
+
+
+def _score(source: pathlib.Path, output: pathlib.Path, version: int | None = None, model_name: str = "dummy") -> int:
+    writer = ResultWriter(output)
+    checkpoint = Checkpoint(output.with_name(f"{output.name}.checkpoint"))
+    try:
+        return score(
+            list_images(source), writer, checkpoint, model_name=model_name, version=version, batch_size=2, workers=1
+        )
+    finally:
+        writer.close()
+        checkpoint.close()
+
+
+def test_score_directory_resumes(tmp_path: pathlib.Path) -> None:
+    fixture = pathlib.Path(__file__).parent / "fixtures" / "test_image.png"
+    images_dir = tmp_path / "images"
+    (images_dir / "nested").mkdir(parents=True)
+    for name in ("a.png", "b.png", "nested/c.png"):
+        shutil.copy(fixture, images_dir / name)
+    (images_dir / "broken.jpg").write_bytes(b"not an image")
+    output = tmp_path / "prices.jsonl"
+
+    assert _score(images_dir, output) == 4
+    records = {record["path"]: record for record in map(json.loads, output.read_text().splitlines())}
+    assert len(records) == 4
+    assert records[str(images_dir / "broken.jpg")]["error"]
+    assert records[str(images_dir / "nested" / "c.png")]["price"] > 0
+
+    shutil.copy(fixture, images_dir / "d.png")
+    assert _score(images_dir, output) == 1
+    assert len(output.read_text().splitlines()) == 5
+
+    # another version would mix its prices with the stored ones
+    with pytest.raises(ValueError, match="`dummy` version 0"):
+        _score(images_dir, output, version=2)
+    assert len(output.read_text().splitlines()) == 5
+
+
+def test_manifest(tmp_path: pathlib.Path) -> None:
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# catalogue\na.jpg\n\nsub/b.png\n")
+    assert list_images(manifest) == [tmp_path / "a.jpg", tmp_path / "sub" / "b.png"]
+
+
+def test_score_staged_pipeline_matches_serving(tmp_path: pathlib.Path) -> None:
+    fixture = pathlib.Path(__file__).parent / "fixtures" / "test_image.png"
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    for name in ("a.png", "b.png", "c.png"):
+        shutil.copy(fixture, images_dir / name)
+    (images_dir / "broken.jpg").write_bytes(b"not an image")
+    output = tmp_path / "prices.jsonl"
+
+    assert _score(images_dir, output, model_name="effnet") == 4
+    records = {record["path"]: record for record in map(json.loads, output.read_text().splitlines())}
+    assert records[str(images_dir / "broken.jpg")]["error"]
+
+    serving = REGISTRY.get("effnet")
+    image = decode_image(fixture.read_bytes(), min_size=serving.input_size if settings.draft_decoding else None)
+    for name in ("a.png", "b.png", "c.png"):
+        assert records[str(images_dir / name)]["price"] == pytest.approx(serving(image.array), rel=1e-5)
@@ -1,8 +1,15 @@
 from io import BytesIO
 
-
-from painting_estimation.inference.serving import predict_painting_price
+from painting_estimation.images.utils import decode_image
+from painting_estimation.inference.serving import predict_painting, predict_painting_price
 
 
 def test_predict(test_image: bytes) -> None:
     assert isinstance(predict_painting_price(BytesIO(test_image)), float)
+
+
+def test_predict_with_features(test_image: bytes) -> None:
+    prediction = predict_painting(BytesIO(test_image))
+    features = decode_image(test_image).features
+    assert prediction.aspect == features["aspect"]
+    assert prediction.mean_pixel == features["mean_pixel"]
@@ -0,0 +1,62 @@
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from painting_estimation.api.main import APP
+from painting_estimation.inference.serving import MODELS_READY, warm_up
+
+
+# seconds for a cold import in a fresh interpreter, generous enough for a loaded CI runner
+IMPORT_TIME_BUDGET: dict[str, float] = {
+    "painting_estimation.api.main": 3.0,
+    "painting_estimation.bot.main": 2.0,
+}
+# modules which shouldn't be imported before they are needed
+DEFERRED_MODULES: dict[str, list[str]] = {
+    "painting_estimation.api.main": ["lightgbm", "sklearn"],
+    "painting_estimation.bot.main": ["numpy", "cv2", "PIL"],
+}
+
+IMPORT_SCRIPT = """
+import json, sys, time
+started_at = time.perf_counter()
+import {module}
+import_time = time.perf_counter() - started_at
+registry = sys.modules.get("painting_estimation.model.registry")
+print(json.dumps({{
+    "import_time": import_time,
+    "modules": sorted(sys.modules),
+    "loaded_models": [name for name in registry.REGISTRY.names if registry.REGISTRY.loaded_versions(name)]
+    if registry else [],
+}}))
+"""
+
+
+@pytest.mark.parametrize("module", list(IMPORT_TIME_BUDGET))
+def test_import_time_budget(module: str) -> None:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT.format(module=module)], check=True, capture_output=True, text=True
+    ).stdout
+    result = json.loads(output.splitlines()[-1])
+
+    assert result["import_time"] < IMPORT_TIME_BUDGET[module]
+    assert not set(DEFERRED_MODULES[module]) & set(result["modules"])
+    assert result["loaded_models"] == []
+
+
+def test_ready_after_warm_up() -> None:
+    with TestClient(APP) as test_client:
+        # warm-up runs in the background after startup
+        deadline = time.monotonic() + 30
+        while test_client.get("/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert test_client.get("/ready").json()["ready"]
+
+        MODELS_READY.clear()
+        assert test_client.get("/ready").status_code == 503
+        warm_up()
+        assert test_client.get("/ready").status_code == 200
@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+
+from painting_estimation.bot.style_transfer import StyleTransferClient, base64_encode
+
+
+URL = "http://style-transfer/api/predict"
+
+
+def _run(handler, **kwargs) -> tuple[list[bytes | None], StyleTransferClient]:
+    async def run() -> tuple[list[bytes | None], StyleTransferClient]:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            style_transfer = StyleTransferClient(client, URL, backoff=0, **kwargs)
+            results = await asyncio.gather(*(style_transfer(b"content", b"style", 1.0) for _ in range(4)))
+            return list(results), style_transfer
+
+    return asyncio.run(run())
+
+
+def test_retries_with_backoff() -> None:
+    calls: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) % 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"data": [base64_encode(b"styled")]})
+
+    results, _ = _run(handler, retries=1, max_concurrency=1)
+    assert results == [b"styled"] * 4
+    assert len(calls) == 8
+
+
+def test_gives_up_after_retries() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("refused", request=request)
+
+    results, _ = _run(handler, retries=2)
+    assert results == [None] * 4
+
+
+def test_bounded_concurrency() -> None:
+    in_flight: list[int] = [0, 0]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        return httpx.Response(200, json={"data": [request.read().decode().split('"')[3]]})
+
+    results, _ = _run(handler, max_concurrency=2)
+    assert results == [b"content"] * 4
+    assert in_flight[1] == 2